@@ -9,10 +9,143 @@ import os
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                                QHBoxLayout, QTreeView, QListView, QSplitter, 
                                QFileSystemModel, QLabel, QToolBar, 
-                               QStatusBar, QMenu, QMessageBox, QInputDialog)
-from PySide6.QtCore import Qt, QDir, QModelIndex
-from PySide6.QtGui import QIcon, QFont, QPixmap, QAction
+                               QStatusBar, QMenu, QMessageBox, QInputDialog, QLineEdit)
+from PySide6.QtCore import Qt, QDir, QModelIndex, QThread, Signal, QSortFilterProxyModel
+from PySide6.QtGui import QIcon, QFont, QPixmap, QAction, QColor
 from parameter_table import ParameterTable
+from scan_index import entry_file_info, scan_entries
+from tag_index import parse_query
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+class FileInfoWorker(QThread):
+    """
+    フォルダをbackgroundでscandirし、ファイル数とサイズを数える。
+    結果(files, dirs)はscan indexのentryにもするので、GUIのthreadではscandirしない
+    """
+    # sizeとmtimeは32bitのintを超えるのでobjectで渡す
+    counting = Signal(str, int, int, object)  # path, dirs, files, size（途中）
+    counted = Signal(str, object, object, object)  # path, mtime, files, dirs（scan_entriesの結果）
+    
+    PROGRESS_EVERY = 1000  # この数ごとに途中の数を出す
+    
+    def setup(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.cancelled = False
+    
+    def cancel(self):
+        self.cancelled = True
+    
+    def progress(self, dir_count, file_count, total_size):
+        if self.cancelled:
+            raise ScanCancelled()
+        self.counting.emit(self.path, dir_count, file_count, total_size)
+    
+    def run(self):
+        try:
+            files, dirs = scan_entries(self.path, self.progress, self.PROGRESS_EVERY)
+        except (OSError, ScanCancelled):
+            return
+        self.counted.emit(self.path, self.mtime, files, dirs)
+
+
+class TagTreeProxy(QSortFilterProxyModel):
+    """
+    ツリー用のproxy。
+    - tag rootが決まったら、rootの親の下はrootだけを表示する（rootの外のフォルダを読まない）
+    - tag filter: root以下は、一致したフォルダとその親、一致したフォルダのファイルだけ表示する
+    - tagの状態（jsonあり: 太字、.no: 灰色）を表示する。状態はscan indexからつくったcacheで、描画ではstatしない
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root = None  # tag root（normcaseした絶対パス）
+        self.matched = set()  # 一致したフォルダ（normcaseした絶対パス）
+        self.visible = None  # 表示するフォルダ。Noneなら絞らない
+        self.status = {}  # フォルダ: (has_json, has_no)。jsonか.noがあるフォルダだけ
+        self.bold_font = QFont()
+        self.bold_font.setBold(True)
+    
+    def norm(self, path):
+        return os.path.normcase(os.path.abspath(path))
+    
+    def set_root(self, root_path):
+        self.root = self.norm(root_path)
+        self.visible = None
+        self.invalidateFilter()
+    
+    def set_filter(self, relpaths):
+        """一致したフォルダのrelpath。Noneなら絞らない"""
+        if relpaths is None or self.root is None:
+            self.visible = None
+        else:
+            self.matched = {os.path.normpath(os.path.join(self.root, os.path.normcase(rr))) for rr in relpaths}
+            self.visible = set()
+            for path in self.matched:
+                while path not in self.visible and path.startswith(self.root):
+                    self.visible.add(path)
+                    path = os.path.dirname(path)
+        self.invalidateFilter()
+    
+    def set_status(self, root_path, dirs):
+        """scan indexのdirs（relpath: entry）から状態のcacheをつくり直す"""
+        root = self.norm(root_path)
+        self.status = {}
+        for relpath, entry in dirs.items():
+            if entry["has_json"] or entry["has_no"]:
+                self.status[os.path.normpath(os.path.join(root, os.path.normcase(relpath)))] = (entry["has_json"], entry["has_no"])
+        self.emit_status_changed()
+    
+    def update_status(self, path, entry):
+        """1つのフォルダの状態を更新する"""
+        path = self.norm(path)
+        if entry is not None and (entry["has_json"] or entry["has_no"]):
+            self.status[path] = (entry["has_json"], entry["has_no"])
+        else:
+            self.status.pop(path, None)
+        index = self.mapFromSource(self.sourceModel().index(path))
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+    
+    def emit_status_changed(self):
+        """表示中の全体を描き直す"""
+        self.layoutChanged.emit()
+    
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.root is None or self.root == os.path.dirname(self.root):
+            return True
+        model = self.sourceModel()
+        index = model.index(source_row, 0, source_parent)
+        path = self.norm(model.filePath(index))
+        if os.path.dirname(path) == os.path.dirname(self.root) and path != self.root:  # rootの兄弟は表示しない
+            return False
+        if path.startswith(os.path.join(self.root, "")) and is_run_output(os.path.basename(path)):  # 実行のcacheとmanifestは表示しない
+            return False
+        if self.visible is None or not path.startswith(os.path.join(self.root, "")):
+            return True
+        if model.isDir(index):
+            return path in self.visible
+        return os.path.dirname(path) in self.matched
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if index.column() == 0 and role in (Qt.FontRole, Qt.ForegroundRole, Qt.ToolTipRole) and len(self.status) > 0:
+            status = self.status.get(self.norm(self.sourceModel().filePath(self.mapToSource(index))))
+            if status is not None:
+                has_json, has_no = status
+                if role == Qt.FontRole and has_json:
+                    return self.bold_font
+                if role == Qt.ForegroundRole and has_no:
+                    return QColor(Qt.gray)
+                if role == Qt.ToolTipRole:
+                    return ", ".join(tt for tt, ok in (("tag JSON", has_json), ("no-analysis", has_no)) if ok)
+        return super().data(index, role)
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        """QFileSystemModelのsort（フォルダが先）をそのまま使う"""
+        self.sourceModel().sort(column, order)
 
 
 class TagEditor(QMainWindow):
@@ -22,13 +155,22 @@ class TagEditor(QMainWindow):
         self.setGeometry(100, 100, 1200, 800)
         
         # ファイルシステムモデルの初期化
+        # 子フォルダはQFileSystemModelがbackgroundのthreadで、開いたときに読む。
+        # 監視するのはrootPathの下だけなので、tag rootが決まったらrootPathをtag rootにする
         self.file_model = QFileSystemModel()
-        self.file_model.setRootPath(QDir.rootPath())
+        self.file_model.setOption(QFileSystemModel.DontUseCustomDirectoryIcons)  # フォルダごとのicon（desktop.ini）を読まない
+        self.file_model.setResolveSymlinks(False)
+        self.file_model.setRootPath(QDir.currentPath())
         
         # フォルダ履歴の管理
         self.history = []  # 履歴リスト
         self.history_index = -1  # 現在の履歴位置
         
+        # ステータスバーのフォルダ情報
+        self.file_info_path = ""
+        self.file_info_cache = {}  # path: (mtime, dirs, files, size)
+        self.file_info_workers = []  # 実行中のFileInfoWorker
+        
         # UIの初期化
         self.init_ui()
         self.setup_connections()
@@ -57,13 +199,16 @@ class TagEditor(QMainWindow):
         
         # 左側のツリービュー（フォルダツリー）
         self.tree_view = QTreeView()
-        self.tree_view.setModel(self.file_model)
-        self.tree_view.setRootIndex(self.file_model.index(QDir.rootPath()))
+        self.tree_proxy = TagTreeProxy(self)  # tag rootとtag filterで絞り、tagの状態を表示する
+        self.tree_proxy.setSourceModel(self.file_model)
+        self.tree_view.setModel(self.tree_proxy)
+        self.tree_view.setRootIndex(self.tree_proxy.mapFromSource(self.file_model.index(QDir.rootPath())))
         self.tree_view.setAnimated(False)
         self.tree_view.setIndentation(20)
         self.tree_view.setSortingEnabled(True)
         self.tree_view.sortByColumn(0, Qt.AscendingOrder)
         self.tree_view.setColumnWidth(0, 250)
+        self.tree_view.setSelectionMode(QTreeView.ExtendedSelection) #bulk edit用に複数選択できる
         self.splitter.addWidget(self.tree_view)
         
         # 右側のツリービュー（ファイル一覧 - 詳細表示）
@@ -133,10 +278,19 @@ class TagEditor(QMainWindow):
         self.toolbar.addAction(new_folder_action)
         
         self.toolbar.addSeparator()
+        
+        # tag filter（tag indexで一致するフォルダだけツリーに表示）
+        self.tag_filter_edit = QLineEdit()
+        self.tag_filter_edit.setPlaceholderText("tag filter: tagA=2;tagB=a|b")
+        self.tag_filter_edit.setToolTip("tagが一致するフォルダだけツリーに表示する。空にしてEnterで解除")
+        self.tag_filter_edit.returnPressed.connect(self.apply_tag_filter)
+        self.toolbar.addWidget(self.tag_filter_edit)
            
     def setup_connections(self):
         # ツリービューの選択変更
         self.tree_view.selectionModel().currentChanged.connect(self.on_tree_selection_changed)
+        self.tree_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tree_view.customContextMenuRequested.connect(self.show_tree_context_menu)
         
         # リストビューのダブルクリック
         self.list_view.doubleClicked.connect(self.on_list_double_clicked)
@@ -144,6 +298,10 @@ class TagEditor(QMainWindow):
         # コンテキストメニュー
         self.list_view.setContextMenuPolicy(Qt.CustomContextMenu)
         self.list_view.customContextMenuRequested.connect(self.show_context_menu)
+        
+        # tag rootとjsonの変更
+        self.parameter_table.root_changed.connect(self.on_root_changed)
+        self.parameter_table.tags_changed.connect(self.on_tags_changed)
     
     def set_initial_directory(self):
         # 現在のディレクトリを初期ディレクトリとして設定
@@ -172,12 +330,13 @@ class TagEditor(QMainWindow):
                     self.history_index = len(self.history) - 1
             
             self.list_view.setRootIndex(index)
-            self.tree_view.setCurrentIndex(index)
+            self.tree_view.setCurrentIndex(self.tree_proxy.mapFromSource(index))
             self.update_file_info()
             
             # パラメータテーブルが開いている場合は更新
             if self.parameter_table and self.parameter_table.isVisible():
                 self.parameter_table.update_path(normalized_path)
+                self.update_tag_status(normalized_path)
             
             # 戻る/進むボタンの有効/無効を更新
             self.update_navigation_buttons()
@@ -185,7 +344,7 @@ class TagEditor(QMainWindow):
     def on_tree_selection_changed(self, current, previous):
         """ツリービューの選択が変更されたとき"""
         if current.isValid():
-            path = self.file_model.filePath(current)
+            path = self.file_model.filePath(self.tree_proxy.mapToSource(current))
             if os.path.isdir(path):
                 # 履歴に追加して移動
                 self.navigate_to_path(path)
@@ -339,6 +498,73 @@ class TagEditor(QMainWindow):
             
             menu.exec_(self.list_view.mapToGlobal(position))
     
+    def show_tree_context_menu(self, position):
+        """ツリーのコンテキストメニュー。選択したフォルダのtagをまとめて変更する"""
+        folders = []
+        for index in self.tree_view.selectionModel().selectedRows(0):
+            path = self.file_model.filePath(self.tree_proxy.mapToSource(index))
+            if os.path.isdir(path):
+                folders.append(path)
+        if len(folders) == 0:
+            return
+        menu = QMenu()
+        bulk_action = menu.addAction(f"bulk tag edit ({len(folders)} folders)")
+        bulk_action.triggered.connect(lambda: self.parameter_table.bulk_edit_tags(folders))
+        menu.exec_(self.tree_view.viewport().mapToGlobal(position))
+    
+    def on_root_changed(self, root_path):
+        """ツリーとQFileSystemModelの監視をtag rootに絞る"""
+        if root_path == "":
+            return
+        self.file_model.setRootPath(root_path)
+        self.tree_proxy.set_root(root_path)
+        self.tree_view.setRootIndex(self.tree_proxy.mapFromSource(self.file_model.index(os.path.dirname(root_path))))
+        self.tree_view.setCurrentIndex(self.tree_proxy.mapFromSource(self.list_view.rootIndex()))
+        self.tag_filter_edit.clear()
+        self.on_tags_changed([])
+    
+    def on_tags_changed(self, paths):
+        """jsonか.noを書いたフォルダの状態を更新する。空のときはscan indexから全部つくり直す"""
+        index = self.parameter_table.get_scan_index()
+        if index is None:
+            self.tree_proxy.set_status(self.parameter_table.root_path, {})
+        elif len(paths) == 0:
+            self.tree_proxy.set_status(index.root_path, index.dirs)
+        else:
+            for path in paths:
+                self.tree_proxy.update_status(path, index.entry(path, refresh=True))
+    
+    def update_tag_status(self, path):
+        """
+        移動したフォルダの状態。scan indexにあるentryを使い、statしない。
+        mtimeが変わったフォルダは、FileInfoWorkerがscandirしたあとでon_file_info_countedが更新する
+        """
+        index = self.parameter_table.get_scan_index()
+        if index is not None:
+            self.tree_proxy.update_status(path, index.entry(path, refresh=False))
+    
+    def apply_tag_filter(self):
+        """tag indexを更新して、条件に一致するフォルダだけツリーに表示する"""
+        text = self.tag_filter_edit.text().strip()
+        if text == "":
+            self.tree_proxy.set_filter(None)
+            self.status_bar.showMessage("tag filter is cleared.")
+            return
+        try:
+            query = parse_query(text)
+            index = self.parameter_table.get_tag_index(refresh=True)
+        except Exception as e:
+            QMessageBox.warning(self, "tag filter", str(e))
+            return
+        if index is None:
+            QMessageBox.warning(self, "tag filter", "set root path and JSON.")
+            return
+        relpaths = index.query(query)
+        self.on_tags_changed([])  # scan indexも更新したので、状態もつくり直す
+        self.tree_proxy.set_filter(relpaths)
+        self.parameter_table.set_tag_query_text(text)
+        self.status_bar.showMessage(f"tag filter: {len(relpaths)} folders")
+    
     def delete_item(self, path):
         """アイテムを削除"""
         reply = QMessageBox.question(self, "確認", 
@@ -357,30 +583,58 @@ class TagEditor(QMainWindow):
                 QMessageBox.warning(self, "エラー", f"削除に失敗しました: {str(e)}")
     
     def update_file_info(self):
-        """ファイル情報を更新"""
+        """ファイル情報を更新。数えるのはbackgroundのthreadで行い、途中の数も表示する"""
         current_index = self.list_view.rootIndex()
         if current_index.isValid():
             path = self.file_model.filePath(current_index)
+            self.file_info_path = path
+            # 前のフォルダの集計は中止
+            for worker in self.file_info_workers:
+                worker.cancel()
             try:
-                # ファイル数をカウント
-                file_count = 0
-                dir_count = 0
-                total_size = 0
+                mtime = os.stat(path).st_mtime_ns
                 
-                for item in os.listdir(path):
-                    item_path = os.path.join(path, item)
-                    if os.path.isfile(item_path):
-                        file_count += 1
-                        total_size += os.path.getsize(item_path)
-                    elif os.path.isdir(item_path):
-                        dir_count += 1
+                # フォルダのmtimeが同じなら、前回の結果かscan indexを使う
+                cached = self.file_info_cache.get(path)
+                if cached is not None and cached[0] == mtime:
+                    self.show_file_info(path, *cached[1:])
+                    return
+                index = self.parameter_table.get_scan_index()
+                entry = index.entry(path, refresh=False) if index is not None else None
+                if entry is not None and entry["mtime"] == mtime:
+                    self.file_info_cache[path] = (mtime,) + entry_file_info(entry)
+                    self.show_file_info(path, *entry_file_info(entry))
+                    return
                 
-                # サイズを読みやすい形式に変換
-                size_str = self.format_size(total_size)
-                self.file_info_label.setText(f"dirs: {dir_count}, files: {file_count}, size: {size_str}")
+                worker = FileInfoWorker()
+                worker.setup(path, mtime)
+                worker.counting.connect(self.show_file_info)
+                worker.counted.connect(self.on_file_info_counted)
+                worker.finished.connect(lambda w=worker: self.file_info_workers.remove(w))
+                self.file_info_workers.append(worker) #実行中にdeleteされないように持っておく
+                self.file_info_label.setText("counting...")
+                worker.start()
             except Exception:
                 self.file_info_label.setText("")
     
+    def on_file_info_counted(self, path, mtime, files, dirs):
+        """集計が終わったフォルダの結果をcacheする。rootの下ならscan indexのentryにして、ツリーの状態も更新する"""
+        info = (len(dirs), len(files), sum(ff[1] for ff in files))
+        self.file_info_cache[path] = (mtime,) + info
+        self.show_file_info(path, *info)
+        index = self.parameter_table.get_scan_index()
+        entry = index.set_entry(path, mtime, files, dirs) if index is not None else None
+        if entry is not None:
+            self.tree_proxy.update_status(path, entry)
+    
+    def show_file_info(self, path, dir_count, file_count, total_size):
+        """今のフォルダの結果だけ表示（移動前のフォルダの結果は捨てる）"""
+        if path != self.file_info_path:
+            return
+        # サイズを読みやすい形式に変換
+        size_str = self.format_size(total_size)
+        self.file_info_label.setText(f"dirs: {dir_count}, files: {file_count}, size: {size_str}")
+    
     def format_size(self, size_bytes):
         """バイトサイズを読みやすい形式に変換"""
         if size_bytes == 0:
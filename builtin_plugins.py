@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+EDTAに組み込みのextractor(plugin)。sub *.pyの代わりに"builtin:名前"を指定すると、
+pythonを起動せずに、このプロセス(workers>1のときはprocess pool)でフォルダごとに呼ぶ。
+出力はstdoutの文字列ではなく、型のついた値の行(tuple)のままwriterに渡す。
+
+pluginはregister_pluginで登録するgenerator関数 plugin(fullpath,relpath,**params)。
+最初にヘッダー(列名のtuple)を1つyieldし、そのあと1行ずつ値のtupleをyieldする。
+paramsは"builtin:csv_column?col=1&start=2&end=30"のように指定する(数値はintかfloatになる)。
+csvはmmapで必要な行だけ読む(line_reader.py)。index_dir=フォルダ を指定すると、行のoffsetのindexを保存して使う。
+worker processでimportされるので、このモジュールではPySide6をimportしないこと。
+"""
+
+import os
+import glob
+import time
+import pickle
+import hashlib
+from urllib.parse import parse_qsl
+
+import condition_parser as condition_parser_module
+import line_reader as line_reader_module
+from condition_parser import ConditionParser, DEFAULT_CONDITIONS
+from line_reader import LineReader
+from run_trace import profile_call
+
+BUILTIN_PREFIX="builtin:"
+
+PLUGINS=dict() #名前: (関数, 説明)
+
+_condition_parser=None #ファイル名の条件。processごとに1つ
+
+
+def register_plugin(name, description=""):
+    """pluginを登録するdecorator"""
+    def deco(func):
+        PLUGINS[name]=(func, description)
+        return func
+    return deco
+
+def is_builtin(sub_py_filename):
+    return sub_py_filename.startswith(BUILTIN_PREFIX)
+
+def plugin_names():
+    return list(PLUGINS.keys())
+
+def parse_plugin_spec(sub_py_filename):
+    """"builtin:名前?key=value&..."を(名前, params)にする。登録されていない名前はValueError"""
+    name, _, query=sub_py_filename[len(BUILTIN_PREFIX):].partition("?")
+    if name not in PLUGINS:
+        raise ValueError("unknown builtin plugin: "+name)
+    params=dict()
+    for key,value in parse_qsl(query):
+        params[key]=to_number(value)
+    return name, params
+
+def to_number(value):
+    for conv in (int, float):
+        try:
+            return conv(value)
+        except ValueError:
+            pass
+    return value
+
+def plugin_hash(sub_py_filename):
+    """
+    差分実行(manifest)用のhash。pluginの指定と、このモジュールと出力を変えるモジュール
+    (condition_parser.py, line_reader.py)のソースが同じなら同じ
+    """
+    h=hashlib.md5(sub_py_filename.encode('utf-8'))
+    for module in (__file__, condition_parser_module.__file__, line_reader_module.__file__):
+        with open(module, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def iter_plugin(sub_py_filename, tpath, relpath):
+    """pluginの行(最初はヘッダー)をyieldする"""
+    name, params=parse_plugin_spec(sub_py_filename)
+    yield from PLUGINS[name][0](tpath, relpath, **params)
+
+def run_plugin(sub_py_filename, tpath, relpath, spool_path, profile_path=None):
+    """
+    pluginの行をspool_pathにpickleで1行ずつ書く(文字列にしない)。worker(thread/process)で実行する。
+    かかった秒数を返す。profile_pathを渡すと、cProfileの結果をそこに書く。
+    """
+    if profile_path!=None:
+        return profile_call(profile_path, run_plugin, sub_py_filename, tpath, relpath, spool_path)
+    t0=time.perf_counter()
+    with open(spool_path, 'wb') as f:
+        for row in iter_plugin(sub_py_filename, tpath, relpath):
+            pickle.dump(row, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return time.perf_counter()-t0
+
+def read_row_spool(spool_path):
+    """run_pluginのspoolの行を1行ずつyieldする"""
+    with open(spool_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+############
+# plugins
+############
+
+def condition_parser():
+    global _condition_parser
+    if _condition_parser==None:
+        _condition_parser=ConditionParser(DEFAULT_CONDITIONS)
+    return _condition_parser
+
+def read_cells(fullpath, col, start, end, index_dir=None):
+    """
+    csvのstart..end-1行のcol列のセル(文字列)のリスト。列がない行は入らない。
+    ファイルはmmapで開き、end行より後は読まない。index_dirを指定すると行のoffsetのindexを保存する。
+    """
+    cells=[]
+    with LineReader(fullpath, index_dir or None) as lr:
+        for line in lr.lines(start, end):
+            cols=line.split(",", col+1)
+            if len(cols)>col:
+                cells.append(cols[col])
+    return cells
+
+def numeric_cells(cells):
+    """数値にできるセルだけを、元の文字列のまま(前後の空白は除く)返す。"1"は"1.0"にしない"""
+    ret=[]
+    for cc in cells:
+        cc=cc.strip()
+        try:
+            float(cc)
+        except ValueError:
+            continue
+        ret.append(cc)
+    return ret
+
+def read_column(fullpath, col, start, end, index_dir=None):
+    """csvのstart..end-1行のcol列の数値をfloat64の配列で返す。数値でないセルは除く"""
+    import numpy as np
+    cells=read_cells(fullpath, col, start, end, index_dir)
+    try:
+        return np.asarray(cells, dtype=np.float64) #まとめて変換できるときは速い
+    except ValueError:
+        vals=np.asarray([to_number(cc.strip()) for cc in cells], dtype=object)
+        return np.asarray([vv for vv in vals if isinstance(vv, (int, float))], dtype=np.float64)
+
+def iter_folder_files(tpath, ext):
+    files=sorted(glob.glob(os.path.join(tpath, "*."+ext))) #行の順をファイルシステムによらない順にする
+    parser=condition_parser()
+    for file in files:
+        ff=os.path.basename(file)
+        yield file, (ff,)+tuple(parser.parse(ff)[nn] for nn in parser.names)
+
+@register_plugin("csv_column", "csvの1列の行範囲を1ファイル1行に並べる(sub_print_csv.pyと同じ)")
+def csv_column(tpath, relpath, col=1, start=2, end=30, ext="csv", index_dir=None):
+    """
+    列名(条件の前の" "と最後の空の列)と値の文字列は、sub_print_csv.pyの出力と同じ。
+    値はfloatにしないで、csvのセルの文字列のまま渡す(1は1.0にならない)。型はまとめファイルのwriterが列ごとに決める
+    """
+    first=True
+    for file,cond in iter_folder_files(tpath, ext):
+        vals=numeric_cells(read_cells(file, col, start, end, index_dir))
+        if first: #列名は最初のファイルの値の数
+            yield ("file",)+tuple(" "+nn for nn in condition_parser().names)+tuple(str(ii) for ii in range(len(vals)))+("",)
+            first=False
+        yield cond+tuple(vals)+("",)
+
+@register_plugin("csv_stats", "csvの1列の行範囲の mean, std, min, max, uniformity((max-min)/(max+min)) を1ファイル1行に")
+def csv_stats(tpath, relpath, col=1, start=2, end=30, ext="csv", index_dir=None):
+    first=True
+    for file,cond in iter_folder_files(tpath, ext):
+        if first:
+            yield ("file",)+tuple(condition_parser().names)+("mean", "std", "min", "max", "uniformity")
+            first=False
+        vals=read_column(file, col, start, end, index_dir)
+        if len(vals)==0:
+            yield cond+(None,)*5
+            continue
+        vmax, vmin=float(vals.max()), float(vals.min())
+        uniformity=(vmax-vmin)/(vmax+vmin) if vmax+vmin!=0 else None
+        yield cond+(float(vals.mean()), float(vals.std()), vmin, vmax, uniformity)
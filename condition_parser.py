@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+ファイル名から実験条件("100pa 50w.csv"の圧力や電力など)を取り出すparser。
+名前つきのpatternを1つの正規表現にまとめてcompileし、ファイル名を1回だけscanする。
+まとめると意味が変わるpattern(後方参照"\\1"や、全体にかかるflag"(?i)")は、別々にcompileしてsearchする。
+値はint/floatなどの型にして返し、ファイル名ごとに結果を覚えておく。
+sub *.pyからもEDTAからも使える(PySide6はimportしない)。
+
+    parser=ConditionParser(DEFAULT_CONDITIONS)
+    parser.parse("100pa 50w.csv") #-> {"pa":100, "W":50}
+"""
+
+import re
+import json
+from functools import lru_cache
+
+## 条件の設定。name:値の名前, pattern:正規表現(最初のgroupが値。groupがなければ一致した全体), type:"int","float","str", unit:単位
+DEFAULT_CONDITIONS=[
+    {"name":"pa", "pattern":r"(\d+)\s*[pP]a", "type":"int", "unit":"Pa"},
+    {"name":"W", "pattern":r"(\d+)\s*[wW]", "type":"int", "unit":"W"},
+    #{"name":"temp", "pattern":r"(\d+(?:\.\d+)?)\s*[cC](?![a-zA-Z])", "type":"float", "unit":"degC"},
+    #{"name":"gas", "pattern":r"(?<![a-zA-Z])(Ar|N2|O2|H2)(?![a-zA-Z])", "type":"str", "unit":""},
+    #{"name":"sample", "pattern":r"[sS]#?(\d+)", "type":"str", "unit":""},
+]
+
+CONVERTERS={"int":int, "float":float, "str":str}
+
+BACKREF=re.compile(r"\\[1-9]|\(\?P=") #番号か名前の後方参照
+
+
+def load_conditions(path):
+    """条件の設定をjson(DEFAULT_CONDITIONSと同じ形のリスト)から読む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_separate(pattern):
+    """
+    1つの正規表現にまとめられないpatternならTrue。
+    後方参照はまとめるとgroupの番号がずれ、"(?i)"のようなflagは全体の先頭にしか書けない
+    """
+    return bool(pattern.flags& ~re.UNICODE) or BACKREF.search(pattern.pattern)!=None
+
+
+class ConditionParser:
+    def __init__(self, conditions=DEFAULT_CONDITIONS, cache_size=1<<16):
+        """
+        conditionsの順に1つの正規表現にまとめる。同じ位置で複数のpatternが一致するときは先のpatternになる。
+        まとめられないpattern(is_separate)は、まとめたあとで別々にsearchする(ほかのpatternの一致と重なってもよい)。
+        cache_size:結果を覚えるファイル名の数
+        """
+        self.names=[]
+        self.units=dict()
+        self._groups=dict() #まとめた正規表現の外側のgroup番号: (name, 値のgroup番号, 変換関数)
+        specs=[] #(name, compileしたpattern, 変換関数)
+        for cc in conditions:
+            name=cc["name"]
+            pattern=re.compile(cc["pattern"]) #ここでpatternの誤りがわかる
+            specs.append((name, pattern, CONVERTERS[cc.get("type", "str")]))
+            self.names.append(name)
+            self.units[name]=cc.get("unit", "")
+        self._separate=[ss for ss in specs if is_separate(ss[1])] #まとめないpattern
+        parts=[]
+        index=1
+        for name, pattern, conv in specs:
+            if is_separate(pattern):
+                continue
+            self._groups[index]=(name, index+1 if pattern.groups>0 else index, conv)
+            parts.append("("+pattern.pattern+")")
+            index+=pattern.groups+1
+        try:
+            self.regex=re.compile("|".join(parts)) if len(parts)>0 else None
+        except re.error: #patternどうしでgroupの名前が重なるなど。すべて別々にする
+            self.regex=None
+            self._groups=dict()
+            self._separate=specs
+        self.parse=lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, filename):
+        """
+        filenameの条件を{name:値}で返す。見つからない条件はNone。変換できない値もNone。
+        結果はcacheしていて共有なので、変更するときはcopyすること。
+        """
+        ret=dict.fromkeys(self.names)
+        if self.regex!=None:
+            for ma in self.regex.finditer(filename):
+                name, group, conv=self._groups[ma.lastindex]
+                if ret[name]!=None: #最初に見つかった値を使う
+                    continue
+                try:
+                    ret[name]=conv(ma.group(group))
+                except ValueError:
+                    pass
+        for name, pattern, conv in self._separate: #まとめないpatternは、それぞれ最初に一致した値
+            if ret[name]!=None:
+                continue
+            ma=pattern.search(filename)
+            if ma!=None:
+                try:
+                    ret[name]=conv(ma.group(1 if pattern.groups>0 else 0))
+                except ValueError:
+                    pass
+        return ret
+
+    def column_names(self, with_unit=False):
+        """列名のリスト。with_unitのときは"name[unit]"にする"""
+        if not with_unit:
+            return list(self.names)
+        return [nn+"["+self.units[nn]+"]" if self.units[nn]!="" else nn for nn in self.names]
+
+    def parse_strings(self, filename):
+        """parseの値を文字列のタプルで返す(Noneは"")。csvの行にするとき用"""
+        vals=self.parse(filename)
+        return tuple("" if vals[nn]==None else str(vals[nn]) for nn in self.names)
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+まとめ処理(exe_json.py)のbenchmark。PySide6はimportしない。
+合成したデータtree(幅、深さ、jsonの上書きの割合、.noの割合、ファイル数、ファイルの行数)をつくり、
+段階ごとに時間を測って、folders/s, rows/sとpeak RSSをJSONで出す。commitごとのJSONを--compareでくらべられる。
+
+python edta_bench.py --breadth 8 --depth 3 --files 10 --rows 200 --output bench.json
+python edta_bench.py --breadth 8 --depth 3 --files 10 --rows 200 --compare bench.json
+
+段階:
+  scan            scan indexをつくる(indexファイルなし)
+  resolve_legacy  フォルダごとにrootまでのjsonを読む(get_overwrite_json_dict)
+  collect         scan index(保存済み)とresolverで実行するフォルダを集める(collectJobs)
+  extract         sub *.pyのprintAllFiles(なければprocess)をこのprocessで呼ぶ(子プロセスなし)
+  dispatch        フォルダごとにsub *.pyを子プロセスで実行し、出力をspoolに書く(--workers並列)
+  write           spoolの行をまとめファイルに書く(--format)
+  end_to_end      startExeJson全体
+--data-rootを指定すると、合成treeではなく、そのフォルダ(--jsonのtag)で測る。
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import platform
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from exe_json import (startExeJson, collectJobs, subProc, spoolLines, readSpool, writeSubProcLines, writePluginRows,
+                      get_overwrite_json_dict, get_diff_path_list)
+from scan_index import ScanIndex, index_path_of
+from sub_worker import has_process_func
+from builtin_plugins import is_builtin, iter_plugin, run_plugin, read_row_spool
+from result_writer import RESULT_FORMATS, make_result_writer, result_file_path, tag_key_union
+
+BENCH_VERSION=1
+STAGES=("scan", "resolve_legacy", "collect", "extract", "dispatch", "write", "end_to_end")
+
+
+############
+# synthetic tree
+############
+
+def make_tree(root_path, breadth=4, depth=3, json_ratio=0.3, no_ratio=0.05, files=5, rows=40, cols=2, keys=4,
+              seed=0, json_filename="aa.json", master_filename="mas.json"):
+    """
+    root_pathに合成のデータtreeをつくる。各階層のフォルダ数がbreadth、深さがdepth。
+    rootのjsonはkeys個のtag、フォルダはjson_ratioの割合で一部のtagを上書きし、no_ratioの割合で.noを置く。
+    フォルダごとに"*pa *w.csv"(testdataと同じ形、2行のヘッダー+rows行×cols列)をfiles個置く。
+    seedが同じなら同じtreeになる。{"folders","files","bytes"}を返す。
+    """
+    rng=random.Random(seed)
+    not_analysis_file=os.path.splitext(json_filename)[0]+".no"
+    os.makedirs(root_path, exist_ok=True)
+    tag_keys=["tag"+str(kk) for kk in range(keys)]
+    with open(os.path.join(root_path, json_filename), 'w', encoding='utf-8') as f:
+        json.dump({kk:"0" for kk in tag_keys}, f, indent=2)
+    with open(os.path.join(root_path, master_filename), 'w', encoding='utf-8') as f:
+        json.dump({kk:"0,1,2,3" for kk in tag_keys}, f, indent=2)
+
+    stats={"folders":0, "files":0, "bytes":0}
+    _make_level(rng, root_path, 1, breadth, depth, json_ratio, no_ratio, files, rows, cols, tag_keys,
+                json_filename, not_analysis_file, stats)
+    return stats
+
+def _make_level(rng, path, level, breadth, depth, json_ratio, no_ratio, files, rows, cols, tag_keys,
+                json_filename, not_analysis_file, stats):
+    if level>depth:
+        return
+    for ii in range(breadth):
+        tpath=os.path.join(path, f"d{level}_{ii:03d}")
+        os.makedirs(tpath, exist_ok=True)
+        stats["folders"]+=1
+        if rng.random()<json_ratio:
+            over=rng.sample(tag_keys, rng.randint(1, len(tag_keys)))
+            with open(os.path.join(tpath, json_filename), 'w', encoding='utf-8') as f:
+                json.dump({kk:str(rng.randint(0, 3)) for kk in over}, f, indent=2)
+        if rng.random()<no_ratio:
+            with open(os.path.join(tpath, not_analysis_file), 'w', encoding='utf-8') as f:
+                f.write(not_analysis_file)
+        for jj in range(files):
+            stats["bytes"]+=write_data_file(rng, os.path.join(tpath, f"{(jj+1)*10}pa {rng.choice((50,100,150))}w.csv"),
+                                            rows, cols)
+            stats["files"]+=1
+        _make_level(rng, tpath, level+1, breadth, depth, json_ratio, no_ratio, files, rows, cols, tag_keys,
+                    json_filename, not_analysis_file, stats)
+
+def write_data_file(rng, path, rows, cols):
+    """testdataと同じ形のcsv。書いたbyte数を返す"""
+    lines=["name,", ",".join("c"+str(cc) for cc in range(cols))]
+    for rr in range(rows):
+        lines.append(",".join(repr(round(rng.random()*(rr+1), 6)) for _ in range(cols)))
+    text="\n".join(lines)+"\n"
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    return len(text)
+
+
+############
+# measurement
+############
+
+def peak_rss_kb():
+    """このprocessと子プロセスのpeak RSS(KB)。測れないときはNone"""
+    try:
+        import resource
+    except ImportError: #Windows
+        try:
+            import psutil
+            return {"self":psutil.Process().memory_info().peak_wset//1024, "children":None}
+        except (ImportError, AttributeError):
+            return {"self":None, "children":None}
+    scale= 1024 if sys.platform=="darwin" else 1 #macOSはbyte
+    return {"self":resource.getrusage(resource.RUSAGE_SELF).ru_maxrss//scale,
+            "children":resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss//scale}
+
+def stage_result(seconds, folders, rows):
+    return {"seconds":seconds, "folders":folders, "rows":rows,
+            "folders_per_s": folders/seconds if seconds>0 else None,
+            "rows_per_s": rows/seconds if seconds>0 else None,
+            "peak_rss_kb":peak_rss_kb()}
+
+class LineCounter(io.TextIOBase):
+    """stdoutの代わり。書かれた行を数えるだけ"""
+    def __init__(self):
+        self.lines=0
+
+    def write(self, s):
+        self.lines+=s.count("\n")
+        return len(s)
+
+@contextlib.contextmanager
+def quiet():
+    """exe_jsonのprint(フォルダごとのlog)を捨てる。測る時間に端末への出力を入れない"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def load_module(sub_py_filename):
+    import importlib.util
+    sub_dir=os.path.dirname(os.path.abspath(sub_py_filename))
+    if sub_dir not in sys.path:
+        sys.path.insert(0, sub_dir)
+    spec=importlib.util.spec_from_file_location("edta_bench_sub", sub_py_filename)
+    module=importlib.util.module_from_spec(spec)
+    with quiet():
+        spec.loader.exec_module(module)
+    return module
+
+
+############
+# stages
+############
+
+def bench_scan(root_path, json_filename, not_analysis_file):
+    index_path=index_path_of(root_path, json_filename)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    t0=time.perf_counter()
+    index=ScanIndex(root_path, json_filename, not_analysis_file)
+    index.refresh()
+    seconds=time.perf_counter()-t0
+    index.save() #collectはこのindexを使う
+    return stage_result(seconds, len(index.dirs)-1, 0)
+
+def bench_resolve_legacy(root_path, json_filename, jobList):
+    t0=time.perf_counter()
+    with quiet():
+        for tpath,relpath,jdata in jobList:
+            get_overwrite_json_dict(get_diff_path_list(root_path, tpath), json_filename)
+    return stage_result(time.perf_counter()-t0, len(jobList), 0)
+
+def bench_collect(root_path, json_filename, not_analysis_file):
+    t0=time.perf_counter()
+    with quiet():
+        jobList=collectJobs(root_path, json_filename, not_analysis_file)
+    return stage_result(time.perf_counter()-t0, len(jobList), 0), jobList
+
+def bench_extract(sub_py_filename, jobList, skip_row):
+    """sub *.pyをこのprocessで呼ぶ。printAllFilesがあればstdoutの代わりに数えるだけのsinkへ書く"""
+    if is_builtin(sub_py_filename):
+        t0=time.perf_counter()
+        rows=0
+        for tpath,relpath,jdata in jobList:
+            rows+=max(0, sum(1 for _ in iter_plugin(sub_py_filename, tpath, relpath))-1)
+        return stage_result(time.perf_counter()-t0, len(jobList), rows)
+
+    module=load_module(sub_py_filename)
+    if hasattr(module, "printAllFiles") and hasattr(module, "features"):
+        call=lambda tpath,relpath: module.printAllFiles(tpath, relpath, "csv", module.features)
+    elif has_process_func(sub_py_filename):
+        call=lambda tpath,relpath: [print(row) for row in module.process(tpath, relpath)]
+    else:
+        return None
+    sink=LineCounter()
+    headers=0
+    t0=time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for tpath,relpath,jdata in jobList:
+            before=sink.lines
+            call(tpath, relpath)
+            headers+=min(skip_row, sink.lines-before)
+    return stage_result(time.perf_counter()-t0, len(jobList), sink.lines-headers)
+
+def bench_dispatch(sub_py_filename, jobList, spool_dir, max_workers):
+    """子プロセス(組み込みpluginは関数)の実行とspoolへの書き込み。spoolのリストも返す"""
+    spools=[os.path.join(spool_dir, str(ii)+".txt") for ii in range(len(jobList))]
+    if is_builtin(sub_py_filename):
+        run=lambda tpath,relpath,spool: run_plugin(sub_py_filename, tpath, relpath, spool)
+    else:
+        run=lambda tpath,relpath,spool: spoolLines(subProc(sub_py_filename, tpath, relpath), spool)
+    t0=time.perf_counter()
+    with quiet(), ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        futures=[ex.submit(run, tpath, relpath, spool) for (tpath,relpath,jdata),spool in zip(jobList, spools)]
+        for future in futures:
+            future.result()
+    return stage_result(time.perf_counter()-t0, len(jobList), 0), spools
+
+def bench_write(sub_py_filename, jobList, spools, write_path, result_format, skip_row):
+    builtin=is_builtin(sub_py_filename)
+    writeRows,readRows=(writePluginRows,read_row_spool) if builtin else (writeSubProcLines,readSpool)
+    rows=0
+    t0=time.perf_counter()
+    with make_result_writer(write_path, result_format, tag_key_union(job[2] for job in jobList)) as writer:
+        for (tpath,relpath,jdata),spool in zip(jobList, spools):
+            lines=list(readRows(spool))
+            rows+=max(0, len([ll for ll in lines if ll!=""])-(1 if builtin else skip_row))
+            writeRows(writer, lines, jdata, relpath, skip_row)
+    return stage_result(time.perf_counter()-t0, len(jobList), rows)
+
+def bench_end_to_end(root_path, sub_py_filename, json_filename, not_analysis_file, skip_row, max_workers, inproc,
+                     result_format, rows):
+    t0=time.perf_counter()
+    with quiet():
+        summary=startExeJson(root_path, sub_py_filename, "edta_bench_result.csv", json_filename, skip_row,
+                             not_analysis_file, max_workers, inproc, result_format=result_format)
+    seconds=time.perf_counter()-t0
+    os.remove(summary["result"])
+    return stage_result(seconds, summary["done"], rows)
+
+
+############
+# report
+############
+
+def git_commit():
+    """このファイルのrepoのcommit。gitがなければNone"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_reports(report, base):
+    """段階ごとの秒数の比(今回/base)。1より大きいと遅くなった"""
+    ret=dict()
+    for name,stage in report["stages"].items():
+        old=base.get("stages", dict()).get(name)
+        if old!=None and old.get("seconds") and stage.get("seconds")!=None:
+            ret[name]=stage["seconds"]/old["seconds"]
+    return ret
+
+def run_bench(args):
+    work_dir=tempfile.mkdtemp(prefix="edta_bench_")
+    try:
+        if args.data_root:
+            root_path=os.path.abspath(args.data_root)
+            json_filename=args.json
+            tree=None
+        else:
+            root_path=os.path.join(work_dir, "root")
+            json_filename="aa.json"
+            tree=make_tree(root_path, args.breadth, args.depth, args.json_ratio, args.no_ratio, args.files, args.rows,
+                           args.cols, args.keys, args.seed, json_filename)
+        not_analysis_file=os.path.splitext(json_filename)[0]+".no"
+        sub_py_filename= args.sub if is_builtin(args.sub) else os.path.abspath(args.sub)
+        stages=set(args.stages.split(",")) if args.stages else set(STAGES)
+
+        results=dict()
+        if "scan" in stages:
+            results["scan"]=bench_scan(root_path, json_filename, not_analysis_file)
+        collect, jobList=bench_collect(root_path, json_filename, not_analysis_file)
+        if "collect" in stages:
+            results["collect"]=collect
+        if "resolve_legacy" in stages:
+            results["resolve_legacy"]=bench_resolve_legacy(root_path, json_filename, jobList)
+        if "extract" in stages:
+            extract=bench_extract(sub_py_filename, jobList, args.skip_header)
+            if extract!=None:
+                results["extract"]=extract
+        rows=0
+        if "dispatch" in stages or "write" in stages:
+            spool_dir=os.path.join(work_dir, "spool")
+            os.makedirs(spool_dir)
+            dispatch, spools=bench_dispatch(sub_py_filename, jobList, spool_dir, args.workers)
+            write=bench_write(sub_py_filename, jobList, spools, result_file_path(os.path.join(work_dir, "result.csv"),
+                              args.format), args.format, args.skip_header)
+            rows=write["rows"]
+            dispatch=stage_result(dispatch["seconds"], dispatch["folders"], rows)
+            if "dispatch" in stages:
+                results["dispatch"]=dispatch
+            if "write" in stages:
+                results["write"]=write
+        if "end_to_end" in stages:
+            results["end_to_end"]=bench_end_to_end(root_path, sub_py_filename, json_filename, not_analysis_file,
+                                                   args.skip_header, args.workers, args.inproc, args.format, rows)
+    finally:
+        if args.keep:
+            print("kept: "+work_dir, file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {"version":BENCH_VERSION, "commit":git_commit(), "python":platform.python_version(),
+            "platform":platform.platform(), "cpu_count":os.cpu_count(),
+            "params":{kk:vv for kk,vv in vars(args).items() if kk not in ("output","compare","keep")},
+            "tree":tree, "stages":{name:results[name] for name in STAGES if name in results},
+            "peak_rss_kb":peak_rss_kb()}
+
+def make_parser():
+    here=os.path.dirname(os.path.abspath(__file__))
+    parser=argparse.ArgumentParser(description="EDTA: benchmark the aggregation pipeline on a synthetic data tree.")
+    parser.add_argument("--breadth", type=int, default=4, help="folders per level")
+    parser.add_argument("--depth", type=int, default=3, help="levels of folders")
+    parser.add_argument("--json-ratio", type=float, default=0.3, help="ratio of folders that override tags")
+    parser.add_argument("--no-ratio", type=float, default=0.05, help="ratio of no-analysis folders")
+    parser.add_argument("--files", type=int, default=5, help="data files per folder")
+    parser.add_argument("--rows", type=int, default=40, help="data rows per file")
+    parser.add_argument("--cols", type=int, default=2, help="data columns per file")
+    parser.add_argument("--keys", type=int, default=4, help="tag keys in the root JSON")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the tree")
+    parser.add_argument("--data-root", default=None, help="benchmark this root instead of a synthetic tree")
+    parser.add_argument("--json", default="aa.json", help="tag JSON file name (with --data-root)")
+    parser.add_argument("--sub", default=os.path.join(here, "sub_print_csv.py"), help="sub *.py or builtin:NAME")
+    parser.add_argument("--skip-header", type=int, default=1, help="header row number of the sub *.py output")
+    parser.add_argument("--workers", type=int, default=1, help="number of parallel sub *.py")
+    parser.add_argument("--inproc", action="store_true", help="end_to_end: call process() in persistent workers")
+    parser.add_argument("--format", choices=RESULT_FORMATS, default="csv", help="result file format")
+    parser.add_argument("--stages", default="", help="comma separated stages (default: all): "+",".join(STAGES))
+    parser.add_argument("--output", default=None, help="write the report JSON to this file (default: stdout)")
+    parser.add_argument("--compare", default=None, help="report JSON of another commit to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic tree and the result")
+    return parser
+
+def main(argv=None):
+    args=make_parser().parse_args(argv)
+    report=run_bench(args)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            base=json.load(f)
+        report["compare"]={"base_commit":base.get("commit"), "seconds_ratio":compare_reports(report, base)}
+        for name,ratio in report["compare"]["seconds_ratio"].items():
+            print(f"{name:15s} x{ratio:.2f}", file=sys.stderr)
+
+    text=json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text+"\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
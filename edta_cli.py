@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+GUIなしで"run sub *.py"と同じまとめを実行するコマンド。PySide6はimportしない。
+cronや計算ノードで使う。
+
+python edta_cli.py ROOT_PATH --json aa.json --sub sub_print_csv.py --skip-header 1 --output result.csv
+
+分割実行: nodeごとに同じ引数で"--shard i/K"をつけて実行し、最後に"--merge-shards K"で1つのまとめcsvにする。
+"--shards K"は、このPCでK個のprocessを実行してmergeまでする。
+
+実行後、summary(JSON)をstdoutに1行で出す。途中のログはstderrに出る。
+失敗したフォルダはとばして続け、"<output>.errors.log"と"<output>.failed.json"に書く。
+"--rerun-failed --upsert"で失敗したフォルダだけを実行し直せる("--shards"のあとも、mergeしたfailed.jsonを使う)。
+
+exit code: 0 正常終了, 1 エラー, 2 引数の誤り, 3 中止(Ctrl+C), 4 終わったが失敗したフォルダがある
+"""
+
+import os
+import sys
+import json
+import signal
+import argparse
+import contextlib
+
+from exe_json import CancelToken, startExeJson
+from result_writer import RESULT_FORMATS
+from tag_index import parse_query
+from run_trace import RunTracer
+from run_shard import parse_shard, merge_shards, run_local_shards
+from run_errors import load_failed
+from sub_worker import has_process_func
+from builtin_plugins import BUILTIN_PREFIX, is_builtin, parse_plugin_spec, plugin_names
+
+EXIT_OK=0
+EXIT_ERROR=1
+EXIT_USAGE=2 #argparseと同じ
+EXIT_CANCELLED=3
+EXIT_FAILED_FOLDERS=4 #summaryのstatusは"failed_folders"
+
+
+def make_parser():
+    parser=argparse.ArgumentParser(description="EDTA: run sub *.py in every folder under ROOT_PATH and collect the results.")
+    parser.add_argument("root_path", help="root path of the tag")
+    parser.add_argument("--json", required=True, help="tag JSON file name (in the root path)")
+    parser.add_argument("--sub", required=True, help="sub *.py run in each folder, or "+BUILTIN_PREFIX+"NAME[?key=value&...] "
+                        "for a built-in plugin ("+", ".join(plugin_names())+")")
+    parser.add_argument("--skip-header", type=int, default=1, help="header row number of the sub *.py output")
+    parser.add_argument("--no-marker", default=None, help="no-analysis file name (default: <json name>.no)")
+    parser.add_argument("--output", required=True, help="result file name (relative to the root path)")
+    parser.add_argument("--workers", type=int, default=1, help="number of parallel sub *.py")
+    parser.add_argument("--inproc", action="store_true", help="call process() of the sub *.py in persistent workers")
+    parser.add_argument("--incremental", action="store_true", help="reuse the results of unchanged folders")
+    parser.add_argument("--format", choices=RESULT_FORMATS, default="csv", help="result file format")
+    parser.add_argument("--upsert", action="store_true", help="replace only the rows of the folders run this time (csv)")
+    parser.add_argument("--where", default="", help="run only the folders whose tags match, e.g. \"tagA=2;tagB=a|b\"")
+    parser.add_argument("--trace", default=None, help="write per-folder spans to this file (.jsonl: JSON lines, "
+                        "otherwise Chrome trace JSON)")
+    parser.add_argument("--profile", default=None, help="write cProfile stats (.prof) of the builtin plugin or process() "
+                        "in persistent workers (--inproc)")
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS", help="kill the sub *.py of a folder "
+                        "that runs longer than this (subprocess only, not with builtin plugins or --inproc)")
+    parser.add_argument("--retries", type=int, default=0, help="run a failed folder again up to this many times")
+    parser.add_argument("--rerun-failed", action="store_true", help="run only the folders in <output>.failed.json of "
+                        "the last run and replace their rows (requires --upsert)")
+    parser.add_argument("--shard", default=None, help="run only the folders of shard I/K (e.g. 0/4) and write a partial result")
+    parser.add_argument("--merge-shards", type=int, default=None, metavar="K", help="merge the K partial results into --output")
+    parser.add_argument("--shards", type=int, default=None, metavar="K", help="run K shards as local processes and merge them")
+    parser.add_argument("--summary", default=None, help="also write the summary JSON to this file")
+    return parser
+
+def strip_option(argv, name):
+    """argvから"name value"と"name=value"を除く"""
+    ret=[]
+    skip=False
+    for aa in argv:
+        if skip:
+            skip=False
+        elif aa==name:
+            skip=True
+        elif not aa.startswith(name+"="):
+            ret.append(aa)
+    return ret
+
+def run_shards(argv, args):
+    """このPCで、K個のshardを別のprocessで実行してmergeする。summaryとexit codeを返す"""
+    command=[sys.executable, os.path.abspath(__file__)]+strip_option(strip_option(argv, "--shards"), "--summary")
+    results=run_local_shards(command, args.shards)
+    summary={"shards":[ss for code,ss in results]}
+    codes=[code for code,ss in results]
+    if any(code==EXIT_CANCELLED for code in codes):
+        summary["status"]="cancelled"
+        return summary, EXIT_CANCELLED
+    if any(code not in (EXIT_OK, EXIT_FAILED_FOLDERS) for code in codes):
+        summary["error"]="shard failed: "+", ".join(f"{ii}/{args.shards}" for ii,code in enumerate(codes)
+                                                     if code not in (EXIT_OK, EXIT_FAILED_FOLDERS))
+        return summary, EXIT_ERROR
+    summary["merge"]=merge_shards(os.path.join(os.path.abspath(args.root_path), args.output), args.shards, remove=True)
+    summary["result"]=os.path.join(os.path.abspath(args.root_path), args.output)
+    if EXIT_FAILED_FOLDERS in codes: #失敗したフォルダはshardのまとめに入っていない
+        summary["status"]="failed_folders"
+        return summary, EXIT_FAILED_FOLDERS
+    summary["status"]="ok"
+    return summary, EXIT_OK
+
+def main(argv=None):
+    argv=sys.argv[1:] if argv==None else argv
+    args=make_parser().parse_args(argv)
+
+    root_path=os.path.abspath(args.root_path)
+    if not os.path.isdir(root_path):
+        print("root path is not found: "+root_path, file=sys.stderr)
+        return EXIT_USAGE
+    if is_builtin(args.sub):
+        try:
+            parse_plugin_spec(args.sub)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return EXIT_USAGE
+        sub_py_filename=args.sub
+    elif os.path.isfile(args.sub):
+        sub_py_filename=os.path.abspath(args.sub)
+    else:
+        print("sub *.py is not found: "+args.sub, file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        tag_query=parse_query(args.where)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_USAGE
+    not_analysis_file= args.no_marker if args.no_marker else os.path.splitext(args.json)[0]+".no" #GUIと同じ
+    try:
+        shard=parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_USAGE
+    if (shard!=None or args.shards or args.merge_shards) and (args.format!="csv" or args.upsert):
+        print("shard is only for the csv result without --upsert", file=sys.stderr)
+        return EXIT_USAGE
+    if args.shards and (shard!=None or args.trace or args.profile):
+        print("--shards can not be used with --shard, --trace or --profile", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.retries<0 or (args.timeout!=None and args.timeout<=0):
+        print("--retries must be >=0 and --timeout must be >0", file=sys.stderr)
+        return EXIT_USAGE
+    if args.timeout!=None and (is_builtin(sub_py_filename) or (args.inproc and has_process_func(sub_py_filename))):
+        print("--timeout is only for sub *.py run as a subprocess (not builtin plugins or --inproc)", file=sys.stderr)
+        return EXIT_USAGE
+    folders=None
+    if args.rerun_failed:
+        if not args.upsert:
+            print("--rerun-failed requires --upsert (otherwise the result has only the failed folders)", file=sys.stderr)
+            return EXIT_USAGE
+        folders=load_failed(os.path.join(root_path, args.output))
+
+    tracer=RunTracer() if args.trace else None
+    profile_path=os.path.abspath(args.profile) if args.profile else None
+    token=CancelToken()
+    signal.signal(signal.SIGINT, lambda signum, frame: token.cancel())
+
+    summary={"root":root_path, "status":"error"}
+    exit_code=EXIT_ERROR
+    try:
+        if args.merge_shards:
+            summary["merge"]=merge_shards(os.path.join(root_path, args.output), args.merge_shards)
+            summary["result"]=os.path.join(root_path, args.output)
+            summary["status"]="ok"
+            exit_code=EXIT_OK
+        elif folders==[]:
+            print("no failed folders to rerun: "+os.path.join(root_path, args.output)+".failed.json", file=sys.stderr)
+            summary.update({"folders":0, "status":"ok"})
+            exit_code=EXIT_OK
+        elif args.shards:
+            signal.signal(signal.SIGINT, signal.SIG_IGN) #Ctrl+Cは子のprocessが受けて止まる
+            shard_summary, exit_code=run_shards(argv, args)
+            summary.update(shard_summary)
+        else:
+            with contextlib.redirect_stdout(sys.stderr): #stdoutはsummaryだけにする
+                summary.update(startExeJson(root_path, sub_py_filename, args.output, args.json, args.skip_header,
+                                            not_analysis_file, args.workers, args.inproc, args.incremental, args.format,
+                                            token=token, upsert=args.upsert, tag_query=tag_query,
+                                            tracer=tracer, profile_path=profile_path, shard=shard,
+                                            timeout=args.timeout, retries=args.retries, folders=folders))
+            if summary["cancelled"]:
+                summary["status"]="cancelled"
+                exit_code=EXIT_CANCELLED
+            elif summary["failed"]>0:
+                summary["status"]="failed_folders"
+                exit_code=EXIT_FAILED_FOLDERS
+            else:
+                summary["status"]="ok"
+                exit_code=EXIT_OK
+    except Exception as e:
+        summary["error"]=f"{type(e).__name__}: {e}"
+        print(summary["error"], file=sys.stderr)
+    if tracer!=None: #エラーや中止でも、そこまでの区間を書く
+        tracer.save(args.trace)
+
+    text=json.dumps(summary, ensure_ascii=False)
+    print(text)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(text+"\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
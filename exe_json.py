@@ -0,0 +1,646 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+sub *.pyの再帰実行(まとめファイルの作成)。
+GUIなしでも使えるように(edta_cli.py)、このモジュールではPySide6をimportしないこと。
+"""
+
+import os 
+import json
+import io
+import shutil
+import tempfile
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+from sub_worker import has_process_func, load_sub_module, run_process
+from builtin_plugins import is_builtin, parse_plugin_spec, iter_plugin, run_plugin, read_row_spool
+from run_manifest import RunManifest
+from tag_resolver import TagResolver
+from scan_index import ScanIndex
+from result_writer import check_result_format, make_result_writer, result_file_path, tag_key_union
+from result_merge import upsert_csv, result_schema
+from tag_index import TagIndex
+from run_trace import NULL_TRACER, ProfileCollector
+from run_shard import ShardRecorder, shard_of, shard_result_path
+from run_errors import FolderFailed, RunErrorLog, guard_rows
+
+SUBMIT_AHEAD=4 #並列実行で、workerの数より先にsubmitしておくフォルダの数
+
+
+############
+# free functions
+############
+
+def format_seconds(sec):
+    """秒を h:mm:ss にする"""
+    sec=int(sec)
+    return f"{sec//3600}:{sec%3600//60:02d}:{sec%60:02d}"
+
+def get_overwrite_json_dict(pathlist,filename):
+    """
+    rootのfilenameのjsonをloadして、中間dir、currentdirのjsonを追記
+    """
+    jdict=dict()
+    for pp in pathlist:
+        if os.path.exists(os.path.join(pp, filename)):
+            with open(os.path.join(pp, filename), 'r', encoding='utf-8') as f:
+                jj = json.load(f)
+            #print(jj)
+            jdict=jj| jdict
+
+    return jdict
+
+def over_root_path(rootpath,tpath):
+    """
+    rootを超えたときTrue
+    """
+    comm=os.path.commonpath([rootpath,tpath])
+    return not os.path.samefile(comm,rootpath)
+
+def get_diff_path_list(root_path,current_path):
+    """
+    rootPathとcurrentPathの中間のパスのリストを返す。[current_dir,...,rootdir]
+    パスが無効なら[]
+    currentとrootが同じでもrootが入る。
+    """
+    pathList=[]
+    if os.path.exists(root_path) and os.path.exists(current_path):
+        
+        tpath= current_path #os.path.dirname(self.current_path)
+        if over_root_path(root_path,current_path): #親を超えたpathが指定された。エラー
+            return []
+
+        maxiter=20 #最大パス深さ
+        iter=0
+        while (not os.path.samefile(root_path,tpath) \
+               and (iter<maxiter) ): ## pathは==で比較しては行けない。同じパスでもtrueにならない
+            if over_root_path(root_path,tpath):
+                break
+
+            pathList.append(tpath)
+            #print(str(tpath))
+            tpath=os.path.dirname(tpath)
+            #print("->"+str(tpath))
+        pathList.append(root_path) #
+        return pathList
+    else:
+        print("root or current path is not valid(path-diff). "+root_path +"--"+current_path )
+        return []
+    
+
+###############
+#run sub *.py
+###############
+class CancelToken:
+    """
+    実行の中止の指示。別のthreadからcancel()すると、登録した子プロセスをterminateし、
+    登録したcallback(process poolの停止など)を呼ぶ。
+    """
+    def __init__(self):
+        self.event=threading.Event()
+        self.lock=threading.Lock()
+        self.procs=set()
+        self.callbacks=[]
+
+    def is_set(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+            procs=list(self.procs)
+            callbacks=list(self.callbacks)
+        for sp in procs:
+            sp.terminate()
+        for func in callbacks:
+            func()
+
+    def register(self,sp):
+        with self.lock:
+            cancelled=self.event.is_set()
+            if not cancelled:
+                self.procs.add(sp)
+        if cancelled:
+            sp.terminate()
+
+    def unregister(self,sp):
+        with self.lock:
+            self.procs.discard(sp)
+
+    def add_callback(self,func):
+        with self.lock:
+            self.callbacks.append(func)
+
+def startExeJson(root_path,sub_py_filename,result_filename,json_filename,skip_row,not_analysis_file,max_workers=1,\
+                 use_inproc=False,incremental=False,result_format="csv",progress_callback=None,token=None,upsert=False,tag_query=None,\
+                 tracer=None,profile_path=None,shard=None,timeout=None,retries=0,folders=None):
+    """
+    *.pyの再帰実行のスタート。rootだけはファイルopen、ヘッダー出力がある。
+    先に対象フォルダを集めてから、max_workers個までのsubprocを同時に実行する。
+    結果はフォルダ順(listdirのsort順、深さ優先)にまとめファイルへ書き込む。
+    列は、実行するフォルダのtagのkeyとsub *.pyの列名の和にそろえ、無い列は空にする(result_writer.py)。
+    use_inprocのとき、sub *.pyにprocess(fullpath,relpath)があれば、常駐workerに1度だけloadして呼ぶ。
+    processがなければ、これまで通りstdoutを受け取る。
+    sub_py_filenameが"builtin:名前"のときは、組み込みplugin(builtin_plugins.py)をこのprocess
+    (max_workers>1のときはprocess pool)で呼び、値の行をそのままwriterに渡す。ヘッダーは1行(skip_rowは使わない)。
+    incrementalのとき、まとめファイルの横のmanifestを見て、変化のないフォルダはcacheの行を使う。
+    result_formatがcsv以外(parquet,arrow,npz)のときは、列に型のついたファイルを拡張子を変えて書く。
+    progress_callback(終わったフォルダ数,全フォルダ数,relpath,秒数)は、フォルダを書くたびに呼ばれる。
+    token(CancelToken)がcancelされると、終わったフォルダまでを書いて止める。
+    incrementalなら、次の実行は残りのフォルダだけになる。
+    upsertのとき(csvだけ)は、まとめcsvを書き直さず、今回書いたフォルダの行だけを置き換え、ほかの行は残す(result_merge.py)。
+    tag_query({key:[値]}。tag_index.parse_query)を渡すと、tagが一致するフォルダだけを実行する。
+    upsertと使うと、条件にあうフォルダだけを解析し直せる。
+    tracer(run_trace.RunTracer)を渡すと、フォルダごとの区間(resolve,spawn,child,wait,write,folder)を記録し、
+    名前ごとの集計をsummary["trace"]に入れる。
+    profile_pathを渡すと、組み込みpluginか常駐workerのprocess()をcProfileで測り、まとめた.profを書く。
+    shard=(i,K)のとき(csvだけ)は、relpathのhashがiのフォルダだけを実行し、部分まとめcsv(run_shard.shard_result_path)と
+    フォルダごとのbyte範囲の記録を書く。K個の部分まとめはrun_shard.merge_shards()で1つにする。
+    sub *.pyが失敗したフォルダ(timeout秒で終わらない、exit codeが0でない、例外)は、retries回まで実行し直し、
+    それでも失敗したらまとめに書かずに次のフォルダへ進む。失敗はまとめファイルの横のerror logとfailed.jsonに書く
+    (run_errors.py)。timeout秒は、subprocで実行する子プロセスだけに使え、時間切れの子はkillする。
+    組み込みpluginと常駐worker(inproc)の処理は、実行中のプロセスの中で止められないので、timeoutを渡すと
+    フォルダを実行する前にValueErrorにする(時間の制限はかけない。retriesは使える)。
+    worker processが落ちたときはpoolをつくり直す。
+    folders(relpathのリスト。run_errors.load_failedなど)を渡すと、そのフォルダだけを実行する。
+    実行結果のsummaryのdictを返す。
+    """
+    t_start=time.perf_counter()
+    trace=tracer if tracer!=None else NULL_TRACER
+    result_path=os.path.join(root_path,result_filename)
+    token=token if token!=None else CancelToken()
+    check_result_format(result_format) #numpyやpyarrowが無いときは、フォルダを集める前にエラー
+    if upsert and result_format!="csv":
+        raise ValueError("upsert is only for the csv result")
+    if shard!=None:
+        if result_format!="csv" or upsert:
+            raise ValueError("shard is only for the csv result without upsert")
+        result_path=shard_result_path(result_path,*shard)
+    write_path= result_path+".new" if upsert else result_file_path(result_path,result_format)
+
+    builtin=is_builtin(sub_py_filename)
+    if builtin:
+        parse_plugin_spec(sub_py_filename) #pluginの名前の誤りは実行前にValueError
+        writeRows,readRows=writePluginRows,read_row_spool
+    else:
+        writeRows,readRows=writeSubProcLines,readSpool
+    inproc=use_inproc and not builtin and has_process_func(sub_py_filename)
+    if profile_path!=None and not (builtin or inproc):
+        raise ValueError("profile is only for builtin plugins and process() in persistent workers")
+    if timeout!=None and (builtin or inproc):
+        raise ValueError("timeout is only for sub *.py run as a subprocess (not builtin plugins or persistent workers)")
+    if upsert: #実行してから行を捨てないように、dir列で置き換えられるかを先に調べる
+        if not builtin and skip_row<1:
+            raise ValueError("upsert needs the header row of the sub *.py (skip_row>=1) for the dir column")
+        if os.path.exists(result_path) and os.path.getsize(result_path)>0 \
+           and result_schema(result_path,1 if builtin else skip_row)[0]==None:
+            raise ValueError("dir column is not found in the header of the result. run without upsert: "+result_path)
+
+    with trace.span("collect"):
+        jobList=collectJobs(root_path,json_filename,not_analysis_file,tag_query,trace) #(tpath,relpath,jdata)
+    # tagの列は実行するフォルダのkeyの和(shardでは全shardで同じ)。upsertは前回のまとめの列から始める
+    old_keys,old_header=result_schema(result_path,1 if builtin else skip_row) if upsert else (None,None)
+    tag_keys=tag_key_union((job[2] for job in jobList),old_keys or ())
+    if shard!=None:
+        jobList=[job for job in jobList if shard_of(job[1],shard[1])==shard[0]]
+    if folders!=None:
+        targets=set(ff.replace("\\","/") for ff in folders)
+        jobList=[job for job in jobList if job[1].replace("\\","/") in targets]
+    total=len(jobList)
+    if progress_callback!=None:
+        progress_callback(0,total,"",0.0)
+
+    manifest=RunManifest(result_path,sub_py_filename) if incremental else None
+    exclude={json_filename,not_analysis_file}
+    profiler=ProfileCollector(profile_path) if profile_path!=None else None
+    recorder=ShardRecorder(result_path,*shard) if shard!=None else None
+    errors=RunErrorLog(result_path)
+    pool=FolderPool(lambda: makeExecutor(sub_py_filename,max_workers,inproc,token,tracer,profiler!=None,timeout,errors))
+
+    done=0
+    cached=0
+    written=[] #書いたフォルダのrelpath
+    failed=[] #retriesまで失敗したフォルダのrelpath。まとめには書かない
+    # 並列実行の出力は、フォルダの順番が来るまでspoolファイルにためる。incrementalのときはcacheがspool。
+    spool_dir=tempfile.mkdtemp(prefix="edta_") if manifest==None else None
+    try:
+        with pool, make_result_writer(write_path,result_format,tag_keys,old_header) as writer:
+            if max_workers<=1 and not inproc and manifest==None:
+                # 逐次実行は、子のstdout(pluginは値の行)を1行ずつそのまままとめファイルへ書く
+                for tpath,relpath,jdata in jobList:
+                    if token.is_set():
+                        break
+                    t0=time.perf_counter()
+                    for attempt in range(retries+1):
+                        if builtin:
+                            lines=guard_rows(iter_plugin(sub_py_filename,tpath,relpath))
+                        else:
+                            lines=subProc(sub_py_filename,tpath,relpath,token,tracer,timeout,errors)
+                        if profiler!=None:
+                            profiler.enable() #pluginはwriteRowsの中で実行される
+                        if recorder!=None:
+                            recorder.begin(writer)
+                        error=None
+                        try:
+                            ok=writeRows(writer,lines,jdata,relpath,skip_row,token)
+                        except FolderFailed as e:
+                            writer.discard_folder() #失敗した試行の行は消す
+                            ok=not token.is_set()
+                            error=e
+                        finally:
+                            if profiler!=None:
+                                profiler.disable()
+                        if error==None or not ok:
+                            break
+                        reason=errors.attempt_failed(relpath,attempt,error)
+                    trace.add("folder",t0,time.perf_counter()-t0,relpath) #子の実行と書き込みが重なる
+                    if not ok:
+                        break #途中で止めたフォルダは書かない
+                    if error!=None:
+                        errors.folder_failed(relpath,reason)
+                        failed.append(relpath)
+                    else:
+                        if recorder!=None:
+                            recorder.end(writer,relpath)
+                        done+=1
+                        written.append(relpath)
+                    if progress_callback!=None:
+                        progress_callback(done+len(failed),total,relpath,time.perf_counter()-t0)
+            else:
+                # 実行が必要なフォルダだけsubmitする。結果はjobListの順に待つので、出力順は逐次実行と同じ。
+                # submitしてまだまとめに書いていないフォルダは、workerの数+SUBMIT_AHEAD個まで。書くたびに次をsubmitする
+                # (futureとspoolファイルが、フォルダの数によらず一定の数になる)
+                runList=[] #[tpath,relpath,jdata,files,future,spool]。futureは投入し直すと変わる
+                todo=[] #実行が必要なフォルダのrunListの位置
+                for ii,(tpath,relpath,jdata) in enumerate(jobList):
+                    files=None
+                    if manifest!=None:
+                        spool=manifest.cache_path(relpath)
+                        files=manifest.scan_files(tpath,relpath,exclude)
+                        if manifest.is_clean(relpath,files,jdata):
+                            runList.append([tpath,relpath,jdata,files,None,spool])
+                            continue
+                    else:
+                        spool=os.path.join(spool_dir,str(ii)+".txt")
+                    todo.append(len(runList))
+                    runList.append([tpath,relpath,jdata,files,None,spool])
+
+                window=max(1,max_workers)+SUBMIT_AHEAD
+                submitted=0 #submitしたtodoの数
+                waited=0 #結果を待ったtodoの数
+                for nn,(tpath,relpath,jdata,files,_,spool) in enumerate(runList):
+                    if token.is_set():
+                        break
+                    submitted=submitAhead(runList,todo,submitted,waited+window,pool)
+                    run= waited<len(todo) and todo[waited]==nn
+                    seconds=0.0
+                    t0=time.perf_counter()
+                    if run:
+                        waited+=1
+                        seconds,reason=waitFolder(runList,nn,pool,retries,errors,token,profiler)
+                        if token.is_set(): #子プロセスが途中で止められたかもしれない
+                            break
+                        if reason!=None:
+                            errors.folder_failed(relpath,reason)
+                            failed.append(relpath)
+                            if os.path.exists(spool): #incrementalのcacheにも失敗した出力を残さない
+                                os.remove(spool)
+                            if progress_callback!=None:
+                                progress_callback(done+len(failed),total,relpath,0.0)
+                            continue
+                        t1=time.perf_counter()
+                        trace.add("wait",t0,t1-t0,relpath)
+                        if builtin or inproc: #subprocはsubProcがchildを記録する
+                            trace.add("child",t1-seconds,seconds,relpath)
+                    with trace.span("write",relpath) as args:
+                        if trace.enabled:
+                            args["bytes"]=os.path.getsize(spool)
+                        if recorder!=None:
+                            recorder.begin(writer)
+                        writeRows(writer,readRows(spool),jdata,relpath,skip_row)
+                        if recorder!=None:
+                            recorder.end(writer,relpath)
+                    if manifest==None:
+                        os.remove(spool)
+                    elif not run:
+                        manifest.keep(relpath,files)
+                        cached+=1
+                    else:
+                        manifest.update(relpath,files,jdata)
+                    done+=1
+                    written.append(relpath)
+                    if progress_callback!=None:
+                        progress_callback(done+len(failed),total,relpath,seconds)
+    except BaseException:
+        if upsert and os.path.exists(write_path): #途中のエラーでは前回のまとめを変えない
+            os.remove(write_path)
+        raise
+    finally:
+        if spool_dir!=None:
+            shutil.rmtree(spool_dir,ignore_errors=True)
+        if profiler!=None:
+            profiler.save()
+        if manifest!=None:
+            #止めたときと、tag_query/foldersで一部だけ実行したときは、今回たどらないフォルダの前回の記録を残す
+            manifest.save(keep_unreached= done+len(failed)<total or bool(tag_query) or folders!=None)
+        errors.close()
+
+    summary={"result":result_file_path(result_path,result_format), "folders":total, "done":done, "cached":cached,
+             "cancelled":token.is_set() and done+len(failed)<total, "failed":len(failed)}
+    if len(failed)>0:
+        summary["failed_folders"]=failed
+    if os.path.exists(errors.log_path):
+        summary["errors_log"]=errors.log_path
+    if recorder!=None:
+        recorder.save(done+len(failed)==total,writer) #止めたshardはmergeできない
+        summary["shard"]=list(shard)
+    if upsert: #止めたときも、書き終わったフォルダの分はupsertする
+        try:
+            with trace.span("upsert"):
+                summary["upsert"]=upsert_csv(result_path,write_path,written,1 if builtin else skip_row)
+        finally:
+            if os.path.exists(write_path): #upsertできなかった今回の出力を残さない
+                os.remove(write_path)
+    if trace.enabled:
+        summary["trace"]=trace.aggregate()
+    if profile_path!=None:
+        summary["profile"]=profile_path
+    summary["seconds"]=time.perf_counter()-t_start
+    return summary
+
+def collectJobs(root_path,json_filename,not_analysis_file,tag_query=None,tracer=NULL_TRACER):
+    """
+    実行するフォルダの(tpath,relpath,jdata)のリスト。.noのフォルダと、tag_queryに一致しないフォルダは入らない。
+    フォルダはscan indexからたどる(まとめのcacheフォルダは入らない)。前回からmtimeの変わったフォルダだけscandirする。
+    tag_queryのときは、tag index(tag_index.py)のkey=valueの集合から一致するフォルダを引き、そのフォルダだけにする。
+    """
+    with tracer.span("scan"):
+        index=ScanIndex(root_path,json_filename,not_analysis_file)
+        index.load()
+        index.refresh()
+        index.save()
+
+    if tag_query:
+        with tracer.span("resolve"):
+            tag_index=TagIndex(root_path,json_filename,not_analysis_file)
+            tag_index.load()
+            tag_index.refresh(index) #statの変わったjsonだけ読む
+            tag_index.save()
+        return [(os.path.join(root_path,relpath),relpath,tag_index.folders[relpath]["tags"])
+                for relpath in tag_index.query(tag_query,include_no=False) if relpath!="."]
+
+    resolver=TagResolver(root_path,json_filename) #jsonは1回の実行で1度だけ読む
+    root_jdata=resolver.resolve(root_path)
+
+    jobList=[]
+    for ff in index.dirs["."]["dirs"]:
+        recExeJson(jobList,index,resolver,root_path,ff,root_jdata,tracer)
+    return jobList
+
+class FolderPool:
+    """makeExecutorのexecutorとsubmit。worker processが落ちたら(BrokenExecutor)、rebuild()でつくり直す"""
+    def __init__(self,make):
+        self.make=make
+        self.executor,self.submit=make()
+
+    def rebuild(self):
+        self.executor.shutdown(wait=False,cancel_futures=True)
+        self.executor,self.submit=self.make()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.executor.shutdown()
+
+def waitFolder(runList,nn,pool,retries,errors,token,profiler=None):
+    """
+    runList[nn]の結果を待つ。失敗したら、retries回までsubmitし直す(submitの失敗も1回の失敗)。
+    (秒数, None)、最後まで失敗したら(None, 理由)、cancelされたら(None, None)を返す。
+    poolが壊れたときは、つくり直して、まだ終わっていない後ろのフォルダもsubmitし直す。
+    """
+    tpath,relpath,jdata,files,future,spool=runList[nn]
+    reason=None
+    for attempt in range(retries+1):
+        try:
+            if future==None:
+                future=runList[nn][4]=pool.submit(tpath,relpath,spool)
+            seconds=future.result()
+            if profiler!=None:
+                profiler.add(spool+".prof")
+            return seconds,None
+        except Exception as e: #CancelledErrorも。poolをつくり直したときに取り消されたjob
+            if token.is_set():
+                return None,None
+            reason=errors.attempt_failed(relpath,attempt,e)
+            future=None
+            if isinstance(e,BrokenExecutor):
+                rebuildPool(runList,nn,pool)
+    return None,reason
+
+def submitAhead(runList,todo,submitted,limit,pool):
+    """
+    todo[submitted:limit]のフォルダをsubmitして、submitしたtodoの数を返す。
+    poolが壊れていてsubmitできないフォルダはfutureをNoneのままにする(waitFolderがsubmitし直す)
+    """
+    for kk in range(submitted,min(limit,len(todo))):
+        job=runList[todo[kk]]
+        try:
+            job[4]=pool.submit(job[0],job[1],job[5])
+        except BrokenExecutor:
+            pass
+    return max(submitted,min(limit,len(todo)))
+
+def rebuildPool(runList,nn,pool):
+    """
+    壊れたpoolをつくり直し、runList[nn]より後ろの終わっていないフォルダをsubmitし直す。
+    新しいpoolもすぐ壊れたときは、残りはそのまま(待つときにBrokenExecutorになり、もう1度つくり直す)
+    """
+    pool.rebuild()
+    for job in runList[nn+1:]:
+        if job[4]!=None and (not job[4].done() or job[4].cancelled() or job[4].exception()!=None):
+            try:
+                job[4]=pool.submit(job[0],job[1],job[5])
+            except BrokenExecutor:
+                break
+
+def makeExecutor(sub_py_filename,max_workers,inproc,token,tracer=None,profile=False,timeout=None,errors=None):
+    """
+    (executor, submit(tpath,relpath,spool))を返す。submitのfutureの結果はそのフォルダの秒数。
+    inprocのときは、sub *.pyを1度だけloadした常駐worker process。
+    組み込みpluginは、max_workers>1ならprocess pool(GILを避ける)、1ならthreadで呼ぶ。
+    profileのときは、組み込みpluginとprocess()のcProfileの結果を"spool.prof"に書く。
+    tracerはsubprocの起動と実行を記録する。timeoutとerrorsはsubProcに渡す。
+    """
+    prof=(lambda spool: spool+".prof") if profile else (lambda spool: None)
+    if is_builtin(sub_py_filename):
+        if max_workers>1:
+            executor=ProcessPoolExecutor(max_workers=max_workers)
+            token.add_callback(lambda: stopProcessPool(executor))
+        else:
+            executor=ThreadPoolExecutor(max_workers=1)
+            token.add_callback(lambda: executor.shutdown(wait=False,cancel_futures=True))
+        submit=lambda tpath,relpath,spool: executor.submit(run_plugin,sub_py_filename,tpath,relpath,spool,prof(spool))
+    elif inproc:
+        executor=ProcessPoolExecutor(max_workers=max(1,max_workers),initializer=load_sub_module,\
+                                     initargs=(sub_py_filename,))
+        token.add_callback(lambda: stopProcessPool(executor))
+        submit=lambda tpath,relpath,spool: executor.submit(run_process,tpath,relpath,spool,prof(spool))
+    else:
+        # subprocの待ちだけなのでthreadで十分。
+        executor=ThreadPoolExecutor(max_workers=max(1,max_workers))
+        token.add_callback(lambda: executor.shutdown(wait=False,cancel_futures=True))
+        submit=lambda tpath,relpath,spool: executor.submit(spoolLines,\
+                                    subProc(sub_py_filename,tpath,relpath,token,tracer,timeout,errors),spool)
+    return executor,submit
+
+def stopProcessPool(executor):
+    """待っているjobを取り消し、実行中のworker processをterminateする"""
+    executor.shutdown(wait=False,cancel_futures=True)
+    terminate_workers=getattr(executor,"terminate_workers",None) #python 3.14から
+    if terminate_workers!=None:
+        terminate_workers()
+    else:
+        for pp in list((getattr(executor,"_processes",None) or dict()).values()):
+            pp.terminate()
+
+def recExeJson(jobList,index,resolver,root_path,relpath,parent_jdata,tracer=NULL_TRACER):
+    """
+    dirの子供のdirを再帰して、subprocを実行するフォルダをjobListに追加する。
+    子フォルダと.noの有無はscan indexを見る(statしない)。
+    tagは親の解決済みdictに自分のjsonを上書きして求める(rootまで読み直さない)。
+    """
+    tpath=os.path.join(root_path,relpath)
+    entry=index.dirs[relpath]
+    with tracer.span("resolve",relpath):
+        jdata=resolver.resolve_child(parent_jdata,tpath,entry["has_json"])
+    if not entry["has_no"]: #.noのフォルダは実行しない(子フォルダはたどる)
+        jobList.append((tpath,relpath,jdata))
+
+    for ff in entry["dirs"]:
+        recExeJson(jobList,index,resolver,root_path,os.path.join(relpath,ff),jdata,tracer)
+
+def subProc(sub_py_filename,tpath,relpath,token=None,tracer=None,timeout=None,errors=None):
+    """
+    各フォルダで実行されるsubProc。指定した*.pyを呼び出す。
+    stdoutを1行ずつyieldするgenerator。stdoutをまとめて読まないので、出力が大きくてもメモリは一定。
+    tokenがcancelされると子プロセスはterminateされ、そこで終わる。
+    tracerを渡すと、起動(spawn)と、終わるまで(child。受け取ったbytesと行数)を記録する。
+    timeout秒で終わらない子プロセスはkillする。時間切れとexit codeが0でないときは、最後の行のあとで
+    FolderFailed(stderrつき)になる。成功したときのstderrは、errors(RunErrorLog)を渡せばそこに書く。
+    """
+    command=["python",sub_py_filename,tpath,relpath]
+
+    stderr=tempfile.TemporaryFile() #pipeにすると、stderrが多いときに子が止まる
+    t0=time.perf_counter()
+    sp=subprocess.Popen(command,stdout=subprocess.PIPE,stderr=stderr)
+    if tracer!=None:
+        tracer.add("spawn",t0,time.perf_counter()-t0,relpath)
+    if token!=None:
+        token.register(sp)
+    timed_out=threading.Event()
+    timer=None
+    if timeout!=None:
+        timer=threading.Timer(timeout,lambda: (timed_out.set(),sp.kill()))
+        timer.daemon=True
+        timer.start()
+    nbytes=0
+    nlines=0
+    try:
+        for line in io.TextIOWrapper(sp.stdout,encoding="utf-8"):
+            if tracer!=None:
+                nbytes+=len(line.encode("utf-8"))
+                nlines+=1
+            yield line.rstrip("\r\n")
+    finally:
+        sp.stdout.close()
+        sp.wait()
+        if timer!=None:
+            timer.cancel()
+        if token!=None:
+            token.unregister(sp)
+        if tracer!=None:
+            tracer.add("child",t0,time.perf_counter()-t0,relpath,bytes=nbytes,lines=nlines,returncode=sp.returncode)
+        stderr.seek(0)
+        text=stderr.read().decode("utf-8",errors="replace")
+        stderr.close()
+
+    if token!=None and token.is_set(): #cancelでterminateした
+        return
+    if timed_out.is_set():
+        raise FolderFailed(f"timeout ({timeout} s)",text)
+    if sp.returncode!=0:
+        raise FolderFailed(f"exit code {sp.returncode}",text)
+    if text.strip()!="" and errors!=None:
+        errors.stderr(relpath,text)
+
+def spoolLines(lines,spool_path):
+    """行をspoolファイルに1行ずつ書く。worker threadで実行する。かかった秒数を返す"""
+    t0=time.perf_counter()
+    with open(spool_path,'w',encoding='utf-8') as f:
+        for line in lines:
+            f.write(line+"\n")
+    return time.perf_counter()-t0
+
+def readSpool(spool_path):
+    """spoolファイルの行を1行ずつyieldする"""
+    with open(spool_path,'r',encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+def writeSubProcLines(writer,lines,jdata,relpath,skip_row,token=None):
+    """
+    subProcのstdoutの行にtagの列とdirをつけて、届いた順にwriterへ書く。
+    先頭のskip_row行はヘッダー。writerは最初のフォルダのヘッダーだけを書く。
+    tokenを渡したときは、途中でcancelされたらこのフォルダの行を取り消してFalseを返す。
+    """
+    writer.begin_folder(jdata,relpath)
+    if token!=None:
+        writer.mark_folder()
+    header=[]
+    for line in lines:
+        if len(header)<skip_row:
+            header.append(line)
+            if len(header)==skip_row:
+                writer.write_header(header)
+        elif line!="":
+            writer.write_line(line)
+
+    if token!=None and token.is_set():
+        writer.discard_folder()
+        return False
+
+    if 0<len(header)<skip_row: #ヘッダー行より出力が短いとき
+        writer.write_header(header)
+    writer.end_folder()
+    return True
+
+def writePluginRows(writer,rows,jdata,relpath,skip_row=1,token=None):
+    """
+    組み込みpluginの行を、値のまま(文字列にしないで)writerへ書く。最初の行がヘッダー(skip_rowは使わない)。
+    tokenを渡したときは、途中でcancelされたらこのフォルダの行を取り消してFalseを返す。
+    """
+    writer.begin_folder(jdata,relpath)
+    if token!=None:
+        writer.mark_folder()
+    first=True
+    for row in rows:
+        if token!=None and token.is_set():
+            break
+        if first:
+            writer.write_header_row(row)
+            first=False
+        else:
+            writer.write_row(row)
+
+    if token!=None and token.is_set():
+        writer.discard_folder()
+        return False
+    writer.end_folder()
+    return True
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+大きなテキスト(csv)ファイルの行範囲だけを読むreader。
+ファイルはmmapで開き、必要な行までだけ改行を探す。ファイル全体をメモリに読まないので、
+数GBのファイルから数十行を取り出すときも、メモリは読んだ行の分だけ。
+stride行ごとの行頭offset(checkpoint)を覚えておき、index_dirを指定すると保存して次回はそこから探す。
+
+    with LineReader(path) as lr:
+        for line in lr.lines(2, 30):
+            ...
+"""
+
+import os
+import json
+import mmap
+import hashlib
+
+LINE_INDEX_VERSION=1
+
+
+class LineReader:
+    def __init__(self, path, index_dir=None, stride=1024, encoding="utf-8"):
+        """
+        index_dir:行のoffsetのindexを保存するフォルダ(Noneなら保存しない)。データのフォルダには書かない。
+        stride:checkpointの間隔(行)
+        """
+        self.path=path
+        self.index_dir=index_dir
+        self.stride=stride
+        self.encoding=encoding
+        self.fp=open(path, 'rb')
+        st=os.fstat(self.fp.fileno())
+        self.stat_key=[st.st_size, st.st_mtime_ns]
+        self.mm=mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size>0 else None #空のファイルはmmapできない
+        self.offsets=[0] #stride*ii行目の行頭のoffset
+        self.eof_line=None #ファイルの行数(最後まで探したとき)
+        self.dirty=False
+        if index_dir!=None:
+            self.load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def index_path(self):
+        key=os.path.normcase(os.path.abspath(self.path))
+        return os.path.join(self.index_dir, hashlib.md5(key.encode('utf-8')).hexdigest()+".lineidx.json")
+
+    def load_index(self):
+        """保存したindexを読む。ファイルのsizeかmtimeが変わっていたら使わない"""
+        try:
+            with open(self.index_path(), 'r', encoding='utf-8') as f:
+                idata=json.load(f)
+        except (OSError, ValueError):
+            return
+        if idata.get("version")==LINE_INDEX_VERSION and idata.get("stat")==self.stat_key \
+            and idata.get("stride")==self.stride:
+            self.offsets=idata["offsets"]
+            self.eof_line=idata.get("eof_line")
+
+    def save_index(self):
+        if self.index_dir==None or not self.dirty:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path=self.index_path()+".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version":LINE_INDEX_VERSION, "stat":self.stat_key, "stride":self.stride,
+                       "offsets":self.offsets, "eof_line":self.eof_line}, f)
+        os.replace(tmp_path, self.index_path())
+        self.dirty=False
+
+    def close(self):
+        self.save_index()
+        if self.mm!=None:
+            self.mm.close()
+        self.fp.close()
+
+    def seek_line(self, row):
+        """
+        row行目の行頭のoffset。ファイルの行数より後ならNone。
+        近いcheckpointから改行を探し、途中のcheckpointを記録する。
+        """
+        if self.mm==None:
+            return None
+        if self.eof_line!=None and row>=self.eof_line:
+            return None
+        kk=min(row//self.stride, len(self.offsets)-1)
+        pos=self.offsets[kk]
+        line=kk*self.stride
+        size=len(self.mm)
+        while line<row:
+            nl=self.mm.find(b"\n", pos)
+            if nl<0 or nl+1>=size: #最後の行
+                self.eof_line=line+1
+                self.dirty=True
+                return None
+            pos=nl+1
+            line+=1
+            if line%self.stride==0 and line//self.stride==len(self.offsets):
+                self.offsets.append(pos)
+                self.dirty=True
+        return pos
+
+    def lines(self, start, end):
+        """start..end-1行を1行ずつ(改行なしの文字列で)yieldする。end行より後は読まない"""
+        pos=self.seek_line(start)
+        if pos==None:
+            return
+        size=len(self.mm)
+        for _ in range(start, end):
+            if pos>=size:
+                break
+            nl=self.mm.find(b"\n", pos)
+            stop= nl if nl>=0 else size
+            yield self.mm[pos:stop].decode(self.encoding, errors="replace").rstrip("\r")
+            if nl<0:
+                break
+            pos=nl+1
+
+
+def read_lines(path, start, end, index_dir=None):
+    """pathのstart..end-1行のリスト(改行なし)"""
+    with LineReader(path, index_dir) as lr:
+        return list(lr.lines(start, end))
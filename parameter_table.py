@@ -6,13 +6,22 @@
 
 import os 
 import json
-import subprocess
-from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, 
-                               QTableWidgetItem, QPushButton, QLabel, QFileDialog,
+import time
+import difflib
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+                               QPushButton, QLabel, QFileDialog,
                                QMessageBox, QHeaderView, QMenu, QInputDialog,
                                QStyledItemDelegate, QComboBox)
-from PySide6.QtCore import Qt, QDir,QThread,Signal
-from PySide6.QtGui import QAction, QFont
+from PySide6.QtCore import Qt, QDir,QThread,Signal, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+from PySide6.QtGui import QAction, QFont, QColor
+from sub_worker import has_process_func
+from builtin_plugins import BUILTIN_PREFIX, PLUGINS, is_builtin, parse_plugin_spec
+from tag_resolver import TagResolver, norm_path
+from scan_index import ScanIndex
+from tag_index import TagIndex, parse_query
+from tag_bulk_edit import glob_folders, parse_patch, plan_bulk_edit, format_plan, apply_bulk_edit
+from result_writer import RESULT_FORMATS
+from exe_json import CancelToken, startExeJson, format_seconds
 
 
 class ComboBoxDelegate(QStyledItemDelegate):
@@ -20,11 +29,6 @@ class ComboBoxDelegate(QStyledItemDelegate):
     def __init__(self, parent=None, master_data=None):
         super().__init__(parent)
         self.master_data = master_data
-        self.table_widget = None  # テーブルへの参照
-    
-    def set_table_widget(self, table_widget):
-        """テーブルウィジェットへの参照を設定"""
-        self.table_widget = table_widget
     
     ## override
     def createEditor(self, parent, option, index):
@@ -34,16 +38,12 @@ class ComboBoxDelegate(QStyledItemDelegate):
         combo.lineEdit().setPlaceholderText("値を入力または選択")
         
         # 列2（value list）のデータを取得して候補として追加
-        if self.table_widget:
-            row = index.row()
-            value_list_item = self.table_widget.item(row, 2)  # 列2
-            if value_list_item:
-                value_list_text = value_list_item.text()
-                if value_list_text:
-                    # カンマや改行で区切られた値を候補として追加
-                    candidates = [v.strip() for v in value_list_text.replace('\n', ',').split(',') if v.strip()]
-                    for candidate in candidates:
-                        combo.addItem(candidate)
+        value_list_text = index.sibling(index.row(), 2).data(Qt.DisplayRole)  # 列2
+        if value_list_text:
+            # カンマや改行で区切られた値を候補として追加
+            candidates = [v.strip() for v in value_list_text.replace('\n', ',').split(',') if v.strip()]
+            for candidate in candidates:
+                combo.addItem(candidate)
         
         return combo
     ## override
@@ -59,7 +59,150 @@ class ComboBoxDelegate(QStyledItemDelegate):
         model.setData(index, value, Qt.EditRole)
 
 
+class TagTableModel(QAbstractTableModel):
+    """
+    tag tableのmodel。行は[key, value, value list, 状態, 親の値]で、最後にkeyを追加する空の行がある。
+    フォルダを移動したときは、前のフォルダとのkeyと値の差分の行だけ更新する(表全体を作り直さない)。
+    状態は、親から継承(自分のjsonにない)、上書き(親にもあるkeyを自分のjsonで設定)、自分(親にないkey)。
+    """
+    HEADERS=["key","value","value list"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows=[self.empty_row()]
+        self.bold_font=QFont()
+        self.bold_font.setBold(True)
+
+    def empty_row(self):
+        return ["", "", "", "own", None]
+
+    def make_row(self, key, value, own, parent_dict, master):
+        if key not in own:
+            state="inherited"
+        elif key in parent_dict:
+            state="overridden"
+        else:
+            state="own"
+        ml=master.get(key)
+        return [key, str(value), "" if ml==None else str(ml), state, parent_dict.get(key)]
+
+    ## override
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation==Qt.Horizontal and role==Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsEditable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row=self.rows[index.row()]
+        col=index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return row[col]
+        if col==2 or row[0]=="":
+            return None
+        if role==Qt.ForegroundRole and row[3]=="inherited":
+            return QColor(Qt.gray)
+        if role==Qt.FontRole and row[3]=="overridden":
+            return self.bold_font
+        if role==Qt.ToolTipRole:
+            if row[3]=="inherited":
+                return "inherited from the parent folder"
+            if row[3]=="overridden":
+                return "overrides the parent value: "+str(row[4])
+            return "set in this folder"
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """編集した行は自分のjsonの値になる。最後の空の行を編集したら、次の空の行を追加する"""
+        if role!=Qt.EditRole or not index.isValid():
+            return False
+        row=self.rows[index.row()]
+        col=index.column()
+        value="" if value==None else str(value)
+        if row[col]==value:
+            return False
+        row[col]=value
+        if col==0: #keyを変えたら親の値はわからない
+            row[4]=None
+        if col<2:
+            row[3]="own" if row[4]==None else "overridden"
+        self.dataChanged.emit(self.index(index.row(), 0), self.index(index.row(), 2))
+
+        if index.row()==len(self.rows)-1:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+            self.rows.append(self.empty_row())
+            self.endInsertRows()
+        return True
+
+    def update_row(self, ii, row):
+        if self.rows[ii]!=row:
+            self.rows[ii]=row
+            self.dataChanged.emit(self.index(ii, 0), self.index(ii, 2))
+
+    def set_tags(self, jdata, own, parent_dict, master):
+        """
+        表をjdataにする。ownは自分のjsonのkey、parent_dictは親の解決済みdict、masterはvalue list。
+        keyの並びが同じ(兄弟フォルダなど)なら値の変わった行だけ、違うときはkeyの並びの差分の行だけ削除と挿入をする
+        """
+        new_rows=[self.make_row(key, value, own, parent_dict, master) for key,value in jdata.items() if key!=None and key!=""]
+        old_keys=[row[0] for row in self.rows[:-1]]
+        new_keys=[row[0] for row in new_rows]
+        if old_keys==new_keys:
+            for ii,row in enumerate(new_rows):
+                self.update_row(ii, row)
+        else:
+            opcodes=difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False).get_opcodes()
+            for tag,i1,i2,j1,j2 in reversed(opcodes): #後ろから変えると、前の行の位置は変わらない
+                if tag=="equal":
+                    for kk in range(i2-i1):
+                        self.update_row(i1+kk, new_rows[j1+kk])
+                    continue
+                if i2>i1:
+                    self.beginRemoveRows(QModelIndex(), i1, i2-1)
+                    del self.rows[i1:i2]
+                    self.endRemoveRows()
+                if j2>j1:
+                    self.beginInsertRows(QModelIndex(), i1, i1+j2-j1-1)
+                    self.rows[i1:i1]=new_rows[j1:j2]
+                    self.endInsertRows()
+        self.update_row(len(self.rows)-1, self.empty_row())
+
+    def table_dict(self, col):
+        """keyと列colの値のdict。keyが空の行は除く"""
+        return {row[0]:row[col] for row in self.rows if row[0]!=""}
+
+    def own_dict(self):
+        """
+        自分のjsonに書くkeyと値のdict。継承の行(編集していない)は書かない。
+        上書きの行でも、値が親と同じなら書かない(親の値が変わったら継承する。tag_bulk_editと同じ)
+        """
+        return {row[0]:row[1] for row in self.rows
+                if row[0]!="" and row[3]!="inherited" and (row[3]=="own" or row[1]!=str(row[4]))}
+
+
+class TagSortProxy(QSortFilterProxyModel):
+    """tag tableの並べ替え。keyを追加する空の行はいつも最後にする"""
+    def lessThan(self, left, right):
+        last=self.sourceModel().rowCount()-1
+        if left.row()==last or right.row()==last:
+            return (right.row()==last)==(self.sortOrder()==Qt.AscendingOrder)
+        return super().lessThan(left, right)
+
+
 class ParameterTable(QWidget):
+    root_changed=Signal(str) #tag rootを設定した
+    tags_changed=Signal(list) #jsonか.noを書いたフォルダのpath。空のリストはjsonが変わった(全部)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         #self.file_model = file_model
@@ -68,16 +211,24 @@ class ParameterTable(QWidget):
         self.json_filename=""
         self.not_analysis_filename=""
         self.jdata=dict() #今のフォルダのjson
+        self.tag_resolver=None #jsonの継承を解決する。get_tag_resolver()で使う
+        self.scan_index=None #root以下のフォルダのindex。get_scan_index()で使う
+        self.tag_index=None #key=valueからフォルダを引くindex。get_tag_index()で使う
+        self.tag_query_text="" #"only matching"で実行するフォルダのtagの条件
         self.sub_py_filename=""
         self.result_filename=""
+        self.result_format="csv"
         self.skip_row=0
+        self.max_workers=1 #同時に実行するsubprocの数
+        self.retries=0 #失敗したフォルダを実行し直す回数
+        self.timeout=None #subprocをkillする秒数。組み込みpluginと常駐workerでは使えない
+        self.use_inproc=False #sub *.pyのprocess()を常駐workerで呼ぶ
         
         self.json_master_filename=""
         self.master_jdata=dict()
 
         #self.file_list = []
         self.path_list=[]
-        self.indexDict=dict()
         self.thread=SubProcWorker() #ここに定義しないとsubThread実行中にdeleteされる
        
         self.setWindowTitle("Tagデータ")
@@ -127,6 +278,10 @@ class ParameterTable(QWidget):
         self.save_btn.setToolTip("リストをJSONファイルに保存")
         header_layout1.addWidget(self.save_btn)
 
+        self.bulk_edit_btn = QPushButton("bulk edit")
+        self.bulk_edit_btn.setToolTip("globに一致するフォルダのtagをまとめて変更(確認してから書く)")
+        header_layout1.addWidget(self.bulk_edit_btn)
+
         ##
         self.set_sub_py_btn = QPushButton("set sub *.py") #第一引数は、jsonのフォルダ。結果はstdoutから取得しまとめファイルに保存
         self.set_sub_py_btn.setToolTip("各フォルダで実行する*.pyを設定")
@@ -136,10 +291,34 @@ class ParameterTable(QWidget):
         self.set_result_filename_btn.setToolTip("各フォルダの実行結果ファイル名")
         header_layout1.addWidget(self.set_result_filename_btn)
 
+        self.set_workers_btn = QPushButton("set workers")
+        self.set_workers_btn.setToolTip("同時に実行するsub *.pyの数")
+        header_layout1.addWidget(self.set_workers_btn)
+
+        self.incremental_btn = QPushButton("incremental")
+        self.incremental_btn.setToolTip("変化のないフォルダはsub *.pyを実行せず、前回の結果を使う")
+        self.incremental_btn.setCheckable(True)
+        header_layout1.addWidget(self.incremental_btn)
+
+        self.upsert_btn = QPushButton("upsert")
+        self.upsert_btn.setToolTip("まとめcsvを書き直さず、今回実行したフォルダの行だけ置き換える(dir+fileがkey)")
+        self.upsert_btn.setCheckable(True)
+        header_layout1.addWidget(self.upsert_btn)
+
+        self.only_matching_btn = QPushButton("only matching")
+        self.only_matching_btn.setToolTip("tagが条件(tagA=2;tagB=a|b)に一致するフォルダだけ実行する")
+        self.only_matching_btn.setCheckable(True)
+        header_layout1.addWidget(self.only_matching_btn)
+
         self.do_sup_py_btn = QPushButton("run sub *.py")
         self.do_sup_py_btn.setToolTip("各フォルダに+.py実行")
         header_layout1.addWidget(self.do_sup_py_btn)
 
+        self.cancel_sub_py_btn = QPushButton("cancel run")
+        self.cancel_sub_py_btn.setToolTip("実行中のsub *.pyを止める。終わったフォルダまではまとめファイルに残る")
+        self.cancel_sub_py_btn.setEnabled(False)
+        header_layout1.addWidget(self.cancel_sub_py_btn)
+
         self.no_analysis_json_btn = QPushButton("make no-analysis tag")
         self.no_analysis_json_btn.setToolTip("make no-analysis tag")
         header_layout1.addWidget(self.no_analysis_json_btn)
@@ -151,14 +330,15 @@ class ParameterTable(QWidget):
         headerV_layout.addLayout(header_layout1)
         main_layout.addLayout(headerV_layout)
         
-        # テーブルウィジェット
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(["key","value","value list"])
+        # テーブル（tag_modelを並べ替えのproxyごしに表示）
+        self.tag_model = TagTableModel(self)
+        self.tag_proxy = TagSortProxy(self)
+        self.tag_proxy.setSourceModel(self.tag_model)
+        self.table = QTableView()
+        self.table.setModel(self.tag_proxy)
         
         # 列1（value列）にComboBoxデリゲートを設定
         combo_delegate = ComboBoxDelegate(self, self.master_jdata)
-        combo_delegate.set_table_widget(self.table)
         self.table.setItemDelegateForColumn(1, combo_delegate)
         
         # テーブルの設定
@@ -169,6 +349,7 @@ class ParameterTable(QWidget):
         
         self.table.setAlternatingRowColors(True)
         self.table.setSortingEnabled(True)
+        self.table.sortByColumn(-1, Qt.AscendingOrder)  # 最初はjsonのkeyの順
         
         main_layout.addWidget(self.table)
         
@@ -182,67 +363,31 @@ class ParameterTable(QWidget):
         self.new_json_btn.clicked.connect(self.new_json)
         self.load_btn.clicked.connect(self.load_from_json)
         self.save_btn.clicked.connect(self.save_to_json)
+        self.bulk_edit_btn.clicked.connect(lambda: self.bulk_edit_tags())
         self.no_analysis_json_btn.clicked.connect(self.make_no_analysis_json)
         self.del_no_analysis_json_btn.clicked.connect(self.delete_no_analysis_json)
         #
         self.set_sub_py_btn.clicked.connect(self.set_sub_pyfile)
         self.set_result_filename_btn.clicked.connect(self.set_result_filename)
+        self.set_workers_btn.clicked.connect(self.set_max_workers)
         self.do_sup_py_btn.clicked.connect(self.do_sup_py)
+        self.cancel_sub_py_btn.clicked.connect(self.cancel_sub_py)
+        self.only_matching_btn.toggled.connect(self.on_only_matching_toggled)
+        self.thread.progress.connect(self.on_sub_py_progress)
+        self.thread.finished.connect(self.sub_py_finished)
 
         # コンテキストメニュー
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.show_context_menu)
-        
-        # セル編集終了時に新しい行を追加
-        self.table.itemChanged.connect(self.on_cell_changed) #cellchangedは、loadしただけでも発生するのでつかわない。
 
     #########################################################
     # callback functions
     #########################################################
 
-    def on_cell_changed(self, citem): #row, column):
-        """セルの編集終了時に呼ばれる。最後の行を編集した場合は新しい行を追加"""
-        row=citem.row()
-        #マスターデータ更新
-        #if column==2:
-        print("master-update")
-        print(row)
-        if self.table.item(row,0)!=None:
-            print( self.table.item(row,0).text() )
-        if self.table.item(row,2)!=None:
-            print( self.table.item(row,2).text() )
-
-        # 現在の行数
-        current_row_count = self.table.rowCount()
-        
-        # 編集された行が最後の行の場合、新しい行を追加
-        if row == current_row_count - 1:
-            # シグナルを一時的に切断（再帰的な変更を防ぐ）
-            #self.table.cellChanged.disconnect(self.on_cell_changed)
-            self.table.itemChanged.disconnect(self.on_cell_changed)
-            try:
-                # 新しい行を追加
-                itemExist=False
-                for col in range(self.table.columnCount()):
-                    if self.table.item(row,col) !=None:
-                        itemExist=True 
-                if itemExist==True:
-
-                    new_row = self.table.rowCount()
-                    self.table.insertRow(new_row)
-                    
-                    # 新しい行のすべての列に空のセルを設定
-                    for col in range(self.table.columnCount()):
-                        self.table.setItem(new_row, col, QTableWidgetItem(""))
-
-            finally:
-                # シグナルを再接続
-                #self.table.cellChanged.connect(self.on_cell_changed)
-                self.table.itemChanged.connect(self.on_cell_changed)
-
     def set_root_path(self):
         self.root_label.setText("root path: "+self.current_path)
         self.root_path=self.current_path #os.path.realpath(self.current_path)
+        self.root_changed.emit(self.root_path)
 
     
     def new_json(self):
@@ -268,6 +413,7 @@ class ParameterTable(QWidget):
             self.json_filename= os.path.basename(file_path) ##解析用jsonの名前
             self.not_analysis_filename=os.path.splitext(self.json_filename)[0]+".no"
             self.status_label.setText(self.json_filename) 
+            self.tags_changed.emit([])
 
             m_filename,tf=QInputDialog().getText(self,"set MASTAR JSON filename","input MASTER JSON file name.") #,"","")
 
@@ -279,13 +425,8 @@ class ParameterTable(QWidget):
             self.json_master_filename= m_filename #os.path.basename(mfile_path) ##解析用jsonの名前
             #self.status_label.setText(self.json_filename) 
             ##
-            #row = self.table.rowCount()
-            self.table.setRowCount(0) #clear
-            row=0
-            self.table.insertRow(row)     #1行目
-            self.table.setItem(row, 0, QTableWidgetItem(""))
-            self.table.setItem(row, 1, QTableWidgetItem(""))
-            self.table.setItem(row, 2, QTableWidgetItem(""))
+            self.jdata=dict()
+            self.tag_model.set_tags(self.jdata, set(), dict(), self.master_jdata) #clear。空の1行目だけになる
 
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"error in making new JSON:\n{str(e)}")
@@ -331,11 +472,13 @@ class ParameterTable(QWidget):
             self.master_jdata = json.load(f2)
         
         self.refresh_list() #jsonのloadもこれ
+        self.tags_changed.emit([])
         self.status_label.setText("json file is loaded.")        
 
     def save_to_json(self):
         """リストをJSONファイルに保存.
-        self.jdataをtableの内容にupdateもする
+        自分のjsonには、自分と上書きの行(編集した行)だけを書く。継承の行を書くと、親を変えても継承されなくなる。
+        保存したあとは表を読み直す(状態と、self.jdataの解決済みの値)
         """
         
         try:
@@ -347,12 +490,14 @@ class ParameterTable(QWidget):
 
             if os.path.exists(self.current_path):
 
-                save_data=self.get_table_dict(1) #value=1
-                self.jdata=save_data
+                save_data=self.tag_model.own_dict() #value=1
                 
                 # JSONファイルに保存
                 with open(os.path.join(self.current_path,self.json_filename), 'w', encoding='utf-8') as f:
-                    json.dump(self.jdata, f, ensure_ascii=False, indent=2) #ensue_asciiがfalseでないと、日本語がでない
+                    json.dump(save_data, f, ensure_ascii=False, indent=2) #ensue_asciiがfalseでないと、日本語がでない
+                self.get_tag_resolver().invalidate(self.current_path)
+                self.update_tag_index([self.current_path])
+                self.tags_changed.emit([self.current_path])
                 
             ##master save
                 self.master_jdata=self.get_table_dict(2) #value=2
@@ -360,14 +505,77 @@ class ParameterTable(QWidget):
                     json.dump(self.master_jdata, f, ensure_ascii=False, indent=2)
 
                 #QMessageBox.information(self, "成功", f"JSONファイルを保存しました:\n{os.path.join(self.current_path,self.json_filename)}")
+                self.refresh_list() #継承と上書きの状態を、保存したjsonから表示し直す
                 self.status_label.setText(self.json_filename) #(f"JSON file is saved: {os.path.basename(file_path)}")
                             
 
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"JSONファイルの保存に失敗しました:\n{str(e)}")
 
+    def bulk_edit_tags(self, folders=None):
+        """
+        多くのフォルダのtagをまとめて変更する。foldersがNoneのときはglobで選ぶ。
+        override/inheritと書くjsonの一覧を見せてから、まとめて書き、master JSONは1度だけ更新する。
+        """
+        if self.root_path=="" or self.json_filename=="":
+            QMessageBox.warning(self, "warning", "set root path and JSON.")
+            return
+        if folders==None:
+            pattern,tf=QInputDialog().getText(self,"bulk edit","folder glob from the root path (** for all sub folders).",text="*")
+            if not tf:
+                return
+            folders=glob_folders(self.root_path,pattern)
+        if len(folders)==0:
+            self.status_label.setText("no folder is selected.")
+            return
+
+        text,tf=QInputDialog().getText(self,"bulk edit",f"{len(folders)} folders. input patch (key=value;key2=value2, -key: inherit).")
+        if not tf:
+            return
+        try:
+            changes=plan_bulk_edit(self.root_path,self.json_filename,folders,parse_patch(text),self.get_tag_resolver())
+        except Exception as e:
+            QMessageBox.warning(self, "bulk edit", str(e))
+            return
+        if len(changes)==0:
+            self.status_label.setText("bulk edit: nothing to change.")
+            return
+
+        #dry-run: 書くファイルを見せて確認する
+        box=QMessageBox(self)
+        box.setWindowTitle("bulk edit")
+        box.setText(f"{len(changes)} JSON files will be written. apply?")
+        box.setDetailedText(format_plan(changes,self.root_path))
+        box.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        if box.exec()!=QMessageBox.Yes:
+            return
+
+        try:
+            master_path=os.path.join(self.root_path,self.json_master_filename) if self.json_master_filename!="" else None
+            apply_bulk_edit(changes,master_path,self.get_tag_resolver())
+            if master_path!=None:
+                with open(master_path, 'r', encoding='utf-8') as f:
+                    self.master_jdata=json.load(f)
+        except Exception as e:
+            QMessageBox.critical(self, "エラー", f"bulk edit failed:\n{str(e)}")
+            return
+        self.get_tag_resolver().invalidate() #子フォルダの継承も変わる
+        self.update_tag_index([cc["path"] for cc in changes])
+        self.tags_changed.emit([cc["path"] for cc in changes])
+        self.refresh_list()
+        self.status_label.setText(f"bulk edit: {len(changes)} JSON files are written.")
+
     ##
     def set_sub_pyfile(self):
+        fileItem="*.py file..."
+        items=[fileItem]+[BUILTIN_PREFIX+nn+" : "+PLUGINS[nn][1] for nn in PLUGINS]
+        item,tf=QInputDialog().getItem(self,"sub *.py","select *.py file or builtin plugin.",items,0,False)
+        if not tf:
+            return
+        if item!=fileItem:
+            self.set_builtin_plugin(item.split(" : ")[0])
+            return
+
         file_path, _ = QFileDialog.getOpenFileName(
             self, "*.pyファイルを読み込み", 
             self.root_path, "Python Files (*.py)"
@@ -377,19 +585,61 @@ class ParameterTable(QWidget):
 
 
         res,tf=QInputDialog().getInt(self,"header row number","input header row length.",1) #,"","")
-        print(res)
         if tf:
             self.sub_py_filename=file_path
             self.skip_row=res
-            self.status_label.setText("Subprocess *.py is set."+str(self.skip_row))
+            self.use_inproc=False
+            if has_process_func(file_path):
+                reply=QMessageBox.question(self, "worker mode", 
+                                           "process(fullpath, relpath) is found.\nload *.py once into persistent workers?",
+                                           QMessageBox.Yes | QMessageBox.No)
+                self.use_inproc= reply==QMessageBox.Yes
+            self.status_label.setText("Subprocess *.py is set."+str(self.skip_row)+(" (in-process)" if self.use_inproc else ""))
         
+    def set_builtin_plugin(self,spec):
+        """組み込みpluginを選ぶ。paramsは"?col=1&start=2&end=30"のように続けて書く"""
+        res,tf=QInputDialog().getText(self,"builtin plugin","input plugin and params (e.g. "+spec+"?col=1&start=2&end=30).",text=spec)
+        if not tf:
+            return
+        try:
+            parse_plugin_spec(res)
+        except ValueError as e:
+            QMessageBox.warning(self, "builtin plugin", str(e))
+            return
+        self.sub_py_filename=res
+        self.skip_row=1 #pluginのヘッダーは1行
+        self.use_inproc=False
+        self.status_label.setText("Builtin plugin is set. "+res)
+
     def set_result_filename(self):
 
         res,tf=QInputDialog().getText(self,"result file name","input result file name.") #,"","")
-        print(res)
         if tf:
+            fmt,tf2=QInputDialog().getItem(self,"result format","select result file format.",list(RESULT_FORMATS),0,False)
             self.result_filename=res
-            self.status_label.setText("Result filename is set.")   
+            self.result_format=fmt if tf2 else "csv"
+            self.status_label.setText("Result filename is set. ("+self.result_format+")")   
+
+    def set_max_workers(self):
+        """並列数、失敗したフォルダのretry回数、timeout(秒。0はなし)を続けて聞く"""
+        res,tf=QInputDialog().getInt(self,"workers","input number of parallel sub *.py.",self.max_workers,1,os.cpu_count() or 1)
+        if not tf:
+            return
+        retries,tf=QInputDialog().getInt(self,"retries","run a failed folder again up to this many times.",self.retries,0,100)
+        if not tf:
+            return
+        timeout,tf=QInputDialog().getDouble(self,"timeout","kill the sub *.py of a folder after seconds (0: no timeout).\n"
+                                            "only for sub *.py run as a subprocess (not builtin plugins or persistent workers).",
+                                            self.timeout or 0.0,0.0,1e6,1)
+        if not tf:
+            return
+        self.max_workers=res
+        self.retries=retries
+        self.timeout=timeout if timeout>0 else None
+        text=f"workers: {self.max_workers}, retries: {self.retries}"
+        if self.timeout!=None:
+            text+=", timeout: "+format_seconds(self.timeout)
+        self.status_label.setText(text)
 
     def do_sup_py(self):
 
@@ -399,46 +649,96 @@ class ParameterTable(QWidget):
         if self.result_filename=="":
             QMessageBox.information(self, "fail", f"set result filename.")
             return
+        if self.thread.isRunning():
+            QMessageBox.information(self, "fail", "sub *.py is running.")
+            return
+        if self.timeout!=None and (is_builtin(self.sub_py_filename) or self.use_inproc):
+            #組み込みpluginと常駐workerの処理は途中で止められないので、timeoutは使えない(startExeJsonもValueError)
+            QMessageBox.information(self, "fail", "timeout is only for sub *.py run as a subprocess.\n"
+                                    "set timeout 0 in \"set workers\" for builtin plugins and persistent workers.")
+            return
 
         self.thread.setup(self.root_path,self.sub_py_filename,self.result_filename,self.json_filename, \
-                          self.skip_row,self.not_analysis_filename)
-
+                          self.skip_row,self.not_analysis_filename,self.max_workers,self.use_inproc,\
+                          self.incremental_btn.isChecked(),self.result_format,self.upsert_btn.isChecked(),\
+                          parse_query(self.tag_query_text) if self.only_matching_btn.isChecked() else None,\
+                          self.timeout,self.retries)
+
+        self.run_start=time.perf_counter()
+        self.cancel_sub_py_btn.setEnabled(True)
+        self.status_label.setText("counting folders...")
         self.thread.start()
-        self.thread.finished.connect(self.sub_py_finished)
 
+    def cancel_sub_py(self):
+        if self.thread.isRunning():
+            self.thread.cancel()
+            self.status_label.setText("cancelling...")
+
+
+    def on_only_matching_toggled(self,checked):
+        """onにしたときに、実行するフォルダのtagの条件を聞く"""
+        if not checked:
+            self.status_label.setText("run all folders.")
+            return
+        text,tf=QInputDialog().getText(self,"only matching","run folders whose tags match (tagA=2;tagB=a|b).",text=self.tag_query_text)
+        try:
+            if not tf or len(parse_query(text))==0:
+                raise ValueError("no condition")
+        except ValueError as e:
+            self.only_matching_btn.setChecked(False)
+            self.status_label.setText("only matching is off. "+str(e))
+            return
+        self.tag_query_text=text
+        self.status_label.setText("run only matching folders: "+text)
+
+    def set_tag_query_text(self,text):
+        """ツリーのtag filterの条件を、"only matching"の条件の初期値にする"""
+        self.tag_query_text=text
 
     def make_no_analysis_json(self):
         with open(os.path.join(self.current_path,self.not_analysis_filename),"w",encoding="utf-8") as f:
             f.write(self.not_analysis_filename)
         
+        self.tags_changed.emit([self.current_path])
         self.status_label.setText("This directory is not analyzed")
     
     def delete_no_analysis_json(self):
         os.remove(os.path.join(self.current_path,self.not_analysis_filename))
+        self.tags_changed.emit([self.current_path])
         self.status_label.setText("This directory is set to be analyzed.")
 
     #########################################################
     # utility for callback
     #########################################################
+    def on_sub_py_progress(self,done,total,relpath,seconds):
+        """終わったフォルダ数から、処理速度と残り時間を表示"""
+        elapsed=time.perf_counter()-self.run_start
+        rate= done/elapsed if elapsed>0 else 0.0
+        text=f"{done}/{total} folders, {rate:.2f} folders/s"
+        if rate>0:
+            text+=", ETA "+format_seconds((total-done)/rate)
+        if relpath!="":
+            text+=f", last: {relpath} ({seconds:.1f} s)"
+        self.status_label.setText(text)
+
     def sub_py_finished(self):
-        self.status_label.setText("Subprocess is finished.")
+        self.cancel_sub_py_btn.setEnabled(False)
+        summary=self.thread.summary
+        if "error" in summary:
+            self.status_label.setText("Subprocess is failed. "+summary["error"])
+        elif summary.get("cancelled"):
+            self.status_label.setText(f"Subprocess is cancelled. {summary['done']}/{summary['folders']} folders are written.")
+        else:
+            text="Subprocess is finished. "+format_seconds(time.perf_counter()-self.run_start)
+            if summary.get("failed",0)>0:
+                text+=f", {summary['failed']} folders failed (see {os.path.basename(summary['errors_log'])})"
+            self.status_label.setText(text)
 
     def get_table_dict(self,col):
         """"
         空のときは空のdictになる
         """
-        ret=dict()
-        for ii in range( self.table.rowCount() ):
-
-            if self.table.item(ii,0)!="" and self.table.item(ii,0)!=None: #itemAtはro,colを無視して0,0だけを返すらしい！
-                key=self.table.item(ii,0).text()
-                if key=="" or key==None:
-                    continue
-                value=self.table.item(ii,col).text()
-                value= "" if value==None else value
-                ret[key]=value
-
-        return ret
+        return self.tag_model.table_dict(col)
         
     def update_path(self, path):
         """パスを更新してリストを再構築"""
@@ -447,8 +747,6 @@ class ParameterTable(QWidget):
             self.current_path = path #os.path.realpath(path) 
             self.path_label.setText(f"current path: {path}")
             self.refresh_list() ##
-            print("refl"+str(path))
-            print(self.jdata)
     
     def refresh_list(self):
         """リストを更新"""
@@ -460,44 +758,77 @@ class ParameterTable(QWidget):
         
         try:
 
-            pathlist=get_diff_path_list(self.root_path,self.current_path)
-            self.jdata=get_overwrite_json_dict(pathlist,self.json_filename)
+            self.jdata=dict(self.get_tag_resolver().resolve(self.current_path))
+
+            #フォルダのscandirはGUIのthreadでしない(FileInfoWorkerがscan indexを更新する)。.noは1回のstatで見る
+            if self.not_analysis_filename!="" and os.path.exists(os.path.join(self.current_path,self.not_analysis_filename)):
+                self.path_label.setText(f"current path: {self.current_path} (no-analysis)")
 
-            self.table.setRowCount(0)
             self.add_json_to_table()
             
         except Exception as e:
             self.status_label.setText(f"rehresh list error {str(e)}")
     
-    def add_json_to_table(self):
-        """jsonをテーブルに追加"""
+    def get_tag_resolver(self):
+        """root pathかjson名が変わったときだけ、resolverを作り直す"""
+        if self.tag_resolver==None or self.tag_resolver.root_path!=norm_path(self.root_path) \
+            or self.tag_resolver.json_filename!=self.json_filename:
+            self.tag_resolver=TagResolver(self.root_path,self.json_filename)
+        return self.tag_resolver
+
+    def get_scan_index(self):
+        """
+        root pathかjson名が変わったときだけ、保存してあるscan indexを読み直す。
+        rootやjsonが未設定のときはNone
+        """
+        if self.root_path=="" or self.json_filename=="":
+            return None
+        if self.scan_index==None or self.scan_index.root_path!=self.root_path \
+            or self.scan_index.json_filename!=self.json_filename:
+            self.scan_index=ScanIndex(self.root_path,self.json_filename,self.not_analysis_filename)
+            self.scan_index.load()
+        return self.scan_index
+
+    def get_tag_index(self, refresh=False):
+        """
+        root pathかjson名が変わったときだけ、保存してあるtag indexを読み直す。
+        refreshのときは、scan indexとtag indexをrootからたどって更新し、保存する。
+        rootやjsonが未設定のときはNone
+        """
+        scan_index=self.get_scan_index()
+        if scan_index==None:
+            return None
+        if self.tag_index==None or self.tag_index.root_path!=self.root_path \
+            or self.tag_index.json_filename!=self.json_filename:
+            self.tag_index=TagIndex(self.root_path,self.json_filename,self.not_analysis_filename)
+            self.tag_index.load()
+        if refresh:
+            scan_index.refresh()
+            scan_index.save()
+            self.tag_index.refresh(scan_index)
+            self.tag_index.save()
+        return self.tag_index
+
+    def update_tag_index(self, paths):
+        """jsonを書いたフォルダと子孫のtagを、tag indexで解決し直す。indexがまだないときは何もしない"""
         try:
+            index=self.get_tag_index()
+            if index!=None and len(index.folders)>0:
+                index.update_folders(paths)
+                index.save()
+        except Exception as e:
+            print(f"tag index is not updated: {e}")
 
-            if len(self.jdata)==0:
-                return
-            #2樹追加防止のため、シグナルを一時切断
-            self.table.itemChanged.disconnect(self.on_cell_changed)
-            self.indexDict=dict()
-            
-            # テーブルに追加
-            for key,value in self.jdata.items():
-                #print(rr)
-                #key,value =rr
-                if key!=None and key!="":
-                    row = self.table.rowCount()
-                    self.table.insertRow(row)
-                    print("add"+str(row))
-                    
-                    self.table.setItem(row, 0, QTableWidgetItem(key))
-                    self.table.setItem(row, 1, QTableWidgetItem(value))
-                    self.indexDict[key]=row
-            
-            for key,value in self.indexDict.items():
-                ml=self.master_jdata.get(key)
-                if ml!=None:
-                    self.table.setItem(value, 2, QTableWidgetItem(str(ml)))         
-            #signal復旧
-            self.table.itemChanged.connect(self.on_cell_changed)
+    def add_json_to_table(self):
+        """
+        jsonをテーブルにセットする。前のフォルダとの差分の行だけ更新する。
+        自分のjsonのkeyと親の解決済みdictで、継承か上書きかを表示する
+        """
+        try:
+            resolver=self.get_tag_resolver()
+            own, _=resolver.own_dict(self.current_path)
+            parent_dict=resolver.resolve(os.path.dirname(self.current_path)) #rootの親は{}
+            self.tag_model.set_tags(self.jdata, own.keys(), parent_dict, self.master_jdata)
         except Exception as e:
             print(f"error in adding item to table: {e}")
     
@@ -511,9 +842,9 @@ class ParameterTable(QWidget):
             menu = QMenu()
             
             # ファイルパスを取得
-            path_item = self.table.item(row, 4)
-            if path_item:
-                file_path = path_item.text()
+            path_index = self.table.model().index(row, 4)  # path列があるとき
+            if path_index.isValid():
+                file_path = path_index.data()
                 
                 # 開くアクション
                 open_action = menu.addAction("開く")
@@ -557,183 +888,43 @@ class ParameterTable(QWidget):
         except Exception as e:
             QMessageBox.warning(self, "エラー", f"クリップボードへのコピーに失敗しました: {str(e)}")
 
-############
-# free functions
-############
-
-def get_overwrite_json_dict(pathlist,filename):
-    """
-    rootのfilenameのjsonをloadして、中間dir、currentdirのjsonを追記
-    """
-    jdict=dict()
-    for pp in pathlist:
-        if os.path.exists(os.path.join(pp, filename)):
-            with open(os.path.join(pp, filename), 'r', encoding='utf-8') as f:
-                jj = json.load(f)
-            #print(jj)
-            jdict=jj| jdict
-
-    return jdict
-
-def over_root_path(rootpath,tpath):
-    """
-    rootを超えたときTrue
-    """
-    comm=os.path.commonpath([rootpath,tpath])
-    return not os.path.samefile(comm,rootpath)
-
-def get_diff_path_list(root_path,current_path):
-    """
-    rootPathとcurrentPathの中間のパスのリストを返す。[current_dir,...,rootdir]
-    パスが無効なら[]
-    currentとrootが同じでもrootが入る。
-    """
-    pathList=[]
-    if os.path.exists(root_path) and os.path.exists(current_path):
-        
-        tpath= current_path #os.path.dirname(self.current_path)
-        if over_root_path(root_path,current_path): #親を超えたpathが指定された。エラー
-            return []
-
-        maxiter=20 #最大パス深さ
-        iter=0
-        while (not os.path.samefile(root_path,tpath) \
-               and (iter<maxiter) ): ## pathは==で比較しては行けない。同じパスでもtrueにならない
-            if over_root_path(root_path,tpath):
-                break
-
-            pathList.append(tpath)
-            #print(str(tpath))
-            tpath=os.path.dirname(tpath)
-            #print("->"+str(tpath))
-        pathList.append(root_path) #
-        return pathList
-    else:
-        print("root or current path is not valid(path-diff). "+root_path +"--"+current_path )
-        return []
-    
 ###############
 #Thread worker class for subprocess
 ###############
 class SubProcWorker(QThread):
     finished=Signal()
+    progress=Signal(int,int,str,float) #終わったフォルダ数, 全フォルダ数, relpath, そのフォルダの秒数
 
-    def setup(self,root_path,sub_py_filename, result_filename,json_filename, skip_row,not_analysis_file):
+    def setup(self,root_path,sub_py_filename, result_filename,json_filename, skip_row,not_analysis_file,max_workers=1,\
+              use_inproc=False,incremental=False,result_format="csv",upsert=False,tag_query=None,timeout=None,retries=0):
         self.root_path=root_path
         self.sub_py_filename=sub_py_filename
         self.result_filename=result_filename
         self.json_filename=json_filename
         self.skip_row=skip_row
         self.not_analysis_file=not_analysis_file
+        self.max_workers=max_workers
+        self.use_inproc=use_inproc
+        self.incremental=incremental
+        self.result_format=result_format
+        self.upsert=upsert
+        self.tag_query=tag_query
+        self.timeout=timeout
+        self.retries=retries
+        self.token=CancelToken()
+        self.summary=dict()
     
-    def run(self):
-        print("st")
-        startExeJson(self.root_path,self.sub_py_filename,self.result_filename,self.json_filename, self.skip_row,self.not_analysis_file)
-        self.finished.emit()
+    def cancel(self):
+        """実行中の子プロセスを止める。まとめファイルには終わったフォルダまでが残る"""
+        self.token.cancel()
 
-def startExeJson(root_path,sub_py_filename,result_filename,json_filename,skip_row,not_analysis_file):
-    """
-    *.pyの再帰実行のスタート。rootだけはファイルopen、ヘッダー出力がある。
-    fp は開いた状態で引数で受けて、呼び出し側がcloseする。
-    """
-    
-    with open(os.path.join(root_path, json_filename), 'r', encoding='utf-8') as f2:
-        jdata = json.load(f2)
-
-    subProcList=[]
-
-    fp=open(os.path.join(root_path,result_filename),'w+',encoding='utf-8')
-    
-    useHeader=[True] #subProcの間で共通の変数とする。最初にwriteしたときだけtrue。
-    for ff in os.listdir(root_path):
-        if os.path.isdir(os.path.join(root_path,ff)):
-            print("is-dir start "+ff)
-            recExeJson(subProcList,root_path,sub_py_filename,fp,os.path.join(root_path,ff),\
-                       json_filename,jdata,skip_row, useHeader,not_analysis_file)
-    for pp in subProcList:
-        pp.wait()
-    print("thread finished.")
-    fp.close() #全threadの終了を待ってfile close。
-
-def recExeJson(subProcList,root_path,sub_py_filename,fp,tpath,json_filename,jdata,skip_row,\
-               useHeader,not_analysis_file):
-    """
-    dierの子供のdirを再帰して、subprocを実行
-    skip_rowは*.pyが行ヘッダーあり出力のときに無視するヘッダ行数
-    """
-
-    #fp.write("recExe "+tpath+"\n")
-    print(tpath)
-    if not os.path.exists(os.path.join(tpath, not_analysis_file)):
-        pathlist= get_diff_path_list(root_path,tpath)
-        jdata=get_overwrite_json_dict(pathlist,json_filename)
-
-        print("rec-ok"+str(useHeader[0]))
-        ret=subProc(root_path,sub_py_filename,fp,tpath,jdata,skip_row,useHeader)
-
-        subProcList.append(ret)
-        ret.wait() #useHeader 更新まち
-    else:
-        print("not analysis dir. " +str(tpath))
-    
-
-    for ff in os.listdir(tpath):
-        if os.path.isdir(os.path.join(tpath,ff)):
-            print("isdir "+ff)
-            recExeJson(subProcList,root_path,sub_py_filename,fp,os.path.join(root_path,ff),\
-                       json_filename,jdata,skip_row, useHeader,not_analysis_file)
-
-def subProc(root_path,sub_py_filename,fp,tpath,jdata,skip_row,useHeader:list):
-    """
-    各フォルダで実行されるsubProc。指定した*.pyを呼び出す。
-    subprocのstdoutのfp.writeも行う。
-    生成したsubprocを返す。呼び出し側でwaitして、fp.closeのため。
-    """
-    relpath=os.path.relpath(tpath,start=root_path)
-
-#####
-    command=["python",sub_py_filename,tpath,relpath] #, self.sub_py_filename] #, "arg1", "arg2"]
-    print(command)
-
-    sp=subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL)
-    sout,errs=sp.communicate()
-    ol=sout.decode(encoding="utf-8")
-    olines=ol.splitlines()
-
-    keyCols=""
-    skip_row= skip_row if len(olines)>= skip_row else len(olines)
-    if (useHeader[0]==True) and (olines!=None) and (len(olines)!=0):
-        for jd in jdata.keys():
-
-            keyCols+=str(jd)+","
-            
-        keyCols+= "dir,"
-        reth=""
-        
-        for li in range(0,skip_row):
-            reth=keyCols+olines[li]
-            fp.write(reth+"\n")
-            print(olines)
-        
-        useHeader[0]=False
-    #else:
-    #    if useHeader[0] ==True:
-
-    for li in range(skip_row,len(olines)):
-        if olines[li] != "":
-
-            retl=""
-            for jd in jdata.values():
-                retl+=str(jd)+","
-
-            retl+=relpath+","
-            retl+=olines[li]
-            #print(relpath+","+ll )
-            #fp.write("wwww")
-            fp.write(retl+"\n") #+","+ll )
-
-    return sp
-
-
-
-    
\ No newline at end of file
+    def run(self):
+        try:
+            self.summary=startExeJson(self.root_path,self.sub_py_filename,self.result_filename,self.json_filename, \
+                                      self.skip_row,self.not_analysis_file,self.max_workers,self.use_inproc,self.incremental,\
+                                      self.result_format,progress_callback=self.progress.emit,token=self.token,\
+                                      upsert=self.upsert,tag_query=self.tag_query,timeout=self.timeout,retries=self.retries)
+        except Exception as e:
+            self.summary={"error":f"{type(e).__name__}: {e}"} #sub_py_finishedがステータスに出す
+        finally:
+            self.finished.emit()
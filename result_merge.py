@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+まとめcsvのupsert(追加・置き換え)。
+行のkeyは dir列(relpath) と file列(dirの次の列)。今回の実行で書いたフォルダの前回の行は、今回の行で置き換え、
+それ以外の前回の行は残す。
+前回のまとめcsvと今回の出力を、keyの順(dirはフォルダをたどる順、dirの中はfile名の順)のsorted mergeで
+1回ずつ読んで書く。まとめcsv全体はメモリに読まない(メモリは1フォルダ分)。
+keyの順になっていないファイル(手で追記したなど)は、最初の1回だけ外部sort(chunkごとに一時ファイル)する。
+同じkeyの中で、まったく同じ行(手で2回追記したなど)は1行にする。
+"""
+
+import os
+import heapq
+import shutil
+import tempfile
+from itertools import groupby
+
+
+def dir_key(relpath):
+    """dirのsort key。path要素のtupleにすると、フォルダをたどる順(親が先、子は名前順)になる"""
+    return tuple(relpath.replace("\\", "/").split("/"))
+
+
+class CsvKey:
+    """ヘッダーから dir列とfile列の位置を求め、行のkeyをつくる"""
+    def __init__(self, header_line):
+        names=[nn.strip() for nn in header_line.split(",")]
+        if "dir" not in names:
+            raise ValueError("dir column is not found in the header of the result")
+        self.dir_col=names.index("dir")
+        data_names=names[self.dir_col+1:]
+        self.file_col=self.dir_col+1+(data_names.index("file") if "file" in data_names else 0)
+
+    def dir_of(self, line):
+        cols=line.split(",", self.dir_col+1)
+        return dir_key(cols[self.dir_col]) if len(cols)>self.dir_col else ()
+
+    def __call__(self, line):
+        cols=line.split(",", self.file_col+1)
+        return (dir_key(cols[self.dir_col]) if len(cols)>self.dir_col else (),
+                cols[self.file_col] if len(cols)>self.file_col else "")
+
+
+def result_schema(result_path, header_rows=1):
+    """
+    前回のまとめcsvの(tagのkeyのリスト, sub *.pyのヘッダー行のリスト)。upsertで列をそろえる。
+    ファイルかdir列がなければ(None, None)
+    """
+    if not os.path.exists(result_path):
+        return None, None
+    with open(result_path, 'r', encoding='utf-8') as fp:
+        header=read_header(fp, header_rows)
+    if len(header)==0:
+        return None, None
+    names=header[0].split(",")
+    if "dir" not in names:
+        return None, None
+    dir_col=names.index("dir")
+    return names[:dir_col], [line.split(",", dir_col+1)[-1] if line.count(",")>dir_col else "" for line in header]
+
+def header_shift(old_header, new_header):
+    """
+    前回の行を今回のヘッダーにそろえるために、dir列の前に足す空の列の数。
+    今回のtagのkeyが前回のkeyのあとに足しただけで、sub *.pyの列が前回と同じか右に足しただけのとき。
+    そろえられなければNone
+    """
+    if len(old_header)!=len(new_header):
+        return None
+    old_names=old_header[0].split(",")
+    new_names=new_header[0].split(",")
+    if "dir" not in old_names or "dir" not in new_names:
+        return None
+    old_dir=old_names.index("dir")
+    new_dir=new_names.index("dir")
+    for old_line,new_line in zip(old_header, new_header):
+        oo=old_line.split(",", old_dir+1)
+        nn=new_line.split(",", new_dir+1)
+        if len(oo)!=old_dir+2 or len(nn)!=new_dir+2 or nn[:old_dir]!=oo[:old_dir] or nn[new_dir]!=oo[old_dir] \
+           or not is_same_columns(oo[-1], nn[-1]):
+            return None
+    return new_dir-old_dir
+
+def is_same_columns(old_line, new_line):
+    """new_lineのヘッダーが、old_lineと同じか、その右に列を足しただけならTrue"""
+    return new_line==old_line or new_line.startswith(old_line if old_line.endswith(",") else old_line+",")
+
+def read_header(fp, header_rows):
+    ret=[]
+    for _ in range(header_rows):
+        line=fp.readline()
+        if line=="":
+            break
+        ret.append(line.rstrip("\n"))
+    return ret
+
+def iter_rows(fp):
+    for line in fp:
+        line=line.rstrip("\n")
+        if line!="":
+            yield line
+
+def is_dir_ordered(path, header_rows, key):
+    """dirがフォルダをたどる順に並んでいればTrue(dirの中の順は見ない)"""
+    with open(path, 'r', encoding='utf-8') as fp:
+        read_header(fp, header_rows)
+        last=()
+        for line in iter_rows(fp):
+            dk=key.dir_of(line)
+            if dk<last:
+                return False
+            last=dk
+    return True
+
+def sorted_rows(path, header_rows, key, tmp_dir, chunk_rows):
+    """
+    ヘッダーのあとの行をkeyの順にyieldする。
+    dirの順に並んでいるファイル(まとめcsvはそう書かれる)は、フォルダごとにfile名でsortするだけ。
+    そうでないときは外部sort。どちらもsortはstable(同じkeyの行の順は変わらない)。
+    """
+    if is_dir_ordered(path, header_rows, key):
+        with open(path, 'r', encoding='utf-8') as fp:
+            read_header(fp, header_rows)
+            for _,group in groupby(iter_rows(fp), key=key.dir_of):
+                yield from sorted(group, key=key)
+        return
+
+    runs=[]
+    with open(path, 'r', encoding='utf-8') as fp:
+        read_header(fp, header_rows)
+        chunk=[]
+        for line in iter_rows(fp):
+            chunk.append(line)
+            if len(chunk)>=chunk_rows:
+                runs.append(write_run(sorted(chunk, key=key), tmp_dir, len(runs)))
+                chunk=[]
+        if len(chunk)>0:
+            runs.append(write_run(sorted(chunk, key=key), tmp_dir, len(runs)))
+    fps=[open(rr, 'r', encoding='utf-8') for rr in runs]
+    try:
+        yield from heapq.merge(*[iter_rows(fp) for fp in fps], key=key) #同じkeyは先のrunが先
+    finally:
+        for fp in fps:
+            fp.close()
+
+def write_run(lines, tmp_dir, ii):
+    path=os.path.join(tmp_dir, "run"+str(ii)+".txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line+"\n")
+    return path
+
+def upsert_csv(result_path, new_path, ran_dirs, header_rows=1, chunk_rows=200000):
+    """
+    new_path(今回の出力)をresult_path(前回のまとめcsv)にupsertし、new_pathは消す。
+    ran_dirs:今回書いたフォルダのrelpath。前回の行のうち、このフォルダの行は消える。
+    ヘッダーは今回のもの。今回のtagのkeyが前回のkeyのあとに足しただけなら、前回の行はdir列の前に空の列を入れてそろえる。
+    sub *.pyの列が前回の右に足しただけなら、前回の行はその列が空になるだけなのでよい。
+    そろえられないとき(列の順が違うなど)はValueError。
+    {"kept":残した前回の行数, "replaced":消した前回の行数, "written":今回の行数, "duplicates":消した同じ行の数}を返す。
+    """
+    with open(new_path, 'r', encoding='utf-8') as fp:
+        new_header=read_header(fp, header_rows)
+    old_header=None
+    shift=0
+    if os.path.exists(result_path):
+        with open(result_path, 'r', encoding='utf-8') as fp:
+            old_header=read_header(fp, header_rows)
+        if len(new_header)==0: #今回の行がない
+            new_header=old_header
+        elif len(old_header)>0:
+            shift=header_shift(old_header, new_header)
+            if shift==None:
+                raise ValueError("header of the result is changed. run without upsert to rewrite the result: "+result_path)
+    if len(new_header)<max(1, header_rows):
+        if old_header==None:
+            os.replace(new_path, result_path)
+        else:
+            os.remove(new_path)
+        return {"kept":0, "replaced":0, "written":0, "duplicates":0}
+
+    key=CsvKey(new_header[0])
+    ran={dir_key(dd) for dd in ran_dirs}
+    stats={"kept":0, "replaced":0, "written":0, "duplicates":0}
+
+    def old_rows(rows):
+        for line in rows:
+            if shift>0: #tagの列が増えた
+                cols=line.split(",", old_key.dir_col)
+                line=",".join(cols[:old_key.dir_col]+[""]*shift+cols[old_key.dir_col:])
+            if key.dir_of(line) in ran:
+                stats["replaced"]+=1
+            else:
+                stats["kept"]+=1
+                yield line
+
+    def new_rows(rows):
+        for line in rows:
+            stats["written"]+=1
+            yield line
+
+    tmp_dir=tempfile.mkdtemp(prefix="edta_merge_")
+    tmp_path=result_path+".tmp"
+    try:
+        streams=[new_rows(sorted_rows(new_path, header_rows, key, tmp_dir, chunk_rows))]
+        if old_header:
+            old_key=CsvKey(old_header[0]) if shift>0 else key
+            streams.insert(0, old_rows(sorted_rows(result_path, header_rows, old_key, tmp_dir, chunk_rows)))
+        with open(tmp_path, 'w', encoding='utf-8', buffering=1<<20) as f:
+            for line in new_header:
+                f.write(line+"\n")
+            last_key=None
+            seen=set() #同じkeyの行
+            for line in heapq.merge(*streams, key=key):
+                kk=key(line)
+                if kk!=last_key:
+                    last_key=kk
+                    seen.clear()
+                elif line in seen:
+                    stats["duplicates"]+=1
+                    continue
+                seen.add(line)
+                f.write(line+"\n")
+        os.replace(tmp_path, result_path)
+        os.remove(new_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return stats
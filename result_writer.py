@@ -0,0 +1,620 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+まとめファイルのwriter。
+sub *.pyの出力を1行ずつ受け取り、tagの列とdirを前につけて書く。行はためないので、出力が大きくてもメモリは一定。
+組み込みplugin(builtin_plugins.py)の行は、文字列ではなく値のtupleのまま受け取る(write_header_row, write_row)。
+csvのほかに、列ごとの型がついたbinary(parquet, arrow IPC, numpy .npz)でも書ける。
+"""
+
+import os
+import shutil
+import tempfile
+import zipfile
+
+RESULT_FORMATS=("csv", "parquet", "arrow", "npz")
+
+
+class CsvResultWriter:
+    """
+    まとめcsvのwriter。列は、すべてのフォルダの列の和(schema)にそろえる。無い列は空。
+    tagの列はtag_keys(実行するフォルダのkeyの和。tag_key_union)の順。Noneのときは最初のフォルダのkey
+    (ほかのフォルダにしかないkeyは書かない)。列の位置が行ごとにずれないので、dir列をkeyにできる(upsert)。
+    sub *.pyの列は、ヘッダー(1行目)の列名で合わせる。フォルダごとに1度だけ、列名から列の位置のmapをつくる。
+    列名がschemaの先頭と同じフォルダの行は、分けずに文字列のまま書き、足りない列の","だけを足す。
+    そうでないフォルダの行だけ分けてmapの位置に並べる。新しい列名はschemaの右に足す。
+    ヘッダーより長い行の余りの値(列名がない)は、列名で合わせられないので、そのまま後ろに書く。
+    ヘッダーを書いたあとで列が増えたときは、close()でヘッダーを書き直し、列が増える前に書いた行には
+    足りない列の","を足す(列が増えたあとの行はbyteのままcopyする)。
+    headerは、前回のまとめのsub *.pyのヘッダー行(upsert)。schemaをそこから始める。
+    """
+    def __init__(self, result_path, buffer_size=1<<20, tag_keys=None, header=None):
+        self.result_path=result_path
+        self.fp=open(result_path, 'w', encoding='utf-8', buffering=buffer_size)
+        self.tag_keys=list(tag_keys) if tag_keys!=None else None
+        self.names=None       #sub *.pyの列名のschema
+        self.header_cells=[]  #ヘッダー行ごとの、schemaの列の文字列
+        self.trailing=False   #ヘッダーの行末が","(sub_print_csv.pyなど)
+        self.name_index=dict() #(列名, 同じ名前の何番目か): schemaの位置
+        self.useHeader=True
+        self.header_end=0 #ヘッダーの終わりの位置(byte)
+        self.header_width=0 #書いたヘッダーの列数
+        self.segments=[]  #(位置, 列数)。ヘッダーを書いたあとで列が増えた位置と、そこからの行の列数
+        self.tracked=set() #close()で書き直したときに、移った先を知りたい位置(shardの記録)
+        self.moved=None    #close()で書き直したときの{前の位置: 新しい位置}
+        self.keyCols=""
+        self.prefix=""
+        self.colmap=None #このフォルダの列のschemaの位置。Noneは、schemaの先頭と同じ(文字列のまま書く)
+        self.pad=""      #このフォルダの行に足す","
+        self.width=0     #このフォルダのヘッダーの列数
+        if header:
+            self.merge_names(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def begin_folder(self, jdata, relpath):
+        """フォルダごとに、行の前につける文字列を1度だけつくる"""
+        if self.tag_keys==None:
+            self.tag_keys=list(jdata.keys())
+        self.keyCols="".join(str(kk)+"," for kk in self.tag_keys)+"dir,"
+        self.prefix="".join(str(jdata.get(kk, ""))+"," for kk in self.tag_keys)+relpath+","
+        self.colmap=None
+        self.pad=""
+        self.width=0
+
+    def merge_names(self, header_lines):
+        """フォルダのヘッダー行をschemaに足し、このフォルダの列のmapをつくる"""
+        names=header_lines[0].split(",")
+        trailing=False
+        while len(names)>0 and names[-1]=="": #行末の","
+            names.pop()
+            trailing=True
+        cells=[line.split(",") for line in header_lines]
+        if self.names==None:
+            self.names=[]
+            self.header_cells=[[] for _ in header_lines]
+            self.trailing=trailing
+        colmap=[]
+        seen=dict()
+        for ii,nn in enumerate(names):
+            kk=(nn, seen.get(nn, 0))
+            seen[nn]=kk[1]+1
+            if kk not in self.name_index:
+                self.name_index[kk]=len(self.names)
+                self.names.append(nn)
+                for jj,row in enumerate(self.header_cells):
+                    row.append(cells[jj][ii] if jj<len(cells) and ii<len(cells[jj]) else "")
+            colmap.append(self.name_index[kk])
+        self.width=len(names)
+        if colmap==list(range(len(colmap))):
+            self.colmap=None
+            self.pad=","*(len(self.names)-len(names))
+        else:
+            self.colmap=colmap
+
+    def header_text(self):
+        """schemaのヘッダー行"""
+        end="," if self.trailing else ""
+        return "".join(self.keyCols+",".join(row)+end+"\n" for row in self.header_cells)
+
+    def write_header(self, header_lines):
+        if len(header_lines)==0:
+            return
+        self.merge_names(header_lines)
+        if self.useHeader:
+            if self.colmap==None and self.pad=="" and len(header_lines)==len(self.header_cells):
+                for line in header_lines: #最初のフォルダのヘッダーはそのまま
+                    self.fp.write(self.keyCols+line+"\n")
+            else:
+                self.fp.write(self.header_text())
+            self.useHeader=False
+            self.header_end=self.fp.tell()
+            self.header_width=len(self.names)
+        elif len(self.names)>(self.segments[-1][1] if self.segments else self.header_width):
+            self.segments.append((self.fp.tell(), len(self.names)))
+
+    def write_line(self, line):
+        #ヘッダーより長い行は、足りない列の","のあとに余りの値を書くので分ける
+        if self.colmap==None and (self.pad=="" or line.count(",")<=self.width):
+            self.fp.write(self.prefix+line+self.pad+"\n")
+            return
+        colmap=self.colmap if self.colmap!=None else range(self.width)
+        fields=line.split(",")
+        row=[""]*len(self.names)
+        for ii,ff in zip(colmap, fields):
+            row[ii]=ff
+        rest=fields[len(colmap):]
+        while len(rest)>0 and rest[-1]=="":
+            rest.pop()
+        self.fp.write(self.prefix+",".join(row+rest)+("," if self.trailing else "")+"\n")
+
+    def write_header_row(self, names):
+        """pluginのヘッダー(列名のtuple)"""
+        self.write_header([",".join(str(nn) for nn in names)])
+
+    def write_row(self, values):
+        """pluginの値の行。Noneは空"""
+        self.write_line(",".join("" if vv==None else str(vv) for vv in values))
+
+    def position(self):
+        """今の書き込み位置(byte)。shardの記録用"""
+        return self.fp.tell()
+
+    def mark_folder(self):
+        """discard_folder()で戻る位置を覚える"""
+        self.mark=(self.fp.tell(), self.useHeader, len(self.names) if self.names!=None else None, len(self.segments))
+
+    def discard_folder(self):
+        """mark_folder()からあとに書いた行を消す(途中で止めたフォルダ)。足した列名も消す"""
+        pos, self.useHeader, width, nsegments=self.mark
+        self.fp.seek(pos)
+        self.fp.truncate()
+        del self.segments[nsegments:]
+        if width==None:
+            self.names=None
+            self.header_cells=[]
+            self.name_index=dict()
+        elif width<len(self.names):
+            del self.names[width:]
+            for row in self.header_cells:
+                del row[width:]
+            self.name_index={kk:ii for kk,ii in self.name_index.items() if ii<width}
+
+    def end_folder(self):
+        pass
+
+    def new_position(self, pos):
+        """close()の前の位置posの、close()のあとの位置。書き直したときはtrackedの位置とheader_endだけ"""
+        return pos if self.moved==None else self.moved[pos]
+
+    def close(self):
+        self.fp.close()
+        if self.useHeader or len(self.names)==self.header_width:
+            return
+        #ヘッダーのあとで列が増えた。増えた列は右に足したので、前の行はその列数のあとに足りない列の","を入れればそろう
+        final=len(self.names)
+        bounds=[(self.header_end, self.header_width)]+self.segments+[(os.path.getsize(self.result_path), final)]
+        self.moved=dict()
+        tmp_path=self.result_path+".tmp"
+        with open(self.result_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            dst.write(self.header_text().encode('utf-8'))
+            src.seek(self.header_end)
+            for (start,width),(end,_) in zip(bounds, bounds[1:]):
+                base=dst.tell()
+                if width==final: #最後の区間はそのままcopy
+                    self.moved.update((pp, base+pp-start) for pp in self.tracked|{start} if start<=pp<=end)
+                    shutil.copyfileobj(src, dst, 1<<20)
+                    break
+                pad=b","*(final-width)
+                ncols=len(self.tag_keys)+1+width
+                pos=start
+                while pos<end:
+                    if pos in self.tracked or pos==start:
+                        self.moved[pos]=dst.tell()
+                    line=src.readline()
+                    pos+=len(line)
+                    dst.write(pad_line(line, ncols, pad))
+        os.replace(tmp_path, self.result_path)
+        self.header_end=self.moved[self.header_end]
+
+
+class ColumnarResultWriter:
+    """
+    列ごとに型をつけて書くwriterの共通部分。
+    tagのkeyとdirはcategorical(整数codeとcategoryのリスト)、sub *.pyの列は数値ならfloat64、それ以外は文字列。
+    tagの列はtag_keys(Noneのときは最初のフォルダのkey)。sub *.pyの列はヘッダー(1行目)の列名で合わせ、
+    新しい列名は右に足す。列の型は、その列が最初に入ったchunkの値で決める。前のchunkのその列は空(nan, null)。
+    あとのchunkで数値にできない値が出たfloatの列は、文字列の列に変える(書いたchunkのその列は数値の文字列にする)。
+    chunk_rows行たまるごとに、フォルダの区切りでchunkを書く。
+    """
+    def __init__(self, result_path, chunk_rows=65536, tag_keys=None):
+        self.result_path=result_path
+        self.chunk_rows=chunk_rows
+        self.tag_keys=list(tag_keys) if tag_keys!=None else None #tagの列のkey
+        self.data_names=None #sub *.pyの列名
+        self.colmap=None     #このフォルダの列のdata_namesの位置。Noneは先頭と同じ
+        self.float_cols=None #data列ごとにfloatならTrue
+        self.categories=dict() #列名: {値:code}
+        self.codes=None      #tagとdirの列ごとのcodeのリスト(chunk分)
+        self.values=None     #data列ごとの文字列のリスト(chunk分)
+        self.nrows=0
+        self.folder_codes=()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def category_code(self, col, value):
+        cat=self.categories.setdefault(col, dict())
+        code=cat.get(value)
+        if code==None:
+            code=len(cat)
+            cat[value]=code
+        return code
+
+    def begin_folder(self, jdata, relpath):
+        if self.codes==None:
+            if self.tag_keys==None:
+                self.tag_keys=[str(jd) for jd in jdata.keys()]
+            self.codes=[[] for _ in range(len(self.tag_keys)+1)]
+        self.colmap=None
+        #フォルダのtagとdirのcodeは1度だけ求める。tag_keysにないkeyは書かない
+        codes=[]
+        for key in self.tag_keys:
+            codes.append(self.category_code(key, str(jdata[key])) if key in jdata else -1)
+        codes.append(self.category_code("dir", relpath))
+        self.folder_codes=codes
+
+    def write_header(self, header_lines):
+        if len(header_lines)>0:
+            self.merge_names([nn.strip() for nn in header_lines[0].split(",")])
+
+    def merge_names(self, names):
+        """フォルダの列名をdata_namesに足し、このフォルダの列のmapをつくる"""
+        names=self.unique_names(names)
+        if self.data_names==None:
+            self.data_names=names
+            return
+        colmap=[]
+        for nn in names:
+            if nn not in self.data_names:
+                self.data_names.append(nn)
+                if self.values!=None:
+                    self.values.append([""]*self.nrows)
+            colmap.append(self.data_names.index(nn))
+        if colmap!=list(range(len(colmap))):
+            self.colmap=colmap
+
+    def unique_names(self, names):
+        """末尾の空の列名(行末の",")は除き、tagのkeyと重なる列名には_をつける"""
+        while len(names)>0 and names[-1]=="":
+            names.pop()
+        used=set(self.tag_keys)|{"dir"}
+        ret=[]
+        for ii,nn in enumerate(names):
+            nn= nn if nn!="" else "c"+str(ii)
+            while nn in used:
+                nn+="_"
+            used.add(nn)
+            ret.append(nn)
+        return ret
+
+    def write_header_row(self, names):
+        self.merge_names([str(nn) for nn in names])
+
+    def write_line(self, line):
+        self.write_row(line.split(","))
+
+    def write_row(self, fields):
+        """値の行。pluginの値は型のまま(Noneは空)、sub *.pyの行は文字列"""
+        if self.data_names==None: #ヘッダーがないsub *.py
+            self.data_names=self.unique_names(["c"+str(ii) for ii in range(len(fields))]+[""])
+        if self.values==None:
+            self.values=[[] for _ in self.data_names]
+        if self.colmap!=None:
+            row=[""]*len(self.data_names)
+            for ii,ff in zip(self.colmap, fields):
+                row[ii]=ff
+            fields=row
+
+        for col,code in zip(self.codes,self.folder_codes):
+            col.append(code)
+        for ii,col in enumerate(self.values):
+            col.append(fields[ii] if ii<len(fields) and fields[ii]!=None else "") #列が足りないときは空
+        self.nrows+=1
+
+    def mark_folder(self):
+        self.mark=(self.nrows, len(self.data_names) if self.data_names!=None else None)
+
+    def discard_folder(self):
+        """mark_folder()からあとの行と、足した列名を消す"""
+        nrows,width=self.mark
+        for col in self.codes:
+            del col[nrows:]
+        for col in (self.values or []):
+            del col[nrows:]
+        self.nrows=nrows
+        if width==None:
+            self.data_names=None
+            self.values=None
+        elif width<len(self.data_names):
+            del self.data_names[width:]
+            if self.values!=None:
+                del self.values[width:]
+
+    def end_folder(self):
+        if self.nrows>=self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self.nrows==0:
+            return
+        import numpy as np
+
+        if self.float_cols==None:
+            self.float_cols=[]
+        #列の型は、その列が最初に入ったchunkで決める。数値にできない値が出たら文字列に変える
+        columns=[]
+        for col in self.codes:
+            columns.append(np.asarray(col, dtype=np.int32))
+        for ii,col in enumerate(self.values):
+            arr=to_float_array(col) if ii>=len(self.float_cols) or self.float_cols[ii] else None
+            if ii>=len(self.float_cols):
+                self.float_cols.append(arr is not None)
+            elif arr is None:
+                self.float_cols[ii]=False
+            columns.append(arr if arr is not None else np.asarray([str(vv) for vv in col], dtype=object))
+        self.write_chunk(columns)
+
+        self.codes=[[] for _ in self.codes]
+        self.values=[[] for _ in self.values]
+        self.nrows=0
+
+    def category_names(self):
+        return self.tag_keys+["dir"]
+
+    def category_list(self, name):
+        """codeの順のcategoryのリスト"""
+        return list(self.categories.get(name, dict()).keys())
+
+    def write_chunk(self, columns):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class ArrowResultWriter(ColumnarResultWriter):
+    """parquetかarrow IPC(feather v2)で書く。chunkごとにrecord batch(parquetはrow group)になる。pyarrowが必要"""
+    def __init__(self, result_path, file_format="parquet", chunk_rows=65536, tag_keys=None):
+        super().__init__(result_path, chunk_rows, tag_keys)
+        import pyarrow
+        self.pa=pyarrow
+        self.file_format=file_format
+        self.schema=None
+        self.schema_floats=None #schemaのdata列ごとにfloatならTrue
+        self.writer=None
+
+    def open_writer(self):
+        pa=self.pa
+        fields=[pa.field(nn, pa.dictionary(pa.int32(), pa.string())) for nn in self.category_names()]
+        for nn,isf in zip(self.data_names,self.float_cols):
+            fields.append(pa.field(nn, pa.float64() if isf else pa.string()))
+        self.schema=pa.schema(fields)
+        self.schema_floats=list(self.float_cols)
+        if self.file_format=="parquet":
+            import pyarrow.parquet
+            self.writer=pyarrow.parquet.ParquetWriter(self.result_path, self.schema)
+        else:
+            #categoryはchunkごとに増えるので、dictionaryは差分(delta)で書く
+            self.writer=pa.ipc.new_file(self.result_path, self.schema, \
+                                        options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    def read_batches(self, path):
+        if self.file_format=="parquet":
+            import pyarrow.parquet
+            yield from pyarrow.parquet.ParquetFile(path).iter_batches()
+        else:
+            with self.pa.memory_map(path) as source:
+                reader=self.pa.ipc.open_file(source)
+                for ii in range(reader.num_record_batches):
+                    yield reader.get_batch(ii)
+
+    def extend_schema(self):
+        """
+        書いたあとで列が増えたか、floatの列が文字列に変わった。
+        書いたchunkを、増えた列をnullにし、変わった列は文字列にcastして、新しいschemaのファイルに書き直す
+        """
+        pa=self.pa
+        self.writer.close()
+        old_path=self.result_path+".old"
+        os.replace(self.result_path, old_path)
+        self.open_writer()
+        try:
+            for batch in self.read_batches(old_path):
+                arrays=[self.cast_column(col, ff.type) for col,ff in zip(batch.columns, self.schema)]
+                arrays+=[pa.nulls(batch.num_rows, ff.type) for ff in list(self.schema)[len(arrays):]]
+                self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        finally:
+            os.remove(old_path)
+
+    def cast_column(self, col, data_type):
+        """書いたchunkの列を新しいschemaの型に。文字列に変わったfloatの列のnan(空のセル)は、文字列の列と同じ空文字列"""
+        pa=self.pa
+        if col.type==pa.float64() and data_type==pa.string():
+            import pyarrow.compute as pc
+            return pc.if_else(pc.is_nan(col), "", col.cast(pa.string()))
+        return col.cast(data_type)
+
+    def write_chunk(self, columns):
+        pa=self.pa
+        if self.schema==None:
+            self.open_writer()
+        elif len(columns)>len(self.schema) or self.float_cols[:len(self.schema_floats)]!=self.schema_floats:
+            self.extend_schema()
+
+        arrays=[]
+        ncat=len(self.category_names())
+        for ii,col in enumerate(columns):
+            if ii<ncat:
+                indices=pa.array(col, type=pa.int32(), mask=(col<0))
+                dictionary=pa.array(self.category_list(self.category_names()[ii]), type=pa.string())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+            elif col.dtype==object:
+                arrays.append(pa.array(col, type=pa.string()))
+            else:
+                arrays.append(pa.array(col, type=pa.float64()))
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        super().close()
+        if self.writer!=None:
+            self.writer.close()
+
+
+class NpzResultWriter(ColumnarResultWriter):
+    """
+    numpyの.npzで書く。zipには追記できないので、chunkは列ごとの一時ファイルに.npyを続けて書き、
+    closeで列ごとに、chunkを順に読んで1つの配列としてzipに書く(メモリにあるのは1つのchunkの1列だけ)。
+    tagとdirは"列名"にint32のcode(無いときは-1)、"列名.categories"にcategoryの配列。
+    """
+    def __init__(self, result_path, chunk_rows=65536, tag_keys=None):
+        super().__init__(result_path, chunk_rows, tag_keys)
+        import numpy
+        self.np=numpy
+        self.part_dir=None #列ごとの一時ファイルのフォルダ
+        self.parts=[]      #列ごとの(一時ファイル, その列が増える前の行数)
+        self.total=0       #書いたchunkの行数
+
+    def write_chunk(self, columns):
+        np=self.np
+        if self.part_dir==None:
+            self.part_dir=tempfile.mkdtemp(prefix=os.path.basename(self.result_path)+".",
+                                           dir=os.path.dirname(os.path.abspath(self.result_path)))
+        for ii,col in enumerate(columns):
+            if ii==len(self.parts):
+                self.parts.append((os.path.join(self.part_dir, str(ii)+".npy"), self.total))
+            with open(self.parts[ii][0], 'ab') as f:
+                np.lib.format.write_array(f, col.astype(str) if col.dtype==object else col, allow_pickle=False)
+        self.total+=len(columns[0])
+
+    def read_parts(self, path, isf):
+        """一時ファイルのchunkを順に返す。文字列に変わった列の、floatで書いたchunkは文字列にする"""
+        np=self.np
+        size=os.path.getsize(path)
+        with open(path, 'rb') as f:
+            while f.tell()<size:
+                arr=np.lib.format.read_array(f, allow_pickle=False)
+                yield float_strings(arr) if not isf and arr.dtype==np.float64 else arr
+
+    def write_column(self, zf, name, path, start, dtype):
+        """列の.npyをzipに書く。ヘッダーのshapeは全行数で、列が増える前の行(start行)は空(nanか"")"""
+        np=self.np
+        if dtype is None: #文字列の列の長さは、すべてのchunkの最大(np.dtype==NoneはTrueになる)
+            dtype=np.dtype(str)
+            for arr in self.read_parts(path, False):
+                dtype=max(dtype, arr.dtype, key=lambda dd: dd.itemsize)
+        with zf.open(name+".npy", 'w', force_zip64=True) as f:
+            np.lib.format.write_array_header_2_0(f, {"descr":np.lib.format.dtype_to_descr(dtype),
+                                                     "fortran_order":False, "shape":(self.total,)})
+            for pos in range(0, start, self.chunk_rows):
+                empty=np.nan if dtype==np.float64 else ""
+                f.write(np.full(min(self.chunk_rows, start-pos), empty, dtype=dtype).tobytes())
+            for arr in self.read_parts(path, dtype==np.float64 or dtype==np.int32):
+                f.write(arr.astype(dtype, copy=False).tobytes())
+
+    def close(self):
+        super().close()
+        np=self.np
+        ncat=len(self.category_names()) if self.tag_keys!=None else 0
+        try:
+            #列名に"file"があるとnp.savezの引数と重なるので、savezと同じ形式でzipに直接書く
+            with zipfile.ZipFile(self.result_path, 'w', zipfile.ZIP_STORED) as zf:
+                if len(self.parts)==0:
+                    return
+                names=self.category_names()+self.data_names
+                for ii,(nn,(path,start)) in enumerate(zip(names, self.parts)):
+                    dtype=np.dtype(np.int32) if ii<ncat else np.dtype(np.float64) if self.float_cols[ii-ncat] else None
+                    self.write_column(zf, nn, path, start, dtype)
+                for nn in self.category_names():
+                    with zf.open(nn+".categories.npy", 'w', force_zip64=True) as f:
+                        np.lib.format.write_array(f, np.asarray(self.category_list(nn), dtype=str), allow_pickle=False)
+        finally:
+            if self.part_dir!=None:
+                shutil.rmtree(self.part_dir, ignore_errors=True)
+
+
+def pad_line(line, ncols, pad):
+    """
+    まとめcsvの1行(bytes。改行つき)のncols列のあとにpad(足りない列の",")を入れる。
+    ncols列より長い行(ヘッダーより長い行の余りの値)は、余りをpadの右にする(余りは名前のある列に入れない)
+    """
+    body=line.rstrip(b"\r\n")
+    end=line[len(body):]
+    count=body.count(b",")
+    if count<ncols or (count==ncols and body.endswith(b",")): #余りがない(行末の","だけ)
+        return body+pad+end
+    cells=body.split(b",", ncols)
+    return b",".join(cells[:ncols])+pad+b","+cells[ncols]+end
+
+def to_float_array(values):
+    """
+    文字列(か数値)のリストをfloat64の配列に。空の値はnan。
+    空でない値にfloatにできないものがあればNone(文字列の列)。pluginの数値はそのまま
+    """
+    import numpy as np
+    try:
+        return np.asarray(values, dtype=np.float64) #まとめて変換できるときは速い
+    except ValueError:
+        ret=np.empty(len(values), dtype=np.float64)
+        for ii,vv in enumerate(values):
+            if isinstance(vv, str) and vv.strip()=="":
+                ret[ii]=np.nan
+                continue
+            try:
+                ret[ii]=float(vv)
+            except ValueError:
+                return None
+        return ret
+
+def float_strings(arr):
+    """float64の配列を文字列の配列に(文字列に変わった列の、前に書いたchunk)。nanは空。1.0は1"""
+    import numpy as np
+    ret=[]
+    for vv in arr.tolist():
+        text="" if vv!=vv else repr(vv)
+        ret.append(text[:-2] if text.endswith(".0") else text)
+    return np.asarray(ret, dtype=str)
+
+def tag_key_union(jdatas, keys=()):
+    """tagのkeyの和。keys(前回のまとめの列など)のあとに、出てきた順に足す"""
+    ret=dict.fromkeys(str(kk) for kk in keys)
+    for jdata in jdatas:
+        for kk in jdata.keys():
+            ret.setdefault(str(kk))
+    return list(ret)
+
+def result_file_path(result_path, result_format):
+    """csv以外は、まとめファイル名の拡張子を形式の拡張子にする"""
+    if result_format=="csv":
+        return result_path
+    return os.path.splitext(result_path)[0]+"."+result_format
+
+def check_result_format(result_format):
+    """
+    result_formatに要るmoduleをimportする(csv以外はnumpy、parquetとarrowはpyarrowも)。
+    無い形式や入っていないmoduleは、フォルダを実行する前にValueErrorかImportError
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError("unknown result format: "+str(result_format))
+    if result_format=="csv":
+        return
+    import numpy
+    if result_format=="parquet":
+        import pyarrow.parquet
+    elif result_format=="arrow":
+        import pyarrow.ipc
+
+def make_result_writer(result_path, result_format="csv", tag_keys=None, header=None):
+    """
+    result_formatのwriterをつくる。result_pathはresult_file_path()で変換したもの。
+    tag_keysはtagの列のkey(tag_key_union)。headerは前回のまとめcsvのsub *.pyのヘッダー行(upsert。csvだけ)
+    """
+    check_result_format(result_format)
+    if result_format=="csv":
+        return CsvResultWriter(result_path, tag_keys=tag_keys, header=header)
+    if result_format in ("parquet", "arrow"):
+        return ArrowResultWriter(result_path, result_format, tag_keys=tag_keys)
+    if result_format=="npz":
+        return NpzResultWriter(result_path, tag_keys=tag_keys)
+    raise ValueError("unknown result format: "+str(result_format))
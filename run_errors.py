@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+フォルダごとの失敗の記録。
+sub *.pyの失敗(時間切れ、exit codeが0でない、process()や組み込みpluginの例外)は、そのフォルダだけを失敗にして
+実行を続ける。失敗した試行とstderrは、まとめファイルの横の"*.errors.log"に、
+最後まで失敗したフォルダは"*.failed.json"に書く。failed.jsonのフォルダだけを実行し直せる(load_failed)。
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import traceback
+
+STDERR_LIMIT=1<<16 #logに残すstderrの長さ(末尾)
+
+
+class FolderFailed(Exception):
+    """フォルダのsub *.pyの失敗。reasonは1行の理由、stderrは子プロセスのstderr(例外ならtraceback)"""
+    def __init__(self, reason, stderr=""):
+        super().__init__(reason)
+        self.reason=reason
+        self.stderr=stderr
+
+
+def error_paths(result_path):
+    """(error logのpath, 失敗したフォルダのリストのpath)"""
+    return result_path+".errors.log", result_path+".failed.json"
+
+def error_text(e):
+    """(理由, 詳細)。worker processの例外は、processの中のtracebackも入る"""
+    if isinstance(e, FolderFailed):
+        return e.reason, e.stderr
+    return f"{type(e).__name__}: {e}", "".join(traceback.format_exception(type(e), e, e.__traceback__))
+
+def guard_rows(rows):
+    """組み込みpluginの行のgenerator。pluginの例外はFolderFailedにする(書き込みの例外はそのまま)"""
+    try:
+        yield from rows
+    except Exception as e:
+        raise FolderFailed(*error_text(e))
+
+def load_failed(result_path):
+    """前回の実行で失敗したフォルダのrelpathのリスト。なければ[]"""
+    try:
+        with open(error_paths(result_path)[1], 'r', encoding='utf-8') as f:
+            return [ff["relpath"] for ff in json.load(f).get("folders", [])]
+    except (OSError, ValueError):
+        return []
+
+
+def write_failed(failed_path, failed):
+    """失敗したフォルダのリスト({"relpath","reason"})を書く。空なら前回のリストを消す"""
+    if len(failed)==0:
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        return
+    tmp_path=failed_path+".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"folders":failed}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, failed_path)
+
+def merge_error_files(result_path, part_paths, remove=False):
+    """
+    分割実行(shard)の部分まとめごとのerror logとfailed.jsonを、result_pathのものにまとめる。
+    まとめたfailed.jsonは、分けないで実行したときと同じにload_failed(result_path)で読める(--rerun-failed)。
+    removeのときは部分まとめのものを消す。失敗したフォルダの数を返す
+    """
+    log_path, failed_path=error_paths(result_path)
+    failed=[]
+    logs=[]
+    for path in part_paths:
+        part_log, part_failed=error_paths(path)
+        if os.path.exists(part_log):
+            logs.append(part_log)
+        try:
+            with open(part_failed, 'r', encoding='utf-8') as f:
+                failed+=json.load(f).get("folders", [])
+        except (OSError, ValueError):
+            pass
+    if len(logs)>0:
+        tmp_path=log_path+".tmp"
+        with open(tmp_path, 'wb') as dst:
+            for part_log in logs:
+                with open(part_log, 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, log_path)
+    elif os.path.exists(log_path): #前回のlog
+        os.remove(log_path)
+    write_failed(failed_path, failed)
+    if remove:
+        for path in part_paths:
+            for pp in error_paths(path):
+                if os.path.exists(pp):
+                    os.remove(pp)
+    return len(failed)
+
+
+class RunErrorLog:
+    """1回の実行のerror log。threadから同時に呼んでよい。logは最初に書くときにつくる(前回のlogは消す)"""
+    def __init__(self, result_path):
+        self.log_path, self.failed_path=error_paths(result_path)
+        self.lock=threading.Lock()
+        self.fp=None
+        self.failed=[] #{"relpath","reason"}
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def write(self, relpath, title, text):
+        with self.lock:
+            if self.fp==None:
+                self.fp=open(self.log_path, 'w', encoding='utf-8')
+            self.fp.write(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} {relpath}: {title}\n")
+            if text:
+                self.fp.write(text[-STDERR_LIMIT:].rstrip("\n")+"\n")
+            self.fp.flush()
+
+    def attempt_failed(self, relpath, attempt, e):
+        reason, detail=error_text(e)
+        self.write(relpath, f"attempt {attempt+1} failed: {reason}", detail)
+        return reason
+
+    def stderr(self, relpath, text):
+        """成功したフォルダのstderr(warningなど)"""
+        self.write(relpath, "stderr", text)
+
+    def folder_failed(self, relpath, reason):
+        with self.lock:
+            self.failed.append({"relpath":relpath, "reason":reason})
+
+    def close(self):
+        """logを閉じ、失敗したフォルダのリストを書く(失敗がなければ前回のリストを消す)"""
+        if self.fp!=None:
+            self.fp.close()
+            self.fp=None
+        write_failed(self.failed_path, self.failed)
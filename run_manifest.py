@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+まとめcsvの横に置くmanifest。差分実行(incremental)用。
+フォルダごとに、データファイルのmtime,size,hash、上書き後のtag dict、sub *.pyのhashを記録し、
+sub *.pyの出力行はフォルダごとのcacheファイル(cache_name)に保存する。
+次の実行では、変化のないフォルダはcacheの行を使い、subprocを実行しない。
+"""
+
+import os
+import json
+import hashlib
+
+from builtin_plugins import is_builtin, plugin_hash
+from scan_index import is_run_output
+
+MANIFEST_VERSION=1
+
+
+def file_hash(path, chunk_size=1<<20):
+    """ファイル内容のhash(md5)。大きいファイルでも一定のメモリで読む"""
+    h=hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            chunk=f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_name(relpath):
+    """フォルダのcacheファイル名"""
+    return hashlib.md5(relpath.encode('utf-8')).hexdigest()+".txt"
+
+def manifest_paths(result_path):
+    """(manifestのpath, cacheフォルダのpath)。まとめcsvと同じフォルダに置く"""
+    return result_path+".manifest.json", result_path+".cache"
+
+
+class RunManifest:
+    def __init__(self, result_path, sub_py_filename):
+        self.manifest_path, self.cache_dir=manifest_paths(result_path)
+        self.sub_hash=plugin_hash(sub_py_filename) if is_builtin(sub_py_filename) else file_hash(sub_py_filename)
+        self.folders=dict() #relpath: {"files":{name:[mtime,size,hash]},"tags":{}}
+        self.new_folders=dict() #今回の実行で記録したフォルダ
+
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    mdata=json.load(f)
+            except (OSError, ValueError):
+                mdata=dict()
+            #sub *.pyが変わったら全フォルダが対象
+            if mdata.get("version")==MANIFEST_VERSION and mdata.get("sub_hash")==self.sub_hash:
+                self.folders=mdata.get("folders", dict())
+
+    def scan_files(self, tpath, relpath, exclude):
+        """
+        フォルダのデータファイルの{name:[mtime,size,hash]}を返す。
+        mtimeとsizeが前回と同じファイルは、前回のhashを使う(読み直さない)。
+        """
+        old_files=self.folders.get(relpath, dict()).get("files", dict())
+        files=dict()
+        with os.scandir(tpath) as it:
+            for de in sorted(it, key=lambda de: de.name):
+                if de.name in exclude or is_run_output(de.name) or not de.is_file():
+                    continue
+                st=de.stat()
+                old=old_files.get(de.name)
+                if old!=None and old[0]==st.st_mtime and old[1]==st.st_size:
+                    files[de.name]=old
+                else:
+                    files[de.name]=[st.st_mtime, st.st_size, file_hash(de.path)]
+        return files
+
+    def is_clean(self, relpath, files, jdata):
+        """前回から、データファイル(hash)とtagが変わっていなければTrue"""
+        old=self.folders.get(relpath)
+        if old==None or old.get("tags")!=jdata:
+            return False
+        if not os.path.exists(os.path.join(self.cache_dir, cache_name(relpath))):
+            return False
+        old_files=old.get("files", dict())
+        if old_files.keys()!=files.keys():
+            return False
+        for ff, st in files.items():
+            if old_files[ff][2]!=st[2]: #mtimeだけ変わったファイルはhashで判定
+                return False
+        return True
+
+    def cache_path(self, relpath):
+        """フォルダの出力行のcacheファイル。sub *.pyの出力はここに1行ずつ書く"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, cache_name(relpath))
+
+    def keep(self, relpath, files):
+        """変化のないフォルダを今回のmanifestに残す"""
+        self.new_folders[relpath]=dict(self.folders[relpath], files=files)
+
+    def update(self, relpath, files, jdata):
+        """実行したフォルダを記録する。出力行はcache_path()に書いてあること"""
+        self.new_folders[relpath]={"files":files, "tags":jdata}
+
+    def save(self, keep_unreached=False):
+        """
+        今回の実行で記録したフォルダだけを保存し、使われなくなったcacheは消す。
+        keep_unreached(途中で止めた、一部のフォルダだけ実行した)のときは、今回まだ書いていないフォルダの前回の記録とcacheも残す。
+        """
+        if keep_unreached:
+            for relpath,old in self.folders.items():
+                self.new_folders.setdefault(relpath, old)
+
+        used={cache_name(relpath) for relpath in self.new_folders}
+        if os.path.isdir(self.cache_dir):
+            for ff in os.listdir(self.cache_dir):
+                if ff not in used:
+                    os.remove(os.path.join(self.cache_dir, ff))
+
+        tmp_path=self.manifest_path+".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version":MANIFEST_VERSION, "sub_hash":self.sub_hash, "folders":self.new_folders},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
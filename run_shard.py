@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+まとめ処理の分割(shard)。共有のファイルシステムで、フォルダをK個に分けて別々のnode(process)で実行し、
+最後にまとめる。
+フォルダのshardは、relpath("/"区切り)のmd5をKで割った余り。どのnodeで数えても同じになる。
+shard i/Kの部分まとめcsvは"result.shard<i>of<K>.csv"で、横の"*.shard.json"にフォルダごとの行のbyte範囲を記録する。
+merge_shards()は、ヘッダーを1つだけ書き、フォルダの範囲をたどる順(分けないで実行したときと同じ順)にcopyする。
+行を読み直さない(csvを解釈しない)ので速い。
+"""
+
+import os
+import json
+import time
+import heapq
+import hashlib
+import subprocess
+
+from result_merge import dir_key
+from result_writer import pad_line
+from run_errors import merge_error_files
+
+SHARD_VERSION=1
+
+
+def parse_shard(text):
+    """"i/K"を(i,K)にする。0<=i<K"""
+    try:
+        ii,kk=(int(vv) for vv in text.split("/"))
+    except ValueError:
+        raise ValueError("shard must be I/K, e.g. 0/4: "+str(text))
+    if kk<1 or not 0<=ii<kk:
+        raise ValueError("shard must be 0<=I<K: "+str(text))
+    return ii,kk
+
+def shard_of(relpath, count):
+    """relpathのshard番号。OSによらないように"/"区切りにしてhashする"""
+    key=relpath.replace("\\", "/").encode('utf-8')
+    return int(hashlib.md5(key).hexdigest(), 16)%count
+
+def shard_result_path(result_path, index, count):
+    """shard i/Kの部分まとめcsv。"result.csv" -> "result.shard0of4.csv" """
+    base,ext=os.path.splitext(result_path)
+    return f"{base}.shard{index}of{count}{ext}"
+
+def shard_info_path(shard_path):
+    return shard_path+".shard.json"
+
+
+class ShardRecorder:
+    """部分まとめcsvに書いたフォルダのbyte範囲を記録する。書くのはCsvResultWriterだけ"""
+    def __init__(self, shard_path, index, count):
+        self.info_path=shard_info_path(shard_path)
+        self.index=index
+        self.count=count
+        self.header_dir=None #ヘッダーを書いたフォルダ
+        self.header_end=0
+        self.folders=[] #[relpath, start, end]
+
+    def begin(self, writer):
+        self.start=writer.position()
+        self.had_header=not writer.useHeader
+
+    def end(self, writer, relpath):
+        """フォルダを書き終わった。最初のヘッダーはこのフォルダの範囲に入れない"""
+        start=self.start
+        if not self.had_header and not writer.useHeader:
+            self.header_dir=relpath
+            self.header_end=writer.header_end
+            start=max(start, self.header_end)
+        end=writer.position()
+        writer.tracked.update((start, end)) #close()でヘッダーを書き直したときに移る
+        self.folders.append([relpath, start, end])
+
+    def save(self, complete, writer=None):
+        """writer(close()したもの)がヘッダーと行を書き直したときは、移った位置で記録する。sub *.pyの列名も記録する"""
+        moved=writer.new_position if writer!=None else (lambda pos: pos)
+        header_end=moved(self.header_end) if self.header_dir!=None else 0
+        folders=[[relpath, moved(start), moved(end)] for relpath,start,end in self.folders]
+        columns=writer.names if writer!=None else None
+        tmp_path=self.info_path+".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version":SHARD_VERSION, "shard":[self.index, self.count], "complete":complete,
+                       "header_dir":self.header_dir, "header_end":header_end, "columns":columns, "folders":folders},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.info_path)
+
+
+def load_shard_infos(result_path, count):
+    """K個の部分まとめの記録。ないか途中で止めたshardがあればValueError"""
+    infos=[]
+    for ii in range(count):
+        shard_path=shard_result_path(result_path, ii, count)
+        try:
+            with open(shard_info_path(shard_path), 'r', encoding='utf-8') as f:
+                info=json.load(f)
+        except (OSError, ValueError):
+            raise ValueError(f"shard {ii}/{count} is not finished: {shard_path}")
+        if info.get("version")!=SHARD_VERSION or info.get("shard")!=[ii, count]:
+            raise ValueError(f"shard {ii}/{count} is not for this run: {shard_path}")
+        if not info["complete"]:
+            raise ValueError(f"shard {ii}/{count} was cancelled: {shard_path}")
+        info["path"]=shard_path
+        infos.append(info)
+    return infos
+
+def merge_shards(result_path, count, remove=False, chunk_size=1<<20):
+    """
+    K個の部分まとめcsvを、result_pathの1つのcsvにまとめる。
+    ヘッダーは、たどる順で最初にヘッダーを書いたフォルダのshardのもの(分けないで実行したときと同じ)。
+    shardによってsub *.pyの列が違うときは、列のいちばん多いshardのヘッダーにする。ほかのshardの列が
+    その先頭と同じなら、そのshardの行には足りない列の","を足す。そうでなければ列がずれるのでValueError。
+    フォルダの行は、shardの記録のbyte範囲をたどる順にcopyする。removeのときは部分まとめを消す。
+    shardごとのerror logとfailed.jsonも、result_pathのものにまとめる(run_errors.merge_error_files)。
+    {"shards","folders","bytes","failed","seconds"}を返す。
+    """
+    t0=time.perf_counter()
+    infos=load_shard_infos(result_path, count)
+    heads=[info for info in infos if info["header_dir"]!=None]
+
+    fps=[open(info["path"], 'rb') for info in infos]
+    nbytes=0
+    nfolders=0
+    tmp_path=result_path+".tmp"
+    try:
+        with open(tmp_path, 'wb') as out:
+            if len(heads)>0:
+                head=min(heads, key=lambda info: dir_key(info["header_dir"]))
+                widest=max(heads, key=lambda info: len(info.get("columns") or []))
+                for info in heads:
+                    columns=info.get("columns") or []
+                    if columns!=(widest.get("columns") or [])[:len(columns)]:
+                        raise ValueError("columns of the shards are different. run without shards: "+info["path"])
+                if widest.get("columns")!=head.get("columns"):
+                    head=widest
+                width=len(widest.get("columns") or [])
+                pads=[b","*(width-len(info.get("columns") or [])) if info["header_dir"]!=None else b"" for info in infos]
+                fp=fps[infos.index(head)]
+                tag_cols=fp.readline().rstrip(b"\r\n").split(b",").index(b"dir")+1 #tagの列とdir列の数(shardで同じ)
+                ncols=[tag_cols+len(info.get("columns") or []) for info in infos]
+                nbytes+=copy_range(fp, out, 0, head["header_end"], chunk_size)
+            else:
+                pads=[b""]*len(infos)
+                ncols=[0]*len(infos)
+            #各shardの中はたどる順なので、dirのkeyでmergeする
+            folders=heapq.merge(*[[(dir_key(relpath), ii, start, end) for relpath,start,end in info["folders"]]
+                                  for ii,info in enumerate(infos)])
+            for key,ii,start,end in folders:
+                nbytes+=copy_range(fps[ii], out, start, end, chunk_size, pads[ii], ncols[ii])
+                nfolders+=1
+        os.replace(tmp_path, result_path)
+        failed=merge_error_files(result_path, [info["path"] for info in infos], remove)
+    finally:
+        for fp in fps:
+            fp.close()
+        if os.path.exists(tmp_path): #列がそろわないなどで止めたときは、途中のファイルを残さない
+            os.remove(tmp_path)
+    if remove:
+        for info in infos:
+            os.remove(info["path"])
+            os.remove(shard_info_path(info["path"]))
+    return {"shards":count, "folders":nfolders, "bytes":nbytes, "failed":failed, "seconds":time.perf_counter()-t0}
+
+def copy_range(src, dst, start, end, chunk_size, pad=b"", ncols=0):
+    """
+    srcのstartからendまでをdstに書く。padのときは行ごとにncols列のあとに入れる(列の少ないshard。
+    result_writer.pad_line)。書いたbytesを返す
+    """
+    src.seek(start)
+    if pad:
+        nbytes=0
+        pos=start
+        while pos<end:
+            line=src.readline()
+            if not line:
+                break
+            pos+=len(line)
+            line=pad_line(line, ncols, pad)
+            dst.write(line)
+            nbytes+=len(line)
+        return nbytes
+    left=end-start
+    while left>0:
+        chunk=src.read(min(left, chunk_size))
+        if not chunk:
+            break
+        dst.write(chunk)
+        left-=len(chunk)
+    return end-start-left
+
+def run_local_shards(command, count):
+    """
+    command(edta_cli.pyの引数のリスト)に"--shard i/K"をつけて、K個のprocessで同時に実行する。
+    1台で分割実行を試すとき用。shardごとの(exit code, summary)のリストを返す。
+    """
+    procs=[subprocess.Popen(command+["--shard", f"{ii}/{count}"], stdout=subprocess.PIPE) for ii in range(count)]
+    ret=[]
+    for sp in procs:
+        out,_=sp.communicate()
+        try:
+            summary=json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            summary=None
+        ret.append((sp.returncode, summary))
+    return ret
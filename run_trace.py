@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+まとめ処理の計測。フォルダごとの区間(span)を記録し、JSON linesかChrome trace(chrome://tracing, Perfetto)で保存する。
+区間の名前: scan(scan indexの更新), resolve(tagの解決), spawn(子プロセスの起動), child(子プロセスの実行。
+受け取ったbytesと行数), wait(並列実行の結果待ち), write(まとめファイルへの書き込み), upsert。
+組み込みpluginと常駐workerのprocess()は、cProfileでも測れる(profile_call, ProfileCollector)。
+worker processで実行されるので、このモジュールではPySide6をimportしないこと。
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+class RunTracer:
+    """区間を記録する。threadから同時に呼んでよい。時刻はtime.perf_counter()"""
+    enabled=True
+
+    def __init__(self):
+        self.t0=time.perf_counter()
+        self.lock=threading.Lock()
+        self.spans=[] #(name, start, dur, relpath, thread id, args)
+
+    def add(self, name, start, dur, relpath=None, **args):
+        """startからdur秒の区間。別のprocessで測った秒数は、終わった時刻から逆算したstartで記録する"""
+        with self.lock:
+            self.spans.append((name, start, dur, relpath, threading.get_ident(), args))
+
+    @contextlib.contextmanager
+    def span(self, name, relpath=None, **args):
+        start=time.perf_counter()
+        try:
+            yield args #withの中で値を足せる
+        finally:
+            self.add(name, start, time.perf_counter()-start, relpath, **args)
+
+    def aggregate(self):
+        """区間の名前ごとの{count, seconds(合計), max, bytes, lines}"""
+        ret=dict()
+        for name,start,dur,relpath,tid,args in self.spans:
+            agg=ret.setdefault(name, {"count":0, "seconds":0.0, "max":0.0})
+            agg["count"]+=1
+            agg["seconds"]+=dur
+            agg["max"]=max(agg["max"], dur)
+            for kk in ("bytes", "lines"):
+                if kk in args:
+                    agg[kk]=agg.get(kk, 0)+args[kk]
+        return ret
+
+    def save_jsonl(self, path):
+        """1区間1行。startは計測開始からの秒"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for name,start,dur,relpath,tid,args in self.spans:
+                f.write(json.dumps({"name":name, "relpath":relpath, "start":start-self.t0, "dur":dur,
+                                    "thread":tid, "args":args}, ensure_ascii=False)+"\n")
+
+    def save_chrome_trace(self, path):
+        """Chrome traceのJSON(完了event "X"、時刻はμs)。threadごとに1段になる"""
+        tids=dict()
+        events=[]
+        for name,start,dur,relpath,tid,args in self.spans:
+            tt=tids.setdefault(tid, len(tids))
+            events.append({"name":name, "ph":"X", "ts":(start-self.t0)*1e6, "dur":dur*1e6, "pid":os.getpid(), "tid":tt,
+                           "args":dict(args, relpath=relpath) if relpath!=None else args})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents":events, "displayTimeUnit":"ms"}, f, ensure_ascii=False)
+
+    def save(self, path):
+        """拡張子が.jsonlならJSON lines、それ以外はChrome trace"""
+        if path.endswith(".jsonl"):
+            self.save_jsonl(path)
+        else:
+            self.save_chrome_trace(path)
+
+
+class NullTracer:
+    """計測しないときのtracer。何も記録しない"""
+    enabled=False
+
+    def add(self, name, start, dur, relpath=None, **args):
+        pass
+
+    def span(self, name, relpath=None, **args):
+        return contextlib.nullcontext(args)
+
+    def aggregate(self):
+        return dict()
+
+NULL_TRACER=NullTracer()
+
+
+def profile_call(profile_path, func, *args):
+    """func(*args)をcProfileで測り、statsをprofile_pathに書く。worker(threadでもprocessでも)の中で呼ぶ"""
+    import cProfile
+    prof=cProfile.Profile()
+    try:
+        return prof.runcall(func, *args)
+    finally:
+        prof.dump_stats(profile_path)
+
+
+class ProfileCollector:
+    """
+    cProfileの結果を1つの.profにまとめる。
+    このthreadで測る区間はenable()/disable()、workerが書いた.profはadd()で足す(足したファイルは消す)
+    """
+    def __init__(self, path):
+        import cProfile
+        self.path=path
+        self.prof=cProfile.Profile()
+        self.stats=None
+
+    def enable(self):
+        self.prof.enable()
+
+    def disable(self):
+        self.prof.disable()
+
+    def add(self, profile_path):
+        if not os.path.exists(profile_path): #workerが止められた
+            return
+        import pstats
+        if self.stats==None:
+            self.stats=pstats.Stats(profile_path)
+        else:
+            self.stats.add(profile_path)
+        os.remove(profile_path)
+
+    def save(self):
+        import pstats
+        self.prof.create_stats()
+        if len(self.prof.stats)>0:
+            if self.stats==None:
+                self.stats=pstats.Stats(self.prof)
+            else:
+                self.stats.add(self.prof)
+        if self.stats!=None:
+            self.stats.dump_stats(self.path)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+root path以下のフォルダのindex。
+os.scandirで1度だけ歩き、DirEntryのstat(WindowsではlistingについてくるのでSMBでも速い)を使う。
+フォルダごとに、tagのjsonと.noの有無、データファイルのリスト(name,size,mtime)、子フォルダを記録し、
+rootにファイルで保存する。次からは、mtimeの変わったフォルダだけscandirし直す。
+(ファイルを上書きしただけではフォルダのmtimeは変わらないので、そのsizeは古いことがある。
+GUIのステータスバーのsizeも同じで、フォルダのmtimeが変わるかrootからたどり直すまで前の値のまま)
+"""
+
+import os
+import json
+import tempfile
+
+INDEX_VERSION=2 #2: 実行のcacheフォルダを入れない
+
+def _umask():
+    mask=os.umask(0)
+    os.umask(mask)
+    return mask
+
+FILE_MODE=0o666& ~_umask() #mkstempの一時ファイルは0600なので、open()でつくったときと同じmodeにする
+
+
+def is_run_output(name):
+    """
+    実行がrootに置くもの(incrementalのcacheフォルダ"*.cache"とmanifest"*.manifest.json")ならTrue。
+    どの--outputのものでも、データのフォルダ・ファイルとしてはたどらない
+    """
+    return name.endswith(".cache") or name.endswith(".manifest.json")
+
+def scan_entries(path, progress=None, every=1000):
+    """
+    フォルダを1回のscandirで調べ、(files [[name,size,mtime]], dirs [name])を返す(sortしない)。
+    progress(dirs数, files数, 合計size)をevery個ごとに呼ぶ(GUIのbackground threadで途中の数を出す)。
+    """
+    files=[]
+    dirs=[]
+    total_size=0
+    with os.scandir(path) as it:
+        for n,de in enumerate(it, 1):
+            if is_run_output(de.name):
+                continue
+            if de.is_dir():
+                dirs.append(de.name)
+            elif de.is_file():
+                st=de.stat()
+                files.append([de.name, st.st_size, st.st_mtime_ns])
+                total_size+=st.st_size
+            if progress!=None and n%every==0:
+                progress(len(dirs), len(files), total_size)
+    return files, dirs
+
+def index_path_of(root_path, json_filename):
+    """indexの保存先。rootに"json名.index.json"で置く"""
+    return os.path.join(root_path, os.path.splitext(json_filename)[0]+".index.json")
+
+
+class ScanIndex:
+    def __init__(self, root_path, json_filename, not_analysis_file):
+        self.root_path=root_path
+        self.json_filename=json_filename
+        self.not_analysis_file=not_analysis_file
+        self.index_path=index_path_of(root_path, json_filename)
+        self.dirs=dict() #relpath("."がroot): {"mtime":ns,"has_json":bool,"has_no":bool,"files":[[name,size,mtime]],"dirs":[name]}
+
+    def relpath_of(self, path):
+        return os.path.relpath(path, start=self.root_path)
+
+    def load(self):
+        """保存したindexを読む。なければ空のまま"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                idata=json.load(f)
+        except (OSError, ValueError):
+            return
+        if idata.get("version")==INDEX_VERSION and idata.get("json")==self.json_filename \
+            and idata.get("no")==self.not_analysis_file:
+            self.dirs=idata.get("dirs", dict())
+
+    def save(self):
+        #shardの実行では、いくつものprocess(node)が同時に保存するので、一時ファイルは別々にする
+        fd,tmp_path=tempfile.mkstemp(dir=os.path.dirname(self.index_path),
+                                     prefix=os.path.basename(self.index_path)+".", suffix=".tmp")
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump({"version":INDEX_VERSION, "json":self.json_filename, "no":self.not_analysis_file,
+                       "dirs":self.dirs}, f, ensure_ascii=False)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, self.index_path)
+
+    def scan_dir(self, path, mtime):
+        """フォルダを1回のscandirで調べてentryをつくる"""
+        return self.make_entry(mtime, *scan_entries(path))
+
+    def set_entry(self, path, mtime, files, dirs):
+        """
+        ほかのthreadでscan_entriesしたフォルダのentryを入れて返す。rootの外のpathはNone。
+        GUIはフォルダのscandirをbackgroundで行い、ここでindexに入れる
+        """
+        try:
+            relpath=self.relpath_of(path)
+        except ValueError:
+            return None
+        if relpath==".." or relpath.startswith(".."+os.sep):
+            return None
+        entry=self.make_entry(mtime, list(files), list(dirs))
+        self.dirs[relpath]=entry
+        return entry
+
+    def make_entry(self, mtime, files, dirs):
+        files.sort()
+        dirs.sort()
+        names={ff[0] for ff in files}
+        return {"mtime":mtime, "has_json":self.json_filename in names, "has_no":self.not_analysis_file in names,
+                "files":files, "dirs":dirs}
+
+    def refresh(self):
+        """
+        root以下を歩いてindexを更新する。mtimeが前回と同じフォルダはscandirしない。
+        無くなったフォルダはindexから消える。
+        """
+        new_dirs=dict()
+        self._refresh(self.root_path, ".", os.stat(self.root_path).st_mtime_ns, new_dirs)
+        self.dirs=new_dirs
+
+    def _refresh(self, path, relpath, mtime, new_dirs):
+        entry=self.dirs.get(relpath)
+        if entry==None or entry["mtime"]!=mtime:
+            entry=self.scan_dir(path, mtime)
+        new_dirs[relpath]=entry
+
+        for ff in entry["dirs"]:
+            cpath=os.path.join(path, ff)
+            try:
+                cmtime=os.stat(cpath).st_mtime_ns
+            except OSError: #消えたフォルダ
+                continue
+            self._refresh(cpath, ff if relpath=="." else os.path.join(relpath, ff), cmtime, new_dirs)
+
+    def entry(self, path, refresh=True):
+        """
+        pathのentry。refreshのときは、そのフォルダのmtimeだけ見て変わっていればscandirし直す。
+        rootの外のpathはNone
+        """
+        try:
+            relpath=self.relpath_of(path)
+        except ValueError: #windowsでdriveが違う
+            return None
+        if relpath==".." or relpath.startswith(".."+os.sep):
+            return None
+        entry=self.dirs.get(relpath)
+        if refresh:
+            try:
+                mtime=os.stat(path).st_mtime_ns
+            except OSError:
+                self.dirs.pop(relpath, None)
+                return None
+            if entry==None or entry["mtime"]!=mtime:
+                entry=self.scan_dir(path, mtime)
+                self.dirs[relpath]=entry
+        return entry
+
+
+def entry_file_info(entry):
+    """(子フォルダ数, ファイル数, 合計size)。ステータスバー用"""
+    return len(entry["dirs"]), len(entry["files"]), sum(ff[1] for ff in entry["files"])
@@ -4,7 +4,9 @@
 (c)2025 T. Hayakawa
 dataTagEditorのsubrocess用*.pyのサンプル
 同じディレクトリのすべてのcsvファイルの指定列を、stdoutへ1ファイル1行で表示する(数値のみ）。
+featuresで、複数の列・行範囲と、平均などの集計も1行に並べられる。
 dataTagEitroがこれをstdoutから受け取って、ファイル名,dataの行の表をつくる。
+process(fullpath,relpath)を定義しているので、EDTAの常駐workerモードでも使える(stdoutを経由しない)。
 
 ファイル名には、実験条件の"*Pa,*W"が含まれているとして、これをパターンマッチで取り出して、
 dataの前につけて行にする。
@@ -12,6 +14,21 @@ dataの前につけて行にする。
 
 import glob
 import os,sys,re
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import numpy as np
+except ImportError: #なくても動く(遅い)
+    np=None
+try:
+    from condition_parser import ConditionParser, DEFAULT_CONDITIONS
+    conditionParser=ConditionParser(DEFAULT_CONDITIONS) #条件を増やすときは、ここにconditionsのリストを渡す
+except ImportError: #このファイルだけコピーして使うとき
+    conditionParser=None
+try:
+    from line_reader import LineReader #mmapで必要な行だけ読む
+except ImportError:
+    LineReader=None
 sys.stdout.reconfigure(encoding="utf-8")
 
 ## ファイルのデーター範囲
@@ -19,6 +36,20 @@ use_col=1 #0..
 start_r=2 #0..
 end_r=30 #end_r行は出力に含まれない。end_r-1まで
 
+## 取り出す特徴。ファイルは1回だけ読み、すべてを1行に並べる
+# col:列(0..), start,end:行の範囲(endは含まない), stat:"raw","mean","std","min","max","uniformity"
+# rawは範囲の数値をそのまま並べる。ほかは1つの値(nanは除く。statにはnumpyが必要)。uniformityは(max-min)/(max+min)
+# name:ヘッダーの列名(rawは"name"+番号)。省略するとrawは番号だけ、ほかは"stat"+列
+features=[
+    {"col":use_col, "start":start_r, "end":end_r, "stat":"raw"},
+    #{"col":1, "start":2, "end":30, "stat":"mean"},
+    #{"col":1, "start":2, "end":30, "stat":"std", "name":"sd"},
+    #{"col":1, "start":2, "end":30, "stat":"uniformity"},
+]
+
+read_threads=8 #フォルダのファイルを並べて読むthread数
+line_index_dir=None #大きなファイルを何度も読むとき、行のoffsetのindexを保存するフォルダ(データのフォルダ以外)
+
 def isFloat(s):
     """
     文字列->floatの変換ができるかを、boolで返す。
@@ -30,10 +61,20 @@ def isFloat(s):
     else:
         return True
 
+def conditionNames() -> list:
+    """
+    getParamで取り出す条件の名前(ヘッダー用)。
+    """
+    return conditionParser.names if conditionParser!=None else ["pa","W"]
+
 def getParam(filename) -> tuple:
     """
     ファイル名の"*Pa,*W"が含まれているとして、これをパターンマッチで取り出して返す。
+    condition_parserがあれば、その設定の条件を(conditionNames()の順に)返す。結果はファイル名ごとにcacheされる。
     """
+    if conditionParser!=None:
+        return conditionParser.parse_strings(filename)
+
     ma1=re.search(r"(\d+)\s*[pP]a",filename)
     ma2=re.search(r"(\d+)\s*[wW]",filename)
 
@@ -42,67 +83,145 @@ def getParam(filename) -> tuple:
 
     return p1,p2
 
-def printAllFiles(fullpath,relpath,fileExt,start_r,end_r,use_col):
-    files=glob.glob(fullpath+r"\*."+fileExt)
+def process(fullpath,relpath):
+    """
+    EDTAの常駐workerモード用。printAllFilesと同じ行(ヘッダー行+1ファイル1行)をyieldする。
+    """
+    yield from iterAllFiles(fullpath,relpath,"csv",features)
+
+def printAllFiles(fullpath,relpath,fileExt,spec):
+    for tline in iterAllFiles(fullpath,relpath,fileExt,spec):
+        print(tline )   ## ==> output
+
+def iterAllFiles(fullpath,relpath,fileExt,spec):
+    files=sorted(glob.glob(os.path.join(fullpath,"*."+fileExt))) #os.path.joinでWindows以外でも動く。行の順はファイル名順
     #print(fullpath)
     #print("files "+str(files) )
-        
-    slineList=[]
-    fileList=[]
-    para1=[]
-    para2=[]
 
     if len(files)<1: 
         return
 
-    for file in files:
-
-        ret= readCsv(file,start_r,end_r,use_col)
-        #print(ret)
-        slineList.append(ret)
-        fileList.append(os.path.basename(file))
-        p1,p2= getParam(os.path.basename(file))
-        para1.append(p1)
-        para2.append(p2)
-    ##
-
-    headerText="file, pa, W,"
-    for  ii in range(len(slineList[0])) : #header output
-        headerText+= str(ii) +"," #col headerはindex値。
-    print(headerText)
-    
-    for ii in range(len(fileList)): #dataline output
-        ff=fileList[ii]
-        tline= ff +"," +para1[ii] +","+ para2 [ii] + ","
-        
-        for rr in slineList[ii]:
-            tline += str(rr) +","
-        print(tline )   ## ==> output
+    #ファイルの読み込みはthread poolで並べる(I/O待ちが重なる)。mapなので結果はfilesの順
+    with ThreadPoolExecutor(max_workers=read_threads) as ex:
+        featIter=ex.map(lambda file: extractFeatures(file,spec), files)
+        for ii,(file,feats) in enumerate(zip(files,featIter)):
+            if ii==0:
+                yield "file,"+"".join(" "+nn+"," for nn in conditionNames())+"".join(nn+"," for nn in featureNames(spec,feats)) #header output
+            ff=os.path.basename(file)
+            yield ff+","+"".join(pp+"," for pp in getParam(ff))+"".join(rr+"," for vals in feats for rr in vals) #dataline output
 
-def readCsv(fullpath,start_r,end_r,use_col):
+def featureNames(spec,feats):
+    """
+    ヘッダーの列名。rawの列名は"name"+番号(nameがないときは番号だけ)で、数は最初のファイルの値の数。
+    """
+    names=[]
+    for ss,vals in zip(spec,feats):
+        if ss["stat"]=="raw":
+            names.extend(ss.get("name","")+str(jj) for jj in range(len(vals)))
+        else:
+            names.append(ss.get("name",ss["stat"]+str(ss["col"])))
+    return names
+
+def extractFeatures(fullpath,spec):
+    """
+    specの特徴を1ファイルについて求める。specごとの文字列のリストのリストを返す。
+    ファイルはspecの行範囲をあわせた範囲だけ1回読み、列ごとに1回floatへ変換して、specの範囲で切り出す。
     """
-    csvの指定列をすべてstdoutへ1ファイル1行で表示するサンプル。
+    cols=sorted({ss["col"] for ss in spec})
+    r0=min(ss["start"] for ss in spec)
+    r1=max(ss["end"] for ss in spec)
+    table=readColumns(fullpath,cols,r0,r1)
+
+    floats=dict() #列: floatの配列(statを使う列だけ)
+    ret=[]
+    for ss in spec:
+        if ss["stat"]=="raw":
+            ret.append(numericCells(table[ss["col"]][ss["start"]-r0:ss["end"]-r0]))
+            continue
+        if ss["col"] not in floats:
+            floats[ss["col"]]=toFloats(table[ss["col"]])
+        vals=floats[ss["col"]][ss["start"]-r0:ss["end"]-r0]
+        ret.append([reduceStat(ss["stat"],vals)])
+    return ret
+
+def readColumns(fullpath,cols,start_r,end_r):
     """
+    csvのstart_r..end_r-1行の、colsの列のセルを{列:文字列のリスト}で返す。列がない行は""。
+    end_r行より後は読まない。
+    """
+    maxc=max(cols)
+    table={cc:[] for cc in cols}
+    for line in iterLines(fullpath,start_r,end_r):
+        cells=line.split(",",maxc+1) #使う列より後は分けない
+        for cc in cols:
+            table[cc].append(cells[cc].rstrip() if cc<len(cells) else "")
+    return table
+
+def iterLines(fullpath,start_r,end_r):
+    """
+    start_r..end_r-1行をyieldする。line_readerがあればmmapで開き、ファイル全体を読まない。
+    """
+    if LineReader!=None:
+        with LineReader(fullpath,line_index_dir) as lr:
+            yield from lr.lines(start_r,end_r)
+    else:
+        with open(fullpath,"r") as f:
+            yield from islice(f,start_r,end_r)
 
-    f=open(fullpath,"r")
-    datalines=f.readlines()
-    f.close()
-    dVal=[]
+def readCsv(fullpath,start_r,end_r,use_col):
+    """
+    csvのstart_r..end_r-1行のuse_col列のうち、数値のものを文字列のリストで返す。
+    """
+    return numericCells(readColumns(fullpath,[use_col],start_r,end_r)[use_col])
 
-    if len(datalines)==0:
-        return []    
-    
-    end_r = end_r if end_r<= len(datalines) else len(datalines)
+def numericCells(cells):
+    """
+    数値にできるセルだけ返す。numpyでまとめて変換してみて、できなかったときだけ1つずつisFloatで調べる。
+    """
+    if np!=None:
+        try:
+            np.asarray(cells,dtype=np.float64)
+            return cells
+        except ValueError:
+            pass
+    return [cc for cc in cells if isFloat(cc)]
+
+def toFloats(cells):
+    """
+    セルをfloatの配列にする。数値でないセルはnan。statにはnumpyが必要。
+    """
+    if np==None:
+        raise ImportError("numpy is required for the statistics of the features")
+    try:
+        return np.asarray(cells,dtype=np.float64) #まとめて変換できるときは速い
+    except ValueError:
+        return np.asarray([float(cc) if isFloat(cc) else np.nan for cc in cells],dtype=np.float64)
 
-    for ii in range(start_r,end_r):
-        
-        cols=datalines[ii].split(",")
-        if(len(cols)>=use_col) and isFloat(cols[use_col]):
-            dVal.append( cols[use_col].rstrip() )
-    #print(datalines)
-    #print("-----")
-    return dVal
+def reduceStat(stat,vals):
+    """
+    nanを除いた値のstatを文字列で返す。値がないときは""。
+    uniformityは(max-min)/(max+min)。
+    """
+    vals=vals[~np.isnan(vals)]
+    if len(vals)==0:
+        return ""
+    if stat=="mean":
+        ret=vals.mean()
+    elif stat=="std":
+        ret=vals.std()
+    elif stat=="min":
+        ret=vals.min()
+    elif stat=="max":
+        ret=vals.max()
+    elif stat=="uniformity":
+        vmax, vmin=vals.max(), vals.min()
+        if vmax+vmin==0:
+            return ""
+        ret=(vmax-vmin)/(vmax+vmin)
+    else:
+        raise ValueError("unknown stat: "+str(stat))
+    return repr(float(ret))
 
 if __name__ == "__main__":
     #run_sub_print.batで実行する
-    printAllFiles(sys.argv[1],sys.argv[2], "csv",start_r,end_r,use_col)
+    printAllFiles(sys.argv[1],sys.argv[2], "csv",features)
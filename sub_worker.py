@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+sub *.pyを常駐するworker processに1度だけloadして、フォルダごとにprocess(fullpath,relpath)を呼ぶ。
+フォルダごとにpythonを起動しないので、起動とimport(pandas,numpyなど)の時間がかからない。
+worker processでimportされるので、このモジュールではPySide6をimportしないこと。
+"""
+
+import os
+import sys
+import time
+import ast
+import importlib.util
+
+from run_trace import profile_call
+
+_sub_module=None #worker processごとにloadしたsub *.py
+
+
+def has_process_func(sub_py_filename):
+    """
+    sub *.pyにtop levelのdef process()があるかを、実行せずに調べる。
+    """
+    try:
+        with open(sub_py_filename, 'r', encoding='utf-8') as f:
+            tree=ast.parse(f.read(), filename=sub_py_filename)
+    except (OSError, SyntaxError, ValueError):
+        return False
+
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name=="process":
+            return True
+    return False
+
+def load_sub_module(sub_py_filename):
+    """
+    ProcessPoolExecutorのinitializer。sub *.pyをimportしてworkerに保持する。
+    __name__は"__main__"ではないので、sub *.pyのif __name__=="__main__"部分は実行されない。
+    """
+    global _sub_module
+    sub_dir=os.path.dirname(os.path.abspath(sub_py_filename))
+    if sub_dir not in sys.path:
+        sys.path.insert(0, sub_dir) #sub *.pyと同じフォルダのモジュールをimportできるように
+
+    spec=importlib.util.spec_from_file_location("edta_sub_module", sub_py_filename)
+    module=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _sub_module=module
+
+def run_process(tpath,relpath,spool_path,profile_path=None):
+    """
+    loadしたsub *.pyのprocess(tpath,relpath)を呼び、行をspool_pathに1行ずつ書く。
+    stdoutで受け取る場合と同じく、先頭のskip_row行はヘッダー。
+    行はstr(csvの1行)でも、値のlist/tupleでもよい。かかった秒数を返す。
+    profile_pathを渡すと、cProfileの結果をそこに書く。
+    """
+    if profile_path!=None:
+        return profile_call(profile_path,run_process,tpath,relpath,spool_path)
+    t0=time.perf_counter()
+    with open(spool_path, 'w', encoding='utf-8') as f:
+        for row in _sub_module.process(tpath, relpath):
+            if isinstance(row, str):
+                f.write(row+"\n")
+            else:
+                f.write(",".join(str(v) for v in row)+"\n")
+    return time.perf_counter()-t0
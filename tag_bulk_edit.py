@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+多くのフォルダのtagをまとめて変更する。
+フォルダ(globかtreeの選択)とpatch({key:value})から、フォルダごとに
+自分のjsonで上書き(override)するか、親から継承(inherit)できるかを決め、変更するjsonだけを書く。
+書く前にplan(dry-run)を見られる。jsonはすべて一時ファイルに書いてから置き換え、master JSONは1度だけ更新する。
+"""
+
+import os
+import glob
+import json
+
+from tag_resolver import TagResolver, norm_path
+from scan_index import is_run_output
+
+INHERIT=None #patchの値がこれのkeyは、自分のjsonから消して親から継承する
+
+
+def glob_folders(root_path, pattern):
+    """
+    root_path以下で、pattern(root_pathからの相対のglob。"**"は子孫のフォルダすべて)に一致するフォルダ。
+    実行のcacheフォルダ(scan_index.is_run_output)とその中は入らない
+    """
+    resolver=TagResolver(root_path, "")
+    ret=[]
+    for pp in glob.glob(os.path.join(root_path, pattern), recursive=True):
+        if os.path.isdir(pp) and resolver.is_in_root(pp) \
+            and not any(is_run_output(nn) for nn in os.path.relpath(pp, root_path).split(os.sep)):
+            ret.append(os.path.normpath(pp))
+    return sorted(set(ret))
+
+def parse_patch(text):
+    """
+    "key=value;key2=value2"をpatchのdictにする。"-key"はINHERIT(自分のjsonから消す)。
+    """
+    patch=dict()
+    for item in text.split(";"):
+        item=item.strip()
+        if item=="":
+            continue
+        if item.startswith("-"):
+            patch[item[1:].strip()]=INHERIT
+        elif "=" in item:
+            key,value=item.split("=", 1)
+            patch[key.strip()]=value.strip()
+        else:
+            raise ValueError("patch item must be key=value or -key: "+item)
+    return patch
+
+def plan_bulk_edit(root_path, json_filename, folders, patch, resolver=None):
+    """
+    foldersにpatchをあてたときに書くjsonのリスト(dry-run)。書くのはapply_bulk_edit()。
+    上のフォルダから順に、変更後の親のtagを求めて、
+      親の値がpatchの値と同じ -> 自分のjsonのkeyを消す(inherit。keyがなければ何もしない)
+      違う                    -> 自分のjsonにpatchの値を書く(override)
+    変更のないフォルダは入らない。
+    [{"path":フォルダ, "json":jsonのpath, "old":今のjson(ファイルがなければNone), "new":書くjson, "actions":{key:"override"/"inherit"}}]
+    """
+    resolver=resolver if resolver!=None else TagResolver(root_path, json_filename)
+    root=norm_path(root_path)
+    planned=dict()   #フォルダ: 変更後の自分のjson
+    effective=dict() #フォルダ: 変更後の解決済みdict
+
+    def own_of(path):
+        if path in planned:
+            return planned[path]
+        return resolver.own_dict(path)[0]
+
+    def effective_of(path):
+        if path not in effective:
+            parent= dict() if path==root else effective_of(os.path.dirname(path))
+            effective[path]=parent| own_of(path)
+        return effective[path]
+
+    targets=sorted({norm_path(ff) for ff in folders if resolver.is_in_root(ff)}, key=lambda pp: (pp.count(os.sep), pp))
+    changes=[]
+    for path in targets: #親が先
+        parent= dict() if path==root else effective_of(os.path.dirname(path))
+        old=own_of(path)
+        new=dict(old)
+        actions=dict()
+        for key,value in patch.items():
+            if value is INHERIT or parent.get(key)==value:
+                if key in new: #親と同じ値を自分のjsonに持っていても消す
+                    del new[key]
+                    actions[key]="inherit"
+            elif new.get(key)!=value:
+                new[key]=value
+                actions[key]="override"
+        planned[path]=new
+        effective.pop(path, None)
+        if len(actions)>0:
+            json_path=os.path.join(path, json_filename)
+            changes.append({"path":path, "json":json_path, "old":old if os.path.exists(json_path) else None,
+                            "new":new, "actions":actions})
+    return changes
+
+def format_plan(changes, root_path):
+    """planを人が読む文字列にする(1ファイル1行)"""
+    lines=[]
+    for cc in changes:
+        acts=", ".join(key+("="+str(cc["new"][key]) if act=="override" else " (inherit)") for key,act in cc["actions"].items())
+        rel=os.path.relpath(cc["json"], root_path)
+        lines.append(("new " if cc["old"]==None else "")+rel+": "+acts)
+    return "\n".join(lines)
+
+def write_json_files(items):
+    """
+    [(path, dict)]をまとめて書く。先に全部を一時ファイルに書いてから置き換えるので、
+    途中で失敗したときはどのファイルも変わらない。
+    """
+    tmp_paths=[]
+    try:
+        for path,jdata in items:
+            tmp_path=path+".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(jdata, f, ensure_ascii=False, indent=2)
+            tmp_paths.append(tmp_path)
+    except Exception:
+        for tmp_path in tmp_paths:
+            os.remove(tmp_path)
+        raise
+    for (path,_),tmp_path in zip(items, tmp_paths):
+        os.replace(tmp_path, path)
+
+def apply_bulk_edit(changes, master_path=None, resolver=None):
+    """
+    planのjsonを書く。master_pathを渡すと、patchで書いた値をmasterの値のリストに1度だけ追加する。
+    resolverを渡すと、書いたフォルダのcacheを消す。
+    """
+    write_json_files([(cc["json"], cc["new"]) for cc in changes])
+    if resolver!=None:
+        for cc in changes:
+            resolver.invalidate(cc["path"])
+    if master_path!=None:
+        values=dict()
+        for cc in changes:
+            for key,act in cc["actions"].items():
+                if act=="override":
+                    values.setdefault(key, []).append(cc["new"][key])
+        update_master(master_path, values)
+
+def update_master(master_path, values):
+    """
+    master JSON({key:"値1,値2"})に、まだない値を追加する。変更があればTrue
+    """
+    if os.path.exists(master_path):
+        with open(master_path, 'r', encoding='utf-8') as f:
+            master=json.load(f)
+    else:
+        master=dict()
+    changed=False
+    for key,vals in values.items():
+        current=[vv.strip() for vv in str(master.get(key, "")).split(",") if vv.strip()!=""]
+        for vv in vals:
+            if str(vv)!="" and str(vv) not in current:
+                current.append(str(vv))
+                changed=True
+        if key not in master:
+            changed=True
+        master[key]=",".join(current)
+    if changed:
+        write_json_files([(master_path, master)])
+    return changed
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+tagの検索用index。key=valueから、そのtagを持つフォルダ(継承を解決したtag)を引く。
+フォルダごとに、自分のjson(statと内容)と解決済みのtagをrootにファイルで保存し、
+次からはstatの変わったjsonだけ読み直す。フォルダはscan indexからたどる。
+save JSONやbulk editで書いたときは、そのフォルダと子孫だけ解決し直す(update_folders)。
+
+    index=TagIndex(root_path, json_filename, not_analysis_file)
+    index.load(); index.refresh(scan_index); index.save()
+    index.query(parse_query("tagA=2;tagB=a|b")) #-> [relpath, ...]
+"""
+
+import os
+import json
+import tempfile
+
+from scan_index import FILE_MODE
+
+INDEX_VERSION=1
+
+
+def tag_index_path_of(root_path, json_filename):
+    """indexの保存先。rootに"json名.tagindex.json"で置く"""
+    return os.path.join(root_path, os.path.splitext(json_filename)[0]+".tagindex.json")
+
+def parse_query(text):
+    """
+    "tagA=2;tagB=a|b"を{key:[値]}にする。keyどうしはAND、"|"で区切った値はOR。空の文字列は{}(すべて)。
+    """
+    query=dict()
+    for item in text.split(";"):
+        item=item.strip()
+        if item=="":
+            continue
+        if "=" not in item:
+            raise ValueError("query item must be key=value: "+item)
+        key,values=item.split("=", 1)
+        query[key.strip()]=[vv.strip() for vv in values.split("|")]
+    return query
+
+def match_tags(jdata, query):
+    """解決済みのtagがqueryに一致すればTrue。queryが{}やNoneならいつもTrue"""
+    if not query:
+        return True
+    for key,values in query.items():
+        if key not in jdata or str(jdata[key]) not in values:
+            return False
+    return True
+
+
+class TagIndex:
+    def __init__(self, root_path, json_filename, not_analysis_file):
+        self.root_path=root_path
+        self.json_filename=json_filename
+        self.not_analysis_file=not_analysis_file
+        self.index_path=tag_index_path_of(root_path, json_filename)
+        self.folders=dict()  #relpath("."がroot): {"stat":[mtime,size]かNone, "own":{}, "tags":{}, "no":bool}
+        self.postings=dict() #key: {value: set(relpath)}。保存せず、foldersからつくる
+
+    def load(self):
+        """保存したindexを読む。なければ空のまま"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                idata=json.load(f)
+        except (OSError, ValueError):
+            return
+        if idata.get("version")==INDEX_VERSION and idata.get("json")==self.json_filename:
+            self.folders=idata.get("folders", dict())
+            self.build_postings()
+
+    def save(self):
+        #shardの実行では、いくつものprocessが同時に保存するので、一時ファイルは別々にする
+        fd,tmp_path=tempfile.mkstemp(dir=os.path.dirname(self.index_path),
+                                     prefix=os.path.basename(self.index_path)+".", suffix=".tmp")
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump({"version":INDEX_VERSION, "json":self.json_filename, "folders":self.folders}, f, ensure_ascii=False)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, self.index_path)
+
+    def build_postings(self):
+        self.postings=dict()
+        for relpath,ff in self.folders.items():
+            self.add_postings(relpath, ff["tags"])
+
+    def add_postings(self, relpath, tags):
+        for key,value in tags.items():
+            self.postings.setdefault(key, dict()).setdefault(str(value), set()).add(relpath)
+
+    def remove_postings(self, relpath, tags):
+        for key,value in tags.items():
+            rels=self.postings.get(key, dict()).get(str(value))
+            if rels!=None:
+                rels.discard(relpath)
+
+    def read_own(self, relpath, has_json=True):
+        """フォルダ自身のjsonを、statが前回と同じなら読まずに返す。(stat, own)"""
+        json_path=os.path.join(self.root_path, relpath, self.json_filename)
+        try:
+            if not has_json:
+                raise FileNotFoundError
+            st=os.stat(json_path)
+            stat=[st.st_mtime_ns, st.st_size]
+        except OSError:
+            return None, dict()
+        old=self.folders.get(relpath)
+        if old!=None and old["stat"]==stat:
+            return stat, old["own"]
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return stat, json.load(f)
+
+    def set_folder(self, relpath, stat, own, tags, no):
+        old=self.folders.get(relpath)
+        if old!=None:
+            if old["tags"]==tags:
+                old.update(stat=stat, own=own, no=no)
+                return
+            self.remove_postings(relpath, old["tags"])
+        self.folders[relpath]={"stat":stat, "own":own, "tags":tags, "no":no}
+        self.add_postings(relpath, tags)
+
+    def refresh(self, scan_index):
+        """
+        scan index(refresh済み)のフォルダをrootからたどり、tagを解決し直す。
+        statの変わったjsonだけ読む。無くなったフォルダはindexから消える。
+        """
+        seen=set()
+        self._refresh(scan_index, ".", dict(), seen)
+        for relpath in list(self.folders.keys()):
+            if relpath not in seen:
+                self.remove_postings(relpath, self.folders.pop(relpath)["tags"])
+
+    def _refresh(self, scan_index, relpath, parent_tags, seen):
+        entry=scan_index.dirs.get(relpath)
+        if entry==None:
+            return
+        stat, own=self.read_own(relpath, entry["has_json"])
+        tags=parent_tags| own #子が上書き
+        self.set_folder(relpath, stat, own, tags, entry["has_no"])
+        seen.add(relpath)
+        for ff in entry["dirs"]:
+            self._refresh(scan_index, ff if relpath=="." else os.path.join(relpath, ff), tags, seen)
+
+    def update_folders(self, paths):
+        """
+        jsonを書いたフォルダ(絶対path)と、その子孫のtagを解決し直す。indexにないフォルダは無視する(次のrefreshで入る)。
+        """
+        rels=[]
+        for path in paths:
+            relpath=os.path.relpath(path, self.root_path)
+            if relpath in self.folders:
+                rels.append(relpath)
+        for relpath in sorted(rels, key=lambda rr: rr.count(os.sep) if rr!="." else -1): #親が先
+            stat, own=self.read_own(relpath)
+            self.folders[relpath].update(stat=stat, own=own)
+            prefix="" if relpath=="." else relpath+os.sep
+            for rr in sorted((rr for rr in self.folders if rr==relpath or rr.startswith(prefix)),
+                             key=lambda rr: rr.count(os.sep) if rr!="." else -1):
+                parent=os.path.dirname(rr) if rr!="." else None
+                parent_tags=self.folders[parent if parent!="" else "."]["tags"] if parent!=None else dict()
+                ff=self.folders[rr]
+                self.set_folder(rr, ff["stat"], ff["own"], parent_tags| ff["own"], ff["no"])
+
+    def query(self, query, include_no=True):
+        """
+        queryに一致するフォルダのrelpathのリスト(たどる順)。include_noがFalseなら.noのフォルダは除く。
+        key=valueごとのフォルダの集合の積と和で求めるので、フォルダをたどらない。
+        """
+        result=None
+        for key,values in query.items():
+            rels=set()
+            for vv in values:
+                rels|=self.postings.get(key, dict()).get(vv, set())
+            result= rels if result==None else result&rels
+        if result==None:
+            result=set(self.folders.keys())
+        if not include_no:
+            result={rr for rr in result if not self.folders[rr]["no"]}
+        return sorted(result, key=lambda rr: () if rr=="." else tuple(rr.split(os.sep)))
+
+    def values(self, key):
+        """keyの値のリスト(GUIの候補用)"""
+        return sorted(self.postings.get(key, dict()).keys())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+フォルダのtag(json)の継承を解決するresolver。
+フォルダのtagは、親フォルダの解決済みdictに自分のjsonを上書きしたもの。
+読んだjsonはmtimeとsizeで覚えておき、変わったときだけ読み直す。
+"""
+
+import os
+import json
+
+
+def norm_path(path):
+    """dictのkeyにするpath。samefileを使わず文字列で比較する"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class TagResolver:
+    def __init__(self, root_path, json_filename):
+        self.root_path=norm_path(root_path)
+        self.json_filename=json_filename
+        self._own=dict()      #dirpath: ((mtime_ns,size), dict) フォルダ自身のjson
+        self._resolved=dict() #dirpath: (親の解決済みdict, 自身のjsonのstat, 解決済みdict)
+
+    def is_in_root(self, path):
+        path=norm_path(path)
+        return path==self.root_path or path.startswith(os.path.join(self.root_path, ""))
+
+    def own_dict(self, path, has_json=True):
+        """
+        フォルダ自身のjson。なければ{}。
+        前回とstat(mtime,size)が同じならファイルを読まない。
+        has_jsonがFalse(scan indexでjsonがないとわかっている)ときはstatもしない。
+        """
+        path=norm_path(path)
+        try:
+            if not has_json:
+                raise FileNotFoundError
+            st=os.stat(os.path.join(path, self.json_filename))
+            key=(st.st_mtime_ns, st.st_size)
+        except OSError:
+            key=None
+
+        cached=self._own.get(path)
+        if cached!=None and cached[0]==key:
+            return cached[1], key
+
+        if key==None:
+            jdict=dict()
+        else:
+            with open(os.path.join(path, self.json_filename), 'r', encoding='utf-8') as f:
+                jdict=json.load(f)
+        self._own[path]=(key, jdict)
+        return jdict, key
+
+    def resolve_child(self, parent_dict, path, has_json=True):
+        """
+        親の解決済みdictから、pathの解決済みdictを求める。上から順にたどるときに使う。
+        親のdict(同じobject)と自身のjsonが前回と同じなら、前回のdictをそのまま返す。
+        """
+        own, key=self.own_dict(path, has_json)
+        path=norm_path(path)
+        cached=self._resolved.get(path)
+        if cached!=None and cached[0] is parent_dict and cached[1]==key:
+            return cached[2]
+
+        jdict=parent_dict| own #子が上書き。keyの順は親が先
+        self._resolved[path]=(parent_dict, key, jdict)
+        return jdict
+
+    def resolve(self, path):
+        """
+        rootからpathまでのjsonを上書きしたdict(get_overwrite_json_dictと同じ内容)。
+        rootの外のpathは{}。
+        読むのは変わったjsonだけなので、GUIでフォルダを移動するたびにjsonを読み直さない。
+        返したdictは共有しているので、変更するときはcopyすること。
+        """
+        path=norm_path(path)
+        if not self.is_in_root(path):
+            return dict()
+        if path==self.root_path:
+            return self.resolve_child(_EMPTY, path)
+        return self.resolve_child(self.resolve(os.path.dirname(path)), path)
+
+    def invalidate(self, path=None):
+        """pathのjsonを読み直す。Noneのときは全部"""
+        if path==None:
+            self._own.clear()
+            self._resolved.clear()
+        else:
+            self._own.pop(norm_path(path), None)
+            self._resolved.pop(norm_path(path), None)
+
+
+_EMPTY=dict() #rootの親。resolve_childのcache判定でidentityを使うので同じobjectにする
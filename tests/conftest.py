@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+##########
+# (c) 2025 T. Hayakawa
+##########
+
+"""
+テスト用のデータの木とsub *.py。
+フォルダごとに rows.txt(1行目がヘッダー)を置き、sub *.pyはそれをそのままstdoutに出す。
+fail(exit 1)、sleep(秒数)、flaky(残りの失敗回数)のファイルで、フォルダの失敗をつくる。
+"""
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exe_json import startExeJson
+
+JSON="aa.json"
+NO=".no"
+
+SUB_ROWS='''import os, sys, time
+path=sys.argv[1]
+def read(name):
+    with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+        return f.read().strip()
+if os.path.exists(os.path.join(path, "fail")):
+    print("fail", file=sys.stderr)
+    sys.exit(1)
+if os.path.exists(os.path.join(path, "sleep")):
+    time.sleep(float(read("sleep")))
+if os.path.exists(os.path.join(path, "flaky")):
+    left=int(read("flaky"))
+    if left>0:
+        with open(os.path.join(path, "flaky"), 'w', encoding='utf-8') as f:
+            f.write(str(left-1))
+        sys.exit(1)
+print(read("rows.txt"))
+'''
+
+
+def write_folder(path, lines=None, tags=None):
+    """フォルダにrows.txtとtagのjsonを書く"""
+    os.makedirs(path, exist_ok=True)
+    if lines!=None:
+        with open(os.path.join(path, "rows.txt"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines)+"\n")
+    if tags!=None:
+        with open(os.path.join(path, JSON), 'w', encoding='utf-8') as f:
+            json.dump(tags, f)
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def sub_py(tmp_path):
+    """データの木の外に置いたsub *.py"""
+    path=tmp_path/"sub_rows.py"
+    path.write_text(SUB_ROWS, encoding='utf-8')
+    return str(path)
+
+@pytest.fixture
+def root(tmp_path):
+    """
+    root(tagA=1)の下に a(tagB=x), b(tagB=y), c(tagなし) の3フォルダ。列はどれも "file,v,"
+    """
+    root=tmp_path/"data"
+    write_folder(str(root), tags={"tagA":"1"})
+    write_folder(str(root/"a"), ["file,v,", "a1,1,", "a2,2,"], {"tagB":"x"})
+    write_folder(str(root/"b"), ["file,v,", "b1,3,"], {"tagB":"y"})
+    write_folder(str(root/"c"), ["file,v,", "c1,4,"])
+    return root
+
+@pytest.fixture
+def run(sub_py):
+    """startExeJson(root, sub_py, output, ...)。skip_rowは1(rows.txtのヘッダー)"""
+    def run(root, output="r.csv", **kwargs):
+        return startExeJson(str(root), kwargs.pop("sub", sub_py), output, JSON, kwargs.pop("skip_row", 1), NO, **kwargs)
+    return run
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from builtin_plugins import parse_plugin_spec, iter_plugin, plugin_hash, read_column, csv_stats
+from exe_json import startExeJson
+
+REPO=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_csv(path, values):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("t,v\n"+"".join(f"{ii},{vv}\n" for ii,vv in enumerate(values)))
+
+@pytest.fixture
+def folder(tmp_path):
+    path=tmp_path/"d"
+    path.mkdir()
+    write_csv(str(path/"200pa 50w.csv"), ["1", "2.50", "x", "1e3"])
+    write_csv(str(path/"100pa 10w.csv"), ["3", "4", "5", "6"])
+    return str(path)
+
+def test_parse_plugin_spec():
+    assert parse_plugin_spec("builtin:csv_column?col=2&start=1&end=9.5&ext=txt")== \
+        ("csv_column", {"col":2, "start":1, "end":9.5, "ext":"txt"})
+    with pytest.raises(ValueError):
+        parse_plugin_spec("builtin:nothing")
+
+def test_csv_column(folder):
+    """列名と値の文字列はsub_print_csv.pyと同じ。ファイルは名前順、数値でないセルは除く"""
+    rows=list(iter_plugin("builtin:csv_column?col=1&start=1&end=5", folder, "d"))
+    assert rows==[
+        ("file", " pa", " W", "0", "1", "2", "3", ""),
+        ("100pa 10w.csv", 100, 10, "3", "4", "5", "6", ""),
+        ("200pa 50w.csv", 200, 50, "1", "2.50", "1e3", ""),
+    ]
+
+def test_csv_stats(folder):
+    pytest.importorskip("numpy")
+    rows=list(csv_stats(folder, "d", col=1, start=1, end=5))
+    assert rows[0]==("file", "pa", "W", "mean", "std", "min", "max", "uniformity")
+    assert rows[1][:3]==("100pa 10w.csv", 100, 10)
+    assert rows[1][3:7]==pytest.approx((4.5, 1.118033988749895, 3.0, 6.0))
+    assert rows[1][7]==pytest.approx(3/9)
+
+def test_read_column(folder):
+    np=pytest.importorskip("numpy")
+    vals=read_column(os.path.join(folder, "200pa 50w.csv"), 1, 1, 5)
+    assert vals.dtype==np.float64 and vals.tolist()==[1.0, 2.5, 1000.0]
+
+def test_plugin_hash():
+    assert plugin_hash("builtin:csv_column")==plugin_hash("builtin:csv_column")
+    assert plugin_hash("builtin:csv_column")!=plugin_hash("builtin:csv_column?col=2")
+
+def test_same_result_as_sample(tmp_path):
+    """testdataで、builtin:csv_columnとsub_print_csv.pyのまとめcsvが同じ"""
+    import shutil
+    root=str(tmp_path/"testdata")
+    shutil.copytree(os.path.join(REPO, "testdata"), root)
+    os.remove(os.path.join(root, "result.csv"))
+    startExeJson(root, "builtin:csv_column", "b.csv", "aa.json", 1, "aa.no")
+    startExeJson(root, os.path.join(REPO, "sub_print_csv.py"), "s.csv", "aa.json", 1, "aa.no")
+    with open(os.path.join(root, "b.csv"), 'r', encoding='utf-8') as fb, \
+         open(os.path.join(root, "s.csv"), 'r', encoding='utf-8') as fs:
+        builtin=fb.read()
+        assert builtin==fs.read()
+    assert ",1,1.21," in builtin #1は1.0にならない
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from condition_parser import ConditionParser, DEFAULT_CONDITIONS, is_separate
+
+import re
+
+
+def test_default_conditions():
+    parser=ConditionParser(DEFAULT_CONDITIONS)
+    assert parser.parse("100pa 50w.csv")=={"pa":100, "W":50}
+    assert parser.parse_strings("150Pa.csv")==("150", "")
+    assert parser.column_names(with_unit=True)==["pa[Pa]", "W[W]"]
+
+def test_dispatch_order():
+    """同じ位置で一致するpatternは先のもの。同じ条件は最初に見つかった値"""
+    parser=ConditionParser([
+        {"name":"num", "pattern":r"(\d+)mm", "type":"int"},
+        {"name":"any", "pattern":r"\d+[a-z]+", "type":"str"},
+        {"name":"t", "pattern":r"t(\d+(?:\.\d+)?)", "type":"float"},
+    ])
+    assert parser.parse("12mm_34cm_t1.5_t2")=={"num":12, "any":"34cm", "t":1.5}
+    assert parser.parse("t3_t4")=={"num":None, "any":None, "t":3.0}
+
+def test_conversion_error_is_none():
+    parser=ConditionParser([{"name":"n", "pattern":r"n(\w+)", "type":"int"}])
+    assert parser.parse("nabc")=={"n":None}
+
+def test_backreference_is_separate():
+    """後方参照のpatternは、まとめるとgroupの番号がずれるので別々にsearchする"""
+    conditions=[
+        {"name":"pa", "pattern":r"(\d+)pa", "type":"int"},
+        {"name":"twice", "pattern":r"(\w)\1", "type":"str"},
+        {"name":"W", "pattern":r"(\d+)w", "type":"int"},
+    ]
+    parser=ConditionParser(conditions)
+    assert [is_separate(re.compile(cc["pattern"])) for cc in conditions]==[False, True, False]
+    assert parser.parse("1pa abba 5w")=={"pa":1, "twice":"b", "W":5}
+    assert parser.parse("1pa 5w")["twice"]==None
+
+def test_global_flag_is_separate():
+    parser=ConditionParser([
+        {"name":"gas", "pattern":r"(?i)\b(ar|n2)\b", "type":"str"},
+        {"name":"pa", "pattern":r"(\d+)pa", "type":"int"},
+    ])
+    assert parser.parse("AR 100pa")=={"gas":"AR", "pa":100}
+    assert parser.parse("ar 100PA")=={"gas":"ar", "pa":None} #flagはそのpatternだけ
+
+def test_same_group_name_falls_back():
+    parser=ConditionParser([
+        {"name":"a", "pattern":r"a(?P<v>\d+)", "type":"int"},
+        {"name":"b", "pattern":r"b(?P<v>\d+)", "type":"int"},
+    ])
+    assert parser.regex==None
+    assert parser.parse("b2a1")=={"a":1, "b":2}
+
+def test_parse_is_cached():
+    parser=ConditionParser(DEFAULT_CONDITIONS)
+    assert parser.parse("1pa.csv") is parser.parse("1pa.csv")
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from line_reader import LineReader, read_lines
+
+
+def write_rows(path, count, newline="\n"):
+    with open(path, 'w', encoding='utf-8', newline="") as f:
+        f.write("".join(f"row{ii},{ii*ii}"+newline for ii in range(count)))
+    return str(path)
+
+def test_windows(tmp_path):
+    path=write_rows(tmp_path/"a.csv", 20)
+    assert read_lines(path, 2, 5)==["row2,4", "row3,9", "row4,16"]
+    assert read_lines(path, 18, 30)==["row18,324", "row19,361"]
+    assert read_lines(path, 20, 30)==[]
+    assert read_lines(path, 0, 1)==["row0,0"]
+
+def test_crlf_and_last_line_without_newline(tmp_path):
+    path=str(tmp_path/"b.csv")
+    with open(path, 'wb') as f:
+        f.write(b"h\r\n1\r\n2")
+    assert read_lines(path, 0, 10)==["h", "1", "2"]
+
+def test_empty_file(tmp_path):
+    path=str(tmp_path/"e.csv")
+    open(path, 'wb').close()
+    assert read_lines(path, 0, 10)==[]
+
+def test_seek_after_checkpoints(tmp_path):
+    """strideごとのcheckpointを記録し、記録したあとのseekも同じ行になる"""
+    path=write_rows(tmp_path/"a.csv", 50)
+    with LineReader(path, stride=4) as lr:
+        assert list(lr.lines(21, 23))==["row21,441", "row22,484"]
+        assert len(lr.offsets)==6 #0,4,..,20行目
+        for row in (0, 3, 4, 9, 20, 21, 49):
+            assert list(lr.lines(row, row+1))==[f"row{row},{row*row}"]
+        assert list(lr.lines(7, 9))==["row7,49", "row8,64"]
+        assert lr.seek_line(50)==None and lr.eof_line==50
+
+def test_saved_index(tmp_path):
+    path=write_rows(tmp_path/"a.csv", 50)
+    index_dir=str(tmp_path/"idx")
+    with LineReader(path, index_dir, stride=4) as lr:
+        list(lr.lines(40, 41))
+    assert len(os.listdir(index_dir))==1
+    with LineReader(path, index_dir, stride=4) as lr:
+        assert len(lr.offsets)==11
+        assert list(lr.lines(45, 47))==["row45,2025", "row46,2116"]
+    #ファイルが変わったら保存したindexは使わない
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("x\n"*3)
+    with LineReader(path, index_dir, stride=4) as lr:
+        assert lr.offsets==[0]
+        assert list(lr.lines(1, 10))==["x", "x"]
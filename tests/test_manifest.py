@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from conftest import write_folder, read_text
+from tag_index import parse_query
+
+
+def test_incremental_uses_cache(root, run):
+    run(root, incremental=True)
+    write_folder(str(root/"b"), ["file,v,", "b1,30,"])
+    summary=run(root, incremental=True)
+    assert (summary["done"], summary["cached"])==(3, 2)
+    assert "1,y,b,b1,30," in read_text(root/"r.csv")
+
+def test_filtered_run_keeps_other_folders(root, run):
+    """--whereで一部だけ実行しても、ほかのフォルダのmanifestとcacheは残る"""
+    run(root, incremental=True)
+    summary=run(root, incremental=True, tag_query=parse_query("tagB=y"))
+    assert (summary["folders"], summary["cached"])==(1, 1)
+    summary=run(root, incremental=True)
+    assert (summary["folders"], summary["cached"])==(3, 3)
+
+def test_folders_run_keeps_other_folders(root, run):
+    run(root, incremental=True)
+    run(root, incremental=True, folders=["a"])
+    assert run(root, incremental=True)["cached"]==3
+
+def test_cache_of_other_output_is_not_data(root, run):
+    """ほかの--outputのcacheフォルダとmanifestは、データのフォルダとしてたどらない"""
+    run(root, "other.csv", incremental=True)
+    assert os.path.isdir(str(root/"other.csv.cache"))
+    summary=run(root, incremental=True)
+    assert summary["folders"]==3
+    assert "other.csv" not in read_text(root/"r.csv")
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import exe_json
+from conftest import write_folder, read_text
+
+
+def test_parallel_submits_a_window(root, run, monkeypatch):
+    """並列実行では、submitしてまだ書いていないフォルダはworkerの数+SUBMIT_AHEAD個まで。出力の順は逐次実行と同じ"""
+    for ii in range(12):
+        write_folder(str(root/f"d{ii:02d}"), ["file,v,", f"d{ii},{ii},"])
+    run(root, "all.csv")
+    counts={"submitted":0, "written":0, "max":0}
+    make=exe_json.makeExecutor
+    def counting(*args, **kwargs):
+        executor,submit=make(*args, **kwargs)
+        def wrapped(*job):
+            counts["submitted"]+=1
+            counts["max"]=max(counts["max"], counts["submitted"]-counts["written"])
+            return submit(*job)
+        return executor,wrapped
+    def progress(done, total, relpath, seconds):
+        counts["written"]=done
+    monkeypatch.setattr(exe_json, "makeExecutor", counting)
+    summary=run(root, max_workers=2, progress_callback=progress)
+    assert summary["done"]==15
+    assert counts["submitted"]==15
+    assert counts["max"]<=2+exe_json.SUBMIT_AHEAD, counts
+    assert read_text(root/"r.csv")==read_text(root/"all.csv")
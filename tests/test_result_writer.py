@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+from conftest import write_folder, read_text
+from result_writer import CsvResultWriter, ArrowResultWriter, NpzResultWriter
+from run_errors import error_paths
+
+
+def test_union_of_tag_keys_and_columns(root, run):
+    """tagのkeyが違うフォルダ、sub *.pyの列が増えるフォルダは、列を足して前の行を空でそろえる"""
+    write_folder(str(root/"b"), ["file,v,w,", "b1,3,5,"], {"tagB":"y", "tagC":"z"})
+    run(root)
+    assert read_text(root/"r.csv")==(
+        "tagA,tagB,tagC,dir,file,v,w,\n"
+        "1,x,,a,a1,1,,\n"
+        "1,x,,a,a2,2,,\n"
+        "1,y,z,b,b1,3,5,\n"
+        "1,,,c,c1,4,,\n")
+
+def test_union_reorders_columns(root, run):
+    """列の順が違うフォルダは、列名で並べ直す"""
+    write_folder(str(root/"b"), ["file,w,v,", "b1,5,3,"])
+    run(root, max_workers=2)
+    assert read_text(root/"r.csv")==(
+        "tagA,tagB,dir,file,v,w,\n"
+        "1,x,a,a1,1,,\n"
+        "1,x,a,a2,2,,\n"
+        "1,y,b,b1,3,5,\n"
+        "1,,c,c1,4,,\n")
+
+def test_extra_values_after_union_columns(root, run):
+    """ヘッダーより長い行の余りの値は、あとで増えた列も含めて、名前のある列の右に書く"""
+    write_folder(str(root/"a"), ["file,v,", "a1,1,9,8,", "a2,2,"])
+    write_folder(str(root/"b"), ["file,v,w,", "b1,3,5,"])
+    write_folder(str(root/"c"), ["file,v,", "c1,4,7,6,"])
+    run(root)
+    assert read_text(root/"r.csv")==(
+        "tagA,tagB,dir,file,v,w,\n"
+        "1,x,a,a1,1,,9,8,\n"
+        "1,x,a,a2,2,,\n"
+        "1,y,b,b1,3,5,\n"
+        "1,,c,c1,4,,7,6,\n")
+
+def test_csv_discard_restores_columns(tmp_path):
+    """途中で止めたフォルダが足した列は、まとめに残らない"""
+    path=str(tmp_path/"r.csv")
+    with CsvResultWriter(path, tag_keys=["k"]) as writer:
+        writer.begin_folder({"k":"1"}, "a")
+        writer.mark_folder()
+        writer.write_header(["file,x,"])
+        writer.write_line("f1,1,")
+        writer.end_folder()
+        writer.begin_folder({"k":"2"}, "b")
+        writer.mark_folder()
+        writer.write_header(["file,x,y,"])
+        writer.write_line("f2,2,3,")
+        writer.discard_folder()
+    assert read_text(path)=="k,dir,file,x,\n1,a,f1,1,\n"
+
+
+def write_columnar(writer):
+    """chunk_rows=1で、最初のchunkのあとに列が増える。最後のフォルダは止める"""
+    with writer:
+        for relpath,header,lines in [("a", "file,x", ["f1,1", "f2,2"]), ("b", "file,y", ["f3,s"]),
+                                     ("c", "file,x,z", ["f4,4,5"])]:
+            writer.begin_folder({"k":relpath}, relpath)
+            writer.mark_folder()
+            writer.write_header([header])
+            for line in lines:
+                writer.write_line(line)
+            writer.end_folder()
+        writer.begin_folder({"k":"d"}, "d")
+        writer.mark_folder()
+        writer.write_header(["file,bad"])
+        writer.write_line("f9,9")
+        writer.discard_folder()
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_arrow_late_columns(tmp_path, file_format):
+    pa=pytest.importorskip("pyarrow")
+    path=str(tmp_path/("r."+file_format))
+    write_columnar(ArrowResultWriter(path, file_format, chunk_rows=1, tag_keys=["k"]))
+    if file_format=="parquet":
+        import pyarrow.parquet as pq
+        table=pq.read_table(path)
+    else:
+        table=pa.ipc.open_file(path).read_all()
+    data=table.to_pydict()
+    assert table.column_names==["k", "dir", "file", "x", "y", "z"]
+    assert data["file"]==["f1", "f2", "f3", "f4"]
+    assert data["y"]==[None, None, "s", ""]
+    assert data["z"]==[None, None, None, 5.0]
+
+def test_npz_late_columns(tmp_path):
+    np=pytest.importorskip("numpy")
+    path=str(tmp_path/"r.npz")
+    write_columnar(NpzResultWriter(path, chunk_rows=1, tag_keys=["k"]))
+    data=np.load(path)
+    assert "bad" not in data.files
+    assert data["file"].tolist()==["f1", "f2", "f3", "f4"]
+    assert data["y"].tolist()==["", "", "s", ""]
+    assert np.isnan(data["z"][:3]).all() and data["z"][3]==5.0
+
+def write_late_text(writer):
+    """chunk_rows=1で、数値で始まったx列に、あとのchunkで数値でない値が入る"""
+    with writer:
+        for relpath,line in [("a", "f1,1"), ("b", "f2,"), ("c", "f3,n/a"), ("d", "f4,2.5")]:
+            writer.begin_folder({"k":relpath}, relpath)
+            writer.mark_folder()
+            writer.write_header(["file,x"])
+            writer.write_line(line)
+            writer.end_folder()
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_arrow_late_text_becomes_string(tmp_path, file_format):
+    pa=pytest.importorskip("pyarrow")
+    path=str(tmp_path/("r."+file_format))
+    write_late_text(ArrowResultWriter(path, file_format, chunk_rows=1, tag_keys=["k"]))
+    if file_format=="parquet":
+        import pyarrow.parquet as pq
+        table=pq.read_table(path)
+    else:
+        table=pa.ipc.open_file(path).read_all()
+    assert table.schema.field("x").type==pa.string()
+    assert table.to_pydict()["x"]==["1", "", "n/a", "2.5"]
+
+def test_npz_late_text_becomes_string(tmp_path):
+    np=pytest.importorskip("numpy")
+    path=str(tmp_path/"r.npz")
+    write_late_text(NpzResultWriter(path, chunk_rows=1, tag_keys=["k"]))
+    data=np.load(path)
+    assert data["x"].tolist()==["1", "", "n/a", "2.5"]
+    assert data["k"].tolist()==[0, 1, 2, 3]
+    assert os.listdir(str(tmp_path))==["r.npz"] #chunkの一時ファイルは残らない
+
+def test_missing_backend_fails_before_run(root, run, monkeypatch):
+    """numpyが無いときは、フォルダを実行する前にImportError"""
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    (root/"a"/"fail").write_text("", encoding='utf-8')
+    with pytest.raises(ImportError):
+        run(root, result_format="npz")
+    assert not os.path.exists(str(root/"r.npz"))
+    assert not os.path.exists(error_paths(str(root/"r.csv"))[1])
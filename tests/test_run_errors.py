@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from conftest import read_text
+from run_errors import error_paths, load_failed
+
+
+def test_failed_folder_is_skipped(root, run):
+    (root/"b"/"fail").write_text("", encoding='utf-8')
+    summary=run(root)
+    assert summary["failed_folders"]==["b"]
+    assert "b1" not in read_text(root/"r.csv")
+    assert load_failed(str(root/"r.csv"))==["b"]
+    assert "b: attempt 1 failed" in read_text(error_paths(str(root/"r.csv"))[0])
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_retry_flaky_folder(root, run, max_workers):
+    (root/"b"/"flaky").write_text("1", encoding='utf-8')
+    summary=run(root, max_workers=max_workers, retries=1)
+    assert summary["failed"]==0
+    assert "1,y,b,b1,3," in read_text(root/"r.csv")
+    assert not os.path.exists(error_paths(str(root/"r.csv"))[1])
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_timeout(root, run, max_workers):
+    (root/"a"/"sleep").write_text("30", encoding='utf-8')
+    summary=run(root, max_workers=max_workers, timeout=1)
+    assert summary["failed_folders"]==["a"]
+    assert summary["seconds"]<20
+    assert read_text(root/"r.csv").splitlines()[1:]==["1,y,b,b1,3,", "1,,c,c1,4,"]
+
+def test_rerun_failed(root, run):
+    """前回失敗したフォルダだけを実行し直してupsertする"""
+    (root/"b"/"fail").write_text("", encoding='utf-8')
+    run(root)
+    os.remove(str(root/"b"/"fail"))
+    summary=run(root, upsert=True, folders=load_failed(str(root/"r.csv")))
+    assert summary["folders"]==1
+    assert "1,y,b,b1,3," in read_text(root/"r.csv")
+    assert load_failed(str(root/"r.csv"))==[]
+
+def test_timeout_needs_subprocess(root, run):
+    """組み込みpluginは途中で止められないので、timeoutはフォルダを実行する前にValueError"""
+    with pytest.raises(ValueError):
+        run(root, sub="builtin:csv_column", timeout=1)
+    assert not os.path.exists(str(root/"r.csv"))
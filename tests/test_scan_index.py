@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+
+from scan_index import ScanIndex, scan_entries, entry_file_info, index_path_of, FILE_MODE
+
+
+def make_tree(tmp_path):
+    root=tmp_path/"root"
+    (root/"a"/"a1").mkdir(parents=True)
+    (root/"b").mkdir()
+    (root/"aa.json").write_text("{}", encoding='utf-8')
+    (root/"a"/"x.csv").write_text("12345", encoding='utf-8')
+    (root/"b"/"aa.no").write_text("", encoding='utf-8')
+    (root/"r.csv.cache").mkdir()
+    (root/"r.csv.manifest.json").write_text("{}", encoding='utf-8')
+    return str(root)
+
+def touch_dir(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_refresh(tmp_path):
+    root=make_tree(tmp_path)
+    index=ScanIndex(root, "aa.json", "aa.no")
+    index.refresh()
+    assert sorted(index.dirs)==[".", "a", os.path.join("a", "a1"), "b"] #実行のcacheは入らない
+    assert index.dirs["."]["has_json"] and index.dirs["b"]["has_no"]
+    assert [ff[0] for ff in index.dirs["."]["files"]]==["aa.json"]
+    assert entry_file_info(index.dirs["a"])==(1, 1, 5)
+
+def test_rescan_only_changed_folders(tmp_path):
+    root=make_tree(tmp_path)
+    index=ScanIndex(root, "aa.json", "aa.no")
+    index.refresh()
+    index.save()
+    assert stat.S_IMODE(os.stat(index_path_of(root, "aa.json")).st_mode)==FILE_MODE
+
+    loaded=ScanIndex(root, "aa.json", "aa.no")
+    loaded.load()
+    assert loaded.dirs==index.dirs
+    #mtimeが同じフォルダはscandirしない
+    (tmp_path/"root"/"b"/"new.csv").write_text("1", encoding='utf-8')
+    touch_dir(os.path.join(root, "b"), loaded.dirs["b"]["mtime"])
+    loaded.refresh()
+    assert len(loaded.dirs["b"]["files"])==1
+    touch_dir(os.path.join(root, "b"), loaded.dirs["b"]["mtime"]+10**9)
+    loaded.refresh()
+    assert len(loaded.dirs["b"]["files"])==2
+    #無くなったフォルダは消える
+    os.rmdir(os.path.join(root, "a", "a1"))
+    loaded.refresh()
+    assert os.path.join("a", "a1") not in loaded.dirs
+
+def test_entry_without_refresh(tmp_path):
+    root=make_tree(tmp_path)
+    index=ScanIndex(root, "aa.json", "aa.no")
+    assert index.entry(os.path.join(root, "a"), refresh=False)==None
+    assert index.entry(str(tmp_path), refresh=True)==None #rootの外
+    entry=index.entry(os.path.join(root, "a"))
+    assert entry["dirs"]==["a1"]
+    assert index.entry(os.path.join(root, "a"), refresh=False) is entry
+
+def test_set_entry_from_background_scan(tmp_path):
+    root=make_tree(tmp_path)
+    index=ScanIndex(root, "aa.json", "aa.no")
+    counts=[]
+    files, dirs=scan_entries(root, lambda *args: counts.append(args), every=1)
+    assert sorted(dirs)==["a", "b"] and len(counts)>0
+    entry=index.set_entry(root, 1, files, dirs)
+    assert entry["has_json"] and entry["dirs"]==["a", "b"]
+    assert index.entry(root, refresh=False) is entry
+    assert index.set_entry(str(tmp_path), 1, files, dirs)==None
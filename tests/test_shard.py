@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+
+import pytest
+
+from conftest import write_folder, read_text
+from run_shard import merge_shards, shard_of, shard_result_path, shard_info_path
+from run_errors import error_paths, load_failed
+
+
+@pytest.fixture
+def wide_root(root):
+    """sub *.pyの列がフォルダで違う木。shardによって列の数が違い、ヘッダーより長い行もある"""
+    write_folder(str(root/"b"), ["file,v,w,", "b1,3,5,"])
+    for ii in range(6):
+        write_folder(str(root/f"d{ii}"), ["file,v,", f"d{ii},{ii},", f"e{ii},{ii},9,8,"]) #余りの値のある行
+    return root
+
+@pytest.mark.parametrize("count", [1, 2, 3])
+def test_merge_equals_single_run(wide_root, run, count):
+    run(wide_root, "all.csv")
+    assert "1,,d1,e1,1,,9,8," in read_text(wide_root/"all.csv")
+    for ii in range(count):
+        summary=run(wide_root, shard=(ii, count))
+        assert summary["shard"]==[ii, count]
+    merge_shards(str(wide_root/"r.csv"), count, remove=True)
+    assert read_text(wide_root/"r.csv")==read_text(wide_root/"all.csv")
+    assert not os.path.exists(shard_result_path(str(wide_root/"r.csv"), 0, count))
+
+def test_merge_mismatched_columns(wide_root, run):
+    """列がそろわないshardはValueErrorで、途中のファイルを残さない"""
+    count=2
+    for ii in range(count):
+        run(wide_root, shard=(ii, count))
+    assert shard_of("b", count)!=shard_of("d1", count)
+    shard=shard_result_path(str(wide_root/"r.csv"), shard_of("d1", count), count)
+    with open(shard_info_path(shard), 'r', encoding='utf-8') as f:
+        info=json.load(f)
+    info["columns"]=list(reversed(info["columns"]))
+    with open(shard_info_path(shard), 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    with pytest.raises(ValueError):
+        merge_shards(str(wide_root/"r.csv"), count)
+    assert not os.path.exists(str(wide_root/"r.csv"))
+    assert not os.path.exists(str(wide_root/"r.csv.tmp"))
+
+def test_merge_needs_every_shard(root, run):
+    run(root, shard=(0, 2))
+    with pytest.raises(ValueError):
+        merge_shards(str(root/"r.csv"), 2)
+
+def test_merge_failed_folders(wide_root, run):
+    """shardごとのfailed.jsonとerror logはmergeでまとめ、分けないで実行したときと同じにrerunできる(列は変わらないフォルダ)"""
+    count=2
+    for name in ["c", "d1"]:
+        (wide_root/name/"fail").write_text("", encoding='utf-8')
+    assert shard_of("c", count)!=shard_of("d1", count)
+    for ii in range(count):
+        run(wide_root, shard=(ii, count))
+    summary=merge_shards(str(wide_root/"r.csv"), count, remove=True)
+    assert summary["failed"]==2
+    assert sorted(load_failed(str(wide_root/"r.csv")))==["c", "d1"]
+    log=read_text(error_paths(str(wide_root/"r.csv"))[0])
+    assert "c: attempt 1 failed" in log and "d1: attempt 1 failed" in log
+    for ii in range(count):
+        assert not any(os.path.exists(pp) for pp in error_paths(shard_result_path(str(wide_root/"r.csv"), ii, count)))
+
+    for name in ["c", "d1"]:
+        os.remove(str(wide_root/name/"fail"))
+    run(wide_root, upsert=True, folders=load_failed(str(wide_root/"r.csv")))
+    run(wide_root, "all.csv")
+    assert read_text(wide_root/"r.csv")==read_text(wide_root/"all.csv")
+    assert load_failed(str(wide_root/"r.csv"))==[]
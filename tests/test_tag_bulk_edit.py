@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+
+import pytest
+
+from conftest import write_folder
+from tag_bulk_edit import (INHERIT, parse_patch, glob_folders, plan_bulk_edit, apply_bulk_edit, format_plan,
+                           update_master)
+from tag_resolver import TagResolver, norm_path
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def test_parse_patch():
+    assert parse_patch("k=v; -k2 ;k3 = a b")=={"k":"v", "k2":INHERIT, "k3":"a b"}
+    assert parse_patch("")=={}
+    with pytest.raises(ValueError):
+        parse_patch("k")
+
+def test_glob_folders(root):
+    (root/"r.csv.cache").mkdir()
+    (root/"a"/"x.cache").mkdir()
+    assert glob_folders(str(root), "*")==[os.path.normpath(str(root/nn)) for nn in ("a", "b", "c")]
+    assert glob_folders(str(root), "**")==[os.path.normpath(str(root))]+[os.path.normpath(str(root/nn)) for nn in ("a", "b", "c")]
+
+def test_plan_override_and_inherit(root):
+    """親と同じ値になるフォルダは自分のjsonから消し(inherit)、違う値は書く(override)"""
+    changes=plan_bulk_edit(str(root), "aa.json", [str(root/"a"), str(root/"b"), str(root/"c")], parse_patch("tagA=1;tagB=y"))
+    by_path={os.path.basename(cc["path"]):cc for cc in changes}
+    assert sorted(by_path)==["a", "c"] #bは変わらない
+    assert by_path["a"]["actions"]=={"tagB":"override"}
+    assert by_path["a"]["new"]=={"tagB":"y"}
+    assert by_path["c"]["old"]==None and by_path["c"]["new"]=={"tagB":"y"}
+
+def test_inherit_key_and_parent_in_same_batch(root):
+    """"-key"は自分のjsonから消す。親も変えるときは、変更後の親の値とくらべる"""
+    write_folder(str(root/"a"/"a1"), tags={"tagB":"z"})
+    changes=plan_bulk_edit(str(root), "aa.json", [str(root/"a"/"a1"), str(root/"a")], parse_patch("tagB=z"))
+    assert [(os.path.relpath(cc["path"], norm_path(str(root))), cc["actions"]) for cc in changes]== \
+        [("a", {"tagB":"override"}), (os.path.join("a", "a1"), {"tagB":"inherit"})]
+    changes=plan_bulk_edit(str(root), "aa.json", [str(root/"b")], parse_patch("-tagB"))
+    assert changes[0]["new"]=={} and changes[0]["actions"]=={"tagB":"inherit"}
+    assert "(inherit)" in format_plan(changes, str(root))
+
+def test_apply(root, tmp_path):
+    resolver=TagResolver(str(root), "aa.json")
+    assert resolver.resolve(str(root/"b"))["tagB"]=="y"
+    master=str(tmp_path/"mas.json")
+    with open(master, 'w', encoding='utf-8') as f:
+        json.dump({"tagB":"x,y"}, f)
+    changes=plan_bulk_edit(str(root), "aa.json", [str(root/"b"), str(root/"c")], parse_patch("tagB=w"), resolver)
+    apply_bulk_edit(changes, master, resolver)
+    assert read_json(str(root/"c"/"aa.json"))=={"tagB":"w"}
+    assert resolver.resolve(str(root/"b"))["tagB"]=="w"
+    assert read_json(master)=={"tagB":"x,y,w"}
+    assert not any(ff.endswith(".tmp") for ff in os.listdir(str(root/"b")))
+
+def test_update_master(tmp_path):
+    master=str(tmp_path/"mas.json")
+    assert update_master(master, {"k":["a", "b", "a"]})
+    assert read_json(master)=={"k":"a,b"}
+    assert not update_master(master, {"k":["b"]})
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from conftest import write_folder
+from scan_index import ScanIndex
+from tag_index import TagIndex, parse_query, match_tags
+
+
+def test_parse_query():
+    assert parse_query("k=v;k2=a|b")=={"k":["v"], "k2":["a", "b"]}
+    assert parse_query(" k = v ; ; k2 = a | b ")=={"k":["v"], "k2":["a", "b"]}
+    assert parse_query("")=={}
+    assert parse_query("k=")=={"k":[""]}
+    with pytest.raises(ValueError):
+        parse_query("k;k2=a")
+
+def test_match_tags():
+    assert match_tags({"k":"v", "n":2}, parse_query("k=v;n=1|2"))
+    assert not match_tags({"k":"v"}, parse_query("k=v;n=2"))
+    assert match_tags({}, {})
+
+def build(root):
+    scan=ScanIndex(str(root), "aa.json", ".no")
+    scan.refresh()
+    index=TagIndex(str(root), "aa.json", ".no")
+    index.load()
+    index.refresh(scan)
+    return scan, index
+
+def test_query(root):
+    (root/"c"/".no").write_text("", encoding='utf-8')
+    write_folder(str(root/"a"/"a1"), tags={"tagB":"y"})
+    scan, index=build(root)
+    assert index.query(parse_query("tagB=x"))==["a"]
+    assert index.query(parse_query("tagB=x|y"))==["a", os.path.join("a", "a1"), "b"]
+    assert index.query(parse_query("tagA=1;tagB=y"))==[os.path.join("a", "a1"), "b"]
+    assert index.query(parse_query("tagA=2"))==[]
+    assert index.query({}, include_no=False)==[".", "a", os.path.join("a", "a1"), "b"]
+    assert index.values("tagB")==["x", "y"]
+
+def test_save_load_and_update(root):
+    scan, index=build(root)
+    index.save()
+    loaded=TagIndex(str(root), "aa.json", ".no")
+    loaded.load()
+    assert loaded.query(parse_query("tagB=y"))==["b"]
+    #jsonを書いたフォルダと子孫だけ解決し直す
+    write_folder(str(root), tags={"tagA":"2"})
+    loaded.update_folders([str(root)])
+    assert loaded.query(parse_query("tagA=2"))==[".", "a", "b", "c"]
+    assert loaded.query(parse_query("tagA=1"))==[]
+
+def test_refresh_drops_removed_folders(root):
+    scan, index=build(root)
+    os.remove(str(root/"b"/"aa.json"))
+    os.remove(str(root/"b"/"rows.txt"))
+    os.rmdir(str(root/"b"))
+    scan.refresh()
+    index.refresh(scan)
+    assert index.query(parse_query("tagB=y"))==[]
+    assert "b" not in index.folders
+
+def test_collect_jobs_uses_index(root):
+    """tag_queryの実行は、tag indexで引いたフォルダを、たどる順・解決済みのtagで返す"""
+    from exe_json import collectJobs
+    write_folder(str(root/"a"/"a1"), tags={"tagB":"y"})
+    (root/"c"/".no").write_text("", encoding='utf-8')
+    query=parse_query("tagA=1;tagB=y")
+    expected=[job for job in collectJobs(str(root), "aa.json", ".no") if match_tags(job[2], query)]
+    jobs=collectJobs(str(root), "aa.json", ".no", query)
+    assert jobs==expected
+    assert [job[1] for job in jobs]==[os.path.join("a", "a1"), "b"]
+    assert os.path.exists(str(root/"aa.tagindex.json"))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+
+from tag_resolver import TagResolver
+
+
+def write_json(path, data, mtime_ns=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    if mtime_ns!=None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def make_tree(tmp_path):
+    root=str(tmp_path/"root")
+    write_json(os.path.join(root, "aa.json"), {"tagA":"1", "tagB":"a"})
+    write_json(os.path.join(root, "p", "aa.json"), {"tagB":"b", "tagC":"c"})
+    os.makedirs(os.path.join(root, "p", "q"))
+    return root
+
+def test_own_overrides_parent(tmp_path):
+    root=make_tree(tmp_path)
+    resolver=TagResolver(root, "aa.json")
+    assert resolver.resolve(root)=={"tagA":"1", "tagB":"a"}
+    assert resolver.resolve(os.path.join(root, "p"))=={"tagA":"1", "tagB":"b", "tagC":"c"}
+    assert list(resolver.resolve(os.path.join(root, "p")))==["tagA", "tagB", "tagC"] #親のkeyが先
+    assert resolver.resolve(os.path.join(root, "p", "q"))=={"tagA":"1", "tagB":"b", "tagC":"c"}
+    assert resolver.resolve(str(tmp_path))=={} #rootの外
+
+def test_cache_and_mtime_invalidation(tmp_path):
+    root=make_tree(tmp_path)
+    resolver=TagResolver(root, "aa.json")
+    q=os.path.join(root, "p", "q")
+    first=resolver.resolve(q)
+    assert resolver.resolve(q) is first #変わっていなければ同じdict
+
+    #親のjsonのmtimeが変わったら、子も解決し直す
+    write_json(os.path.join(root, "p", "aa.json"), {"tagB":"z", "tagC":"c"}, mtime_ns=10**18)
+    second=resolver.resolve(q)
+    assert second is not first
+    assert second["tagB"]=="z"
+
+    #自分のjsonができたとき
+    write_json(os.path.join(q, "aa.json"), {"tagA":"9"})
+    assert resolver.resolve(q)=={"tagA":"9", "tagB":"z", "tagC":"c"}
+
+def test_invalidate(tmp_path):
+    root=make_tree(tmp_path)
+    resolver=TagResolver(root, "aa.json")
+    path=os.path.join(root, "aa.json")
+    st=os.stat(path)
+    resolver.resolve(root)
+    #statが同じまま書きかわったときは、invalidateで読み直す
+    write_json(path, {"tagA":"2", "tagB":"a"})
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert resolver.resolve(root)["tagA"]=="1"
+    resolver.invalidate(root)
+    assert resolver.resolve(root)["tagA"]=="2"
+
+def test_has_json_false_skips_stat(tmp_path):
+    root=make_tree(tmp_path)
+    resolver=TagResolver(root, "aa.json")
+    assert resolver.resolve_child({"k":"v"}, os.path.join(root, "p"), has_json=False)=={"k":"v"}
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import exe_json
+from conftest import write_folder, read_text
+from tag_index import parse_query
+
+
+def test_upsert_replaces_only_ran_folders(root, run):
+    run(root)
+    write_folder(str(root/"a"), ["file,v,", "a1,10,"])
+    write_folder(str(root/"b"), ["file,v,", "b1,30,"])
+    summary=run(root, upsert=True, tag_query=parse_query("tagB=x"))
+    assert summary["folders"]==1
+    assert read_text(root/"r.csv")==(
+        "tagA,tagB,dir,file,v,\n"
+        "1,x,a,a1,10,\n"
+        "1,y,b,b1,3,\n"
+        "1,,c,c1,4,\n")
+    assert not os.path.exists(str(root/"r.csv.new"))
+
+def test_upsert_needs_header(root, run):
+    """skip_row=0ではdir列がわからないので、実行する前にエラー"""
+    run(root)
+    before=read_text(root/"r.csv")
+    with pytest.raises(ValueError):
+        run(root, upsert=True, skip_row=0)
+    assert read_text(root/"r.csv")==before
+
+def test_upsert_adds_tag_column(root, run):
+    """tagのkeyが増えたときは、前回の行のtagの列を空でそろえる"""
+    run(root)
+    write_folder(str(root/"c"), tags={"tagD":"d"})
+    run(root, upsert=True, tag_query=parse_query("tagD=d"))
+    assert read_text(root/"r.csv")==(
+        "tagA,tagB,tagD,dir,file,v,\n"
+        "1,x,,a,a1,1,\n"
+        "1,x,,a,a2,2,\n"
+        "1,y,,b,b1,3,\n"
+        "1,,d,c,c1,4,\n")
+
+def test_upsert_keeps_old_column_order(root, run):
+    """列は前回のまとめの順から始めるので、tagのkeyの順が前回と違ってもそろう"""
+    with open(str(root/"r.csv"), 'w', encoding='utf-8') as f:
+        f.write("tagB,tagA,dir,file,v,\nx,1,a,a1,1,\nx,1,a,a2,2,\n")
+    run(root, upsert=True, tag_query=parse_query("tagB=y"))
+    assert read_text(root/"r.csv")==(
+        "tagB,tagA,dir,file,v,\n"
+        "x,1,a,a1,1,\n"
+        "x,1,a,a2,2,\n"
+        "y,1,b,b1,3,\n")
+
+def test_upsert_error_keeps_result(root, run, monkeypatch):
+    """upsertできないときは、まとめを変えず、今回の出力(.new)も残さない"""
+    run(root)
+    before=read_text(root/"r.csv")
+    def fail(*args):
+        raise ValueError("header of the result is changed")
+    monkeypatch.setattr(exe_json, "upsert_csv", fail)
+    with pytest.raises(ValueError):
+        run(root, upsert=True)
+    assert read_text(root/"r.csv")==before
+    assert not os.path.exists(str(root/"r.csv.new"))